@@ -3,7 +3,7 @@
 
 Parameter access: all keys are forced to lowercase
   - for parameters: config['site_name'], config['longitude'], etc...
-  - for stations:   config.stations[i] is a triplet: (call_sign, frequency, color)
+  - for stations:   config.stations[i] is a dictionary: call_sign, frequency, color, interpolation and channel
 
 Note: len(config.stations) == config['number_of_stations'] - sanity check -
 """
@@ -15,21 +15,35 @@ Note: len(config.stations) == config['number_of_stations'] - sanity check -
 #   - define CONSTANTS to ensure universal usage
 #   20150801:
 #   - add the [FTP] section
+#   20261018:
+#   - nfft, psd_window, psd_overlap, bin_interpolation and bin_span; optional 'interpolation' per station
+#   - [Capture] Channels; optional 'channel' per station
+#   - timer_overrun, runtime
+#   - breach_log, flare_gap, flare_confidence, flare_command
+#   - qdc_statistic, qdc_trim, qdc_bands, qdc_time_shift
 #
 from __future__ import print_function   # use the new Python 3 'print' function
 import os.path
+import sys
 try:
     import ConfigParser
 except ImportError:
     import configparser as ConfigParser
 
+from sidpsd import PSD_BACKENDS, WINDOWS, BinReader
+
 # constant for log_type  
 FILTERED, RAW = 'filtered', 'raw'
 # constant for station parameters
 CALL_SIGN, FREQUENCY, COLOR = 'call_sign', 'frequency', 'color'
+INTERPOLATION = 'interpolation'     # optional, default is 'bin_interpolation'
+CHANNEL = 'channel'                 # optional, default is 0 i.e. the first (left) channel
 # constant for log_format
 SID_FORMAT, SUPERSID_FORMAT = 'sid_format', 'supersid_format'
 SUPERSID_EXTENDED, BOTH, BOTH_EXTENDED = 'supersid_extended', 'both', 'both_extended' # with 5 decimals timestamp
+NATIVE_FORMAT = 'native_format' # binary, memory-mappable: the csv formats can be generated from it by sidfile.py
+# constant for qdc_statistic
+QDC_STATISTICS = ('mean', 'median', 'trimmed')
 
 # @s The config class utilizes the configparser library to parse contents of the config file
 
@@ -73,11 +87,25 @@ class Config(dict):
         sections = { 'PARAMETERS': ( # optional entries
                                     ('contact', str, None),             # email of the SuperSID owner
                                     ('hourly_save', str, "no"),         # new flag: yes/no to save every hours
+                                    ('memmap_buffer', str, "no"),       # yes/no: day buffer mapped on the native file in data_path
+                                    ('psd_average', str, "second"),     # second: PSD of the last second, interval: of the whole log_interval
+                                    ('psd_engine', str, "fft"),         # fft: full spectrum, targeted: monitored frequencies only (text viewer)
+                                    ('psd_backend', str, "numpy"),      # psd implementation: numpy, scipy, pyfftw, welch or mlab
+                                    ('nfft', int, 1024),                # samples per FFT segment: frequency resolution = audio_sampling_rate / nfft
+                                    ('psd_window', str, "hanning"),     # hanning, hamming, blackman or rectangular
+                                    ('psd_overlap', int, 0),            # samples shared by consecutive segments, in [0, nfft[
+                                    ('bin_interpolation', str, "none"), # none, nearest, parabolic or sum: reading of the stations' bins
+                                    ('bin_span', int, 1),               # parabolic, sum: bins searched/added on each side of the station's
                                     ('data_path', str, ""),             # new: to override DATA_PATH_NAME by user
-                                    ('log_format', str, SID_FORMAT),    # sid_format (default), supersid_format
+                                    ('log_format', str, SID_FORMAT),    # sid_format (default), supersid_format, native_format or a comma separated list
                                     ('mode', str, 'Standalone'),        # Server, Client, Standalone (default)
                                     ('viewer', str, 'wx'),              # text, wx, tk @s wx is now default
+                                    ('gui_max_fps', float, 1.0),        # wx, tk: maximum number of plot refreshes per second
+                                    ('timer_overrun', str, "skip"),     # skip or catchup: ticks missed by a reading longer than log_interval
+                                    ('runtime', str, "threads"),        # threads or asyncio (Python 3.5+): how the controller's tasks run
                                     ('bema_wing', int, 6),              # beta_wing for sidfile.filter_buffer()
+                                    ('cache_path', str, ""),            # cache of parsed files, default ~/.supersid_cache
+                                    ('cache_size', int, 500),           # maximum size of the cache in MB
                                     # mandatory entries
                                     ('site_name', str, None),
                                     ('longitude', str, None),
@@ -97,14 +125,24 @@ class Config(dict):
                                     ('data_path2', str, ""),
                                     ('qdc_n_days', int, 3),
                                     ('qdc_valid_days', int, 30),
+                                    ('qdc_statistic', str, "mean"),     # mean, median or trimmed (mean without qdc_trim of each end)
+                                    ('qdc_trim', float, 0.1),           # trimmed: part of the days' values taken off each end, in [0, 0.5[
+                                    ('qdc_bands', str, ""),             # percentiles of the days' values like 10,90, written with the QDC
+                                    ('qdc_time_shift', str, "no"),      # no, sunrise or sunset: days shifted on today's sunrise/sunset
                                     ('k_distance', float, None),        # k: k-distance from the standard deviation
                                     ('window',int, None),               # window: size of slice to analyze
                                     ('alpha', float, 1.0),              # alpha: apply exponential smoothing to signal
+                                    ('flare_gap', int, 12),             # quiet readings ending a flare event
+                                    ('flare_confidence', float, 0.5),   # minimum confidence of the events running flare_command
+                                    ('flare_command', str, ""),         # command run at the end of each flare event, see sidevents.py
+                                    ('breach_log', str, ""),            # SQLite log of the breach events: none (default), a file name, or 'yes' for <data_path><site_name>_breaches.sqlite
                                     ),
 
                       "Capture":   (("Audio", str, 'pyaudio'),          # soundcard: alsaaudio or pyaudio ; server
                                     ("Card", str, 'External'),          # alsaaudio: card name for capture
-                                    ("PeriodSize", int, 128)            # alsaaudio: period size for capture
+                                    ("PeriodSize", int, 128),           # alsaaudio: period size for capture
+                                    ("Continuous", str, 'no'),          # yes/no: capture thread filling a ring buffer
+                                    ("Channels", int, 1)                # number of channels captured, e.g. 2 antennas on a stereo card
                                     ),
 
                       "Linux":     (("Audio", str, 'pyaudio'),          # soundcard: alsaaudio or pyaudio ; server
@@ -171,6 +209,10 @@ class Config(dict):
 
                     # @s this procedure now fetches the call sign (NAA, NWC) given the station (section)
                     tmpDict[parameter] = config_parser.get(section, parameter)
+                # optional: how the station's signal strength is read from the spectrum, and of which channel
+                for parameter in (INTERPOLATION, CHANNEL):
+                    if config_parser.has_option(section, parameter):
+                        tmpDict[parameter] = config_parser.get(section, parameter)
 
                 self.stations.append(tmpDict)
             except ConfigParser.NoSectionError:
@@ -223,18 +265,26 @@ class Config(dict):
             self.config_err = "'hourly_save' must be either 'YES' or 'NO' in supersid.cfg. Please check."
             return
 
+        # 'memmap_buffer' must be UPPER CASE
+        self['memmap_buffer'] = self['memmap_buffer'].upper()
+        if self['memmap_buffer'] not in ('YES', 'NO'):
+            self.config_ok = False
+            self.config_err = "'memmap_buffer' must be either 'YES' or 'NO' in supersid.cfg. Please check."
+            return
+
         # log_interval should be > 2
         if self['log_interval'] <= 2:
             self.config_ok = False
             self.config_err = "'log_interval' <= 2. Too fast! Please increase."
             return
         
-        # check log_format
-        self['log_format'] = self['log_format'].lower()
-        if self['log_format'] not in (SID_FORMAT,SUPERSID_FORMAT, SUPERSID_EXTENDED, BOTH, BOTH_EXTENDED):
-            self.config_ok = False
-            self.config_err = "'log_format' must be either 'sid_format' or 'supersid_format'/'supersid_extended' or 'both'/'both_extended'."
-            return     
+        # check log_format: one format or a comma separated list of formats
+        self['log_format'] = self['log_format'].lower().replace(" ", "")
+        for log_format in self['log_format'].split(','):
+            if log_format not in (SID_FORMAT,SUPERSID_FORMAT, SUPERSID_EXTENDED, BOTH, BOTH_EXTENDED, NATIVE_FORMAT):
+                self.config_ok = False
+                self.config_err = "'log_format' must be either 'sid_format' or 'supersid_format'/'supersid_extended' or 'both'/'both_extended' or 'native_format'."
+                return
 
         # Check the 'data_path' validity and create it as a Config instance property
         self.data_path = os.path.normpath(self['data_path'] or Config.DATA_PATH_NAME) + os.sep
@@ -247,12 +297,145 @@ class Config(dict):
         if "Audio" not in self:
             self["Audio"] = "pyaudio"
 
+        # 'Continuous' must be UPPER CASE, default to 'NO' if not declared
+        self['Continuous'] = self.get('Continuous', 'no').upper()
+        if self['Continuous'] not in ('YES', 'NO'):
+            self.config_ok = False
+            self.config_err = "'Continuous' must be either 'YES' or 'NO' in supersid.cfg. Please check."
+            return
+
+        # 'psd_average' must be lower case, 'interval' needs all the audio i.e. the continuous capture
+        self['psd_average'] = self['psd_average'].lower()
+        if self['psd_average'] not in ('second', 'interval'):
+            self.config_ok = False
+            self.config_err = "'psd_average' must be either 'second' or 'interval' in supersid.cfg. Please check."
+            return
+        if self['psd_average'] == 'interval' and self['Continuous'] != 'YES':
+            self.config_ok = False
+            self.config_err = "'psd_average = interval' requires 'Continuous = yes' in the [Capture] section. Please check."
+            return
+
+        # 'psd_engine' must be lower case, the graphic viewers display the full spectrum anyway
+        self['psd_engine'] = self['psd_engine'].lower()
+        if self['psd_engine'] not in ('fft', 'targeted'):
+            self.config_ok = False
+            self.config_err = "'psd_engine' must be either 'fft' or 'targeted' in supersid.cfg. Please check."
+            return
+        if self['psd_engine'] == 'targeted' and self['viewer'] != 'text':
+            print("Warning: 'psd_engine = targeted' is for the text viewer, the full spectrum is calculated for", self['viewer'])
+            self['psd_engine'] = 'fft'
+
+        # 'psd_backend' must be one of the registered implementations
+        self['psd_backend'] = self['psd_backend'].lower()
+        if self['psd_backend'] not in PSD_BACKENDS:
+            self.config_ok = False
+            self.config_err = "'psd_backend' must be one of %s in supersid.cfg. Please check." % ", ".join(sorted(PSD_BACKENDS))
+            return
+
+        # 'nfft' and 'psd_overlap' in samples: at least one new sample per segment
+        if self['nfft'] < 2 or not 0 <= self['psd_overlap'] < self['nfft']:
+            self.config_ok = False
+            self.config_err = "'nfft' must be 2 or more and 'psd_overlap' in [0, nfft[ in supersid.cfg. Please check."
+            return
+
+        # 'psd_window' must be one of the known windows
+        self['psd_window'] = self['psd_window'].lower()
+        if self['psd_window'] not in WINDOWS:
+            self.config_ok = False
+            self.config_err = "'psd_window' must be one of %s in supersid.cfg. Please check." % ", ".join(sorted(WINDOWS))
+            return
+
+        # 'bin_interpolation' is the default of the stations' 'interpolation'
+        self['bin_interpolation'] = self['bin_interpolation'].lower()
+        for station in self.stations:
+            station[INTERPOLATION] = station.get(INTERPOLATION, self['bin_interpolation']).lower()
+            if station[INTERPOLATION] not in BinReader.METHODS:
+                self.config_ok = False
+                self.config_err = "'%s' of %s must be one of %s in supersid.cfg. Please check." \
+                                  % (INTERPOLATION, station[CALL_SIGN], ", ".join(BinReader.METHODS))
+                return
+        # each station is read on one of the captured channels, default to 1 channel if not declared
+        self['Channels'] = self.get('Channels', 1)
+        if self['Channels'] < 1:
+            self.config_ok = False
+            self.config_err = "'Channels' must be 1 or more in supersid.cfg. Please check."
+            return
+        for station in self.stations:
+            try:
+                station[CHANNEL] = int(station.get(CHANNEL, 0))
+            except ValueError:
+                station[CHANNEL] = -1
+            if not 0 <= station[CHANNEL] < self['Channels']:
+                self.config_ok = False
+                self.config_err = "'%s' of %s must be in [0, %d[ ('Channels' in [Capture]) in supersid.cfg. Please check." \
+                                  % (CHANNEL, station[CALL_SIGN], self['Channels'])
+                return
+        if self['bin_span'] < 0:
+            self.config_ok = False
+            self.config_err = "'bin_span' must be 0 or more in supersid.cfg. Please check."
+            return
+
+        # 'timer_overrun' must be lower case
+        self['timer_overrun'] = self['timer_overrun'].lower()
+        if self['timer_overrun'] not in ('skip', 'catchup'):
+            self.config_ok = False
+            self.config_err = "'timer_overrun' must be either 'skip' or 'catchup' in supersid.cfg. Please check."
+            return
+
+        # 'runtime' must be lower case, asyncio needs Python 3.5 or later
+        self['runtime'] = self['runtime'].lower()
+        if self['runtime'] not in ('threads', 'asyncio'):
+            self.config_ok = False
+            self.config_err = "'runtime' must be either 'threads' or 'asyncio' in supersid.cfg. Please check."
+            return
+        if self['runtime'] == 'asyncio' and sys.version_info < (3, 5):
+            self.config_ok = False
+            self.config_err = "'runtime = asyncio' requires Python 3.5 or later. Please check."
+            return
+
+        # QDC statistic, trim, bands as a list of percentiles, time shift
+        if 'qdc_statistic' in self:
+            self['qdc_statistic'] = self['qdc_statistic'].lower()
+            if self['qdc_statistic'] not in QDC_STATISTICS:
+                self.config_ok = False
+                self.config_err = "'qdc_statistic' must be one of %s in supersid.cfg. Please check." % ", ".join(QDC_STATISTICS)
+                return
+            if not 0 <= self['qdc_trim'] < 0.5:
+                self.config_ok = False
+                self.config_err = "'qdc_trim' must be in [0, 0.5[ in supersid.cfg. Please check."
+                return
+            try:
+                self['qdc_bands'] = [float(q) for q in self['qdc_bands'].split(",") if q.strip()]
+            except ValueError:
+                self['qdc_bands'] = [-1.0]
+            if any(not 0 <= q <= 100 for q in self['qdc_bands']):
+                self.config_ok = False
+                self.config_err = "'qdc_bands' must be a list of percentiles like 10,90 in supersid.cfg. Please check."
+                return
+            self['qdc_time_shift'] = self['qdc_time_shift'].lower()
+            if self['qdc_time_shift'] not in ('no', 'sunrise', 'sunset'):
+                self.config_ok = False
+                self.config_err = "'qdc_time_shift' must be 'no', 'sunrise' or 'sunset' in supersid.cfg. Please check."
+                return
+            if self['qdc_time_shift'] != 'no':
+                try:
+                    float(self['latitude']), float(self['longitude'])
+                except ValueError:
+                    self.config_ok = False
+                    self.config_err = "'qdc_time_shift' requires 'latitude' and 'longitude' in decimal form. Please check."
+                    return
+
+        # 'flare_gap' cannot be negative
+        if self.get('flare_gap', 12) < 0:
+            self.config_ok = False
+            self.config_err = "'flare_gap' must be 0 or more in supersid.cfg. Please check."
+            return
+
         # Just one choice: 'plot_offset = 0', for now ; not in the expected parameters list
         self['plot_offset'] = 0
 
 
 if __name__ == '__main__':
-    import sys
     # one argument: the .cfg file to read
     cfg = Config(sys.argv[1])
     cfg.supersid_check()
@@ -54,8 +54,12 @@ if __name__ == '__main__':
     # file list
     if args.askYesterday:
         yesterday = datetime.utcnow() - timedelta(days=1)
-        file_list.append("{}{}{}_{}-{:02d}-{:02d}.csv".format(cfg['data_path'], path.sep, cfg['site_name'],
-                                                       yesterday.year,yesterday.month,yesterday.day))
+        yesterday_file = "{}{}{}_{}-{:02d}-{:02d}.csv".format(cfg['data_path'], path.sep, cfg['site_name'],
+                                                       yesterday.year,yesterday.month,yesterday.day)
+        # only the native binary file might have been recorded: the csv file is generated from it
+        if not path.isfile(yesterday_file) and path.isfile(yesterday_file[:-4] + SidFile._NATIVE_EXTENSION):
+            yesterday_file = yesterday_file[:-4] + SidFile._NATIVE_EXTENSION
+        file_list.append(yesterday_file)
     # generate all the SID files ready to send in the local_tmp file
     files_to_send = []
     for input_file in file_list:
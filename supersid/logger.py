@@ -9,27 +9,66 @@
 #   - fix 'raw_input' to ensure code works on both Python 2 and 3
 #   20150801:
 #   - truncate sid_params['utc_starttime'] to 19 first chars
+#   20261018:
+#   - SaveWorker: files written by a background thread ; 'saver' can be given, e.g. by the asyncio runtime
 from __future__ import print_function   # use the new Python 3 'print' function
 from os import path
+import threading
 try:
     input = raw_input  # this is Python 2 raw_input now to be used like input in Python 3
 except NameError:
     pass    # already Python 3
+try:
+    import Queue as queue   # Python 2
+except ImportError:
+    import queue
 from time import gmtime, strftime
 
 from sidfile import SidFile
 from config import FILTERED, RAW, CALL_SIGN, FREQUENCY, SID_FORMAT, SUPERSID_FORMAT
 
+class SaveWorker(threading.Thread):
+    """
+    Background thread performing the slow tasks (file writing, filtering, QDC reading...) one after the other
+    in the order they were submitted, so that the sampling thread never waits for the disk.
+    """
+    def __init__(self):
+        threading.Thread.__init__(self, name="SaveWorker")
+        self.daemon = True
+        self.jobs = queue.Queue()
+        self.start()
+
+    def submit(self, job, *args, **kwargs):
+        """Queue the call job(*args, **kwargs) and return at once"""
+        self.jobs.put((job, args, kwargs))
+
+    def run(self):
+        while True:
+            job, args, kwargs = self.jobs.get()
+            if job is None:
+                break
+            try:
+                job(*args, **kwargs)
+            except Exception as err:
+                print("\nError in background task", getattr(job, '__name__', job), ":", err)
+
+    def stop(self):
+        """Perform the pending jobs then end the thread"""
+        self.jobs.put((None, (), {}))
+        self.join()
+
+
 class Logger():
     """
     Open the file with its in memory buffer to record the future signal readings.
     Write the file to disk upon controller's request: user choice or timing
     """
-    def __init__(self, controller, read_file=None):
+    def __init__(self, controller, read_file=None, saver=None):
         """
         Create a Logger based on parameters found in the .cfg file as found in controller.config
         :param controller: (as in MVC model) instance of the supersid.SuperSID class
         :param read_file: optional file to read in memory at launch if given by user on the command line
+        :param saver: optional object with SaveWorker's submit/stop to perform the writing, default a new SaveWorker
         :return: nothing but self
         """
         self.version = "1.4 20150801"
@@ -52,6 +91,7 @@ class Logger():
             print("Error: no station to log???")
             exit(5)
         self.sid_file = SidFile(sid_params = self.config)
+        self.saver = saver or SaveWorker()
 
         # Do we have a file to read? i.e. file path given on the command line by the user at launch
         if read_file:
@@ -77,19 +117,42 @@ class Logger():
             self.sid_file.copy_data(sid_file2)
             print("Continue recording with data from file", read_file, "included.")
 
-    def log_sid_format(self, stations,  filename='', log_type=FILTERED, extended = False):
-        """ One file per station. By default, buffered data is filtered."""
+        # Memory-mapped day buffer: today's native file is resumed if it exists (unless a file was read)
+        if self.config['memmap_buffer'] == 'YES':
+            self.sid_file.map_native_buffer(self.config.data_path + self.sid_file.get_native_filename(),
+                                            keep_data = bool(read_file))
+
+    def log_sid_format(self, stations,  filename='', log_type=FILTERED, extended = False, sid_file = None):
+        """ One file per station. By default, buffered data is filtered.
+        'sid_file' (default self.sid_file) can be a snapshot of the buffers given by SidFile.snapshot/swap_buffer"""
+        sid_file = sid_file or self.sid_file
         filenames = []
         for station in stations:       
-            my_filename = self.config.data_path + (filename or self.sid_file.get_sid_filename(station['call_sign']))
+            my_filename = self.config.data_path + (filename or sid_file.get_sid_filename(station['call_sign']))
             filenames.append(my_filename)
-            self.sid_file.write_data_sid(station, my_filename, log_type, extended=extended, bema_wing=self.config["bema_wing"])
+            sid_file.write_data_sid(station, my_filename, log_type, extended=extended, bema_wing=self.config["bema_wing"])
         return filenames
     
-    def log_supersid_format(self, stations, filename='', log_type=FILTERED, extended = False):
+    def log_supersid_format(self, stations, filename='', log_type=FILTERED, extended = False, sid_file = None):
         """Cascade all buffers in one file."""
+        sid_file = sid_file or self.sid_file
         my_filename = filename if filename and path.isabs(filename) \
-                      else self.config.data_path + (filename or self.sid_file.get_supersid_filename())
-        self.sid_file.write_data_supersid(my_filename, log_type, extended=extended, bema_wing=self.config["bema_wing"])
+                      else self.config.data_path + (filename or sid_file.get_supersid_filename())
+        sid_file.write_data_supersid(my_filename, log_type, extended=extended, bema_wing=self.config["bema_wing"])
         return [my_filename]
+
+    def log_native_format(self, filename='', sid_file = None):
+        """Write all raw buffers with their timestamps in one binary file. Csv files can be generated from it later."""
+        sid_file = sid_file or self.sid_file
+        my_filename = filename if filename and path.isabs(filename) \
+                      else self.config.data_path + (filename or sid_file.get_native_filename())
+        if my_filename == sid_file.native_filename:
+            sid_file.flush()   # the day buffer is mapped on this very file
+        else:
+            sid_file.write_data_native(my_filename, RAW, extended=True)
+        return [my_filename]
+
+    def close(self):
+        """Wait for the files being written in the background"""
+        self.saver.stop()
     
@@ -0,0 +1,92 @@
+"""
+PsdPlotter draws the spectrum calculated by the controller on a matplotlib Axes, for the graphic viewers.
+
+The controller's thread only hands the arrays over with update(): no matplotlib call out of the GUI thread.
+The GUI thread calls refresh() periodically: at most 'max_fps' times per second, the existing Line2D
+receives the new data and is blitted over the saved background (axes, grid, labels) instead of
+calculating and re-drawing the whole figure as axes.psd() did at each reading.
+With a multi-channel capture, Pxx has one row per channel: one line is drawn for each.
+"""
+# created on 20261018
+from __future__ import print_function
+import time
+import numpy
+from matplotlib.lines import Line2D
+
+# one color per channel. The lines are added with axes.add_line(): axes.plot() would clear the axes with hold(False)
+COLORS = 'bgrcmyk'
+
+
+class PsdPlotter(object):
+    def __init__(self, canvas, axes, max_fps=1.0, ylim=None):
+        self.canvas = canvas
+        self.axes = axes
+        self.min_period = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.fixed_ylim = ylim is not None
+        # same presentation as axes.psd(), the lines are 'animated' i.e. not part of the background
+        self.lines = [self.add_line(0)]
+        axes.grid(True)
+        axes.set_xlabel('Frequency')
+        axes.set_ylabel('Power Spectral Density (dB/Hz)')
+        if ylim is not None:
+            axes.set_ylim(ylim)
+        self.background = None
+        self.new_data = None
+        self.last_refresh = 0.0
+        canvas.mpl_connect('draw_event', self.on_draw)
+
+    def add_line(self, channel):
+        """Return a new empty line for the channel's spectrum, added to the axes without clearing them"""
+        return self.axes.add_line(Line2D([], [], color=COLORS[channel % len(COLORS)], animated=True))
+
+    def update(self, Pxx, freqs):
+        """Called by the controller's thread: keep the latest spectrum for the next refresh"""
+        self.new_data = (Pxx, freqs)
+
+    def on_draw(self, event):
+        """After a full draw of the figure: save the new background and draw the lines over it"""
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        for line in self.lines:
+            self.axes.draw_artist(line)
+
+    def refresh(self):
+        """Called by the GUI thread: draw the latest spectrum if any and if the frame rate allows it.
+        Return True if the plot was updated."""
+        now = time.time()
+        if self.new_data is None or now - self.last_refresh < self.min_period:
+            return False
+        (Pxx, freqs), self.new_data = self.new_data, None
+        self.last_refresh = now
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            Pxx_dB = 10 * numpy.log10(Pxx)
+        rows = numpy.atleast_2d(Pxx_dB)
+        new_lines = len(rows) != len(self.lines)
+        if new_lines:   # number of channels changed: one line per channel
+            for line in self.lines:
+                line.remove()
+            self.lines = [self.add_line(channel) for channel in range(len(rows))]
+        for line, row in zip(self.lines, rows):
+            line.set_data(freqs, row)
+        rescaled = self.rescale(freqs, Pxx_dB)
+        if self.background is None or rescaled or new_lines:
+            self.canvas.draw()  # new background: on_draw draws the lines
+        else:
+            self.canvas.restore_region(self.background)
+            for line in self.lines:
+                self.axes.draw_artist(line)
+            self.canvas.blit(self.axes.bbox)
+        return True
+
+    def rescale(self, freqs, Pxx_dB):
+        """Adapt the axes' limits to the data if needed. Return True if they changed."""
+        changed = False
+        if len(freqs) and tuple(self.axes.get_xlim()) != (freqs[0], freqs[-1]):
+            self.axes.set_xlim(freqs[0], freqs[-1])
+            changed = True
+        finite = Pxx_dB[numpy.isfinite(Pxx_dB)]
+        if not self.fixed_ylim and len(finite):
+            ymin, ymax = self.axes.get_ylim()
+            if finite.min() < ymin or finite.max() > ymax:
+                self.axes.set_ylim(numpy.floor(finite.min() / 10) * 10 - 5, numpy.ceil(finite.max() / 10) * 10 + 5)
+                changed = True
+        return changed
@@ -4,6 +4,9 @@ Read files, Get signal strength values, Create qdc file, Average strength values
 
 SML
 20181213
+20261018: rolling window of days updated at each midnight (running sums for the mean)
+          median, trimmed mean and percentile bands in one pass over the stacked days (qdc_statistics),
+          optional shift of each day on today's sunrise or sunset, bands written by write_qdc
 """
 from __future__ import print_function   # use the new Python 3 'print' function
 from os import path
@@ -16,22 +19,87 @@ from datetime import datetime, timedelta
 import numpy
 import sys
 import itertools
+from collections import OrderedDict
+
+from sidfile import SidFile
+from sidcache import SidCache
+from config import FILTERED
+
+
+def qdc_statistics(days, statistic='mean', trim=0.1, percentiles=()):
+    """ Statistic of each station and time index over 'days' (days x stations x samples, NaN meaning no reading)
+        and the given percentiles of the days' values, all from one sort of the days axis.
+        - mean, median or trimmed: mean of the values left once 'trim' of them are taken off each end
+        - percentiles: as numpy.nanpercentile (linear interpolation), shaped (percentiles x stations x samples)
+        Returns (curve, bands), bands being None without percentiles """
+    ordered = numpy.sort(numpy.asarray(days, dtype=float), axis=0)     # NaN last
+    count = (~numpy.isnan(ordered)).sum(axis=0)
+    # sums of the first i values of each index: sums[i]
+    sums = numpy.zeros((ordered.shape[0] + 1,) + ordered.shape[1:])
+    numpy.cumsum(numpy.nan_to_num(ordered), axis=0, out=sums[1:])
+
+    def take(array, index):
+        return numpy.take_along_axis(array, index[numpy.newaxis], axis=0)[0]
+
+    def percentile(q):
+        position = (numpy.maximum(count, 1) - 1) * (q / 100.0)
+        below = numpy.floor(position).astype(int)
+        above = numpy.ceil(position).astype(int)
+        low = take(ordered, below)
+        return low + (take(ordered, above) - low) * (position - below)
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        if statistic == 'median':
+            curve = percentile(50.0)
+        else:
+            cut = numpy.floor(trim * count).astype(int) if statistic == 'trimmed' else numpy.zeros_like(count)
+            curve = (take(sums, count - cut) - take(sums, cut)) / (count - 2 * cut)
+        bands = numpy.array([percentile(q) for q in percentiles]) if len(percentiles) else None
+    curve[count == 0] = numpy.nan
+    if bands is not None:
+        bands[:, count == 0] = numpy.nan
+    return curve, bands
+
+
+def sun_times(days, latitude, longitude):
+    """ UTC sunrise and sunset, in seconds from midnight, of the days 'YYYY-MM-DD' at this place
+        (NOAA approximation, about one minute). Sun always up or down: the limit of the formula """
+    day_of_year = numpy.array([datetime.strptime(day, '%Y-%m-%d').timetuple().tm_yday for day in days], dtype=float)
+    gamma = 2 * numpy.pi / 365.0 * (day_of_year - 1)
+    eqtime = 229.18 * (0.000075 + 0.001868 * numpy.cos(gamma) - 0.032077 * numpy.sin(gamma)
+                       - 0.014615 * numpy.cos(2 * gamma) - 0.040849 * numpy.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * numpy.cos(gamma) + 0.070257 * numpy.sin(gamma) - 0.006758 * numpy.cos(2 * gamma)
+            + 0.000907 * numpy.sin(2 * gamma) - 0.002697 * numpy.cos(3 * gamma) + 0.00148 * numpy.sin(3 * gamma))
+    lat = numpy.radians(latitude)
+    cos_ha = numpy.cos(numpy.radians(90.833)) / (numpy.cos(lat) * numpy.cos(decl)) - numpy.tan(lat) * numpy.tan(decl)
+    ha = numpy.degrees(numpy.arccos(numpy.clip(cos_ha, -1.0, 1.0)))
+    sunrise = 720 - 4 * (longitude + ha) - eqtime
+    sunset = 720 - 4 * (longitude - ha) - eqtime
+    return sunrise * 60, sunset * 60
+
 
 class Qdc():
     def __init__(self, controller, read_file=None):
         self.controller = controller
-        self.version = "SML 1.0 20181213"
+        self.version = "SML 1.1 20261018"
         self.config = controller.config
         self.sid_params = self.controller.logger.sid_file.sid_params
         
         self.control_header()
         self.is_ok = False
+        self.cache = SidCache(config = self.config)  # files read for the QDC are parsed only once
         self.timestamp_format = '%Y-%m-%d'
 
 
         self.qdays = []
         self.yesterday = []
         self.qdcData = []
+        self.qdcBands = None    # percentiles x stations x samples if qdc_bands
+
+        # rolling QDC: the days in the window and their running sums/counts of valid (non zero) values per index
+        self.days = OrderedDict()
+        self._sum = None
+        self._count = None
 
         self.load_files()
         
@@ -48,6 +116,11 @@ class Qdc():
         if 'data_path2' in self.config:
             self.data_path2 = self.config['data_path2']
 
+        self._statistic = self.config.get('qdc_statistic', 'mean')
+        self._trim = self.config.get('qdc_trim', 0.1)
+        self._bands = self.config.get('qdc_bands', [])
+        self._time_shift = self.config.get('qdc_time_shift', 'no')
+
     def load_pickedfiles(self, filelist):
         """ Calculates QDC from given file list """
         params = self.controller.logger.sid_file.sid_params
@@ -56,20 +129,17 @@ class Qdc():
         inDays = []    
 
         for fstr in filelist:
-            try: 
-                with open(fstr, "rt") as fin:
-                    lines = fin.readlines()
-                    if not self.is_ok_station(fstr,lines):
-                        continue                       
-                    inDays.append(self.parse_utcstart(lines))
-
-            except IOError:
+            if not path.isfile(fstr):
                 print ("- Could not compute qdc")
                 inData = None
                 self.is_ok = False
                 return 
+            sid = self.cache.load(fstr)
+            if not self.is_ok_station(fstr,sid):
+                continue                       
+            inDays.append(sid.sid_params['utc_starttime'][:10])
 
-            nlines = numpy.loadtxt(lines, dtype=float, comments='#', delimiter=",").transpose()
+            nlines = numpy.array(sid.data)
             inData.append(nlines)
             inData[qdc_index][inData[qdc_index] == 0.0] = numpy.nan
             qdc_index += 1
@@ -80,83 +150,97 @@ class Qdc():
                     self.yesterday = nlines
            
         self.qdays = inDays
-        self.get_avg(inData)        
+        self.get_avg(inData, inDays)
 
     def load_files(self):
-        """ Reads next available sidfile """
+        """ Reads the last available sidfiles to fill the rolling QDC window, done once at start """
         params = self.controller.logger.sid_file.sid_params
         delta_day = 0
-        qdc_index = 0
-        inData = []
         inDays = []
 
-        while qdc_index < self._ndays:
+        while len(inDays) < self._ndays:
             delta_day += 1
+            if delta_day > self._valid_days:
+                print ("- Could not compute for qdc: expects {0} supersid files not older than {1} days".format(self._ndays,self._valid_days))
+                break
             d = datetime.utcnow() - timedelta(days=delta_day)
             fstr = params.data_path + params['site_name'] + '{:_%Y-%m-%d.csv}'.format(d)
-            try: 
-                with open(fstr, "rt") as fin:                    
-                    lines = fin.readlines()                
-                    if not self.is_ok_station(fstr,lines):
-                        continue                       
-                    inDays.append('{:%Y-%m-%d}'.format(d)) # or utcstart
-            except IOError:                
-                #print ("Skip:", fstr)                
-                if delta_day > self._valid_days:
-                    print ("- Could not compute for qdc: expects {0} supersid files not older than {1} days".format(self._ndays,self._valid_days))
-                    inData = None
-                    self.is_ok = False
-                    return
-                else:
-                    continue            
-
-            nlines = numpy.loadtxt(lines, dtype=float, comments='#', delimiter=",").transpose()
-            inData.append(nlines)
-            inData[qdc_index][inData[qdc_index] == 0.0] = numpy.nan            
-            qdc_index += 1
+            if not path.isfile(fstr):
+                # station recording with log_format = native_format
+                fstr = fstr[:-4] + SidFile._NATIVE_EXTENSION
+                if not path.isfile(fstr):
+                    continue
+            sid = self.cache.load(fstr)
+            if not self.is_ok_station(fstr,sid):
+                continue
+            nlines = numpy.array(sid.data)
+            inDays.append(('{:%Y-%m-%d}'.format(d), nlines))
 
-            if len(self.yesterday) == 0:
-                dte = datetime.utcnow() - timedelta(days=1)
-                if dte.strftime(self.timestamp_format) == inDays[-1]:
-                    self.yesterday = nlines
-         
-        self.qdays = inDays
-        self.get_avg(inData)
+            if len(self.yesterday) == 0 and delta_day == 1:
+                self.yesterday = nlines
 
-    def parse_utcstart(self,lines):
-        """ Fetches the UTC startime from lines """
+        # oldest day first as if they were added one by one at each midnight
+        self.days.clear()
+        self._sum, self._count = None, None
+        for day, nlines in reversed(inDays):
+            self.add_day(day, nlines)
 
-        #temp_d = lines[9]
-        for i in range(30):
-            if lines[i].startswith('# UTC_StartTime ='):
-                temp_d = lines[i]
-                break
+    def add_sidfile(self, sid_file):
+        """ Adds the day just finished (as given by SidFile.swap_buffer) to the QDC without reading any file.
+            Data are filtered like the saved files if log_type is 'filtered' """
+        data = sid_file.data
+        if self.config['log_type'] == FILTERED:
+            data = SidFile.filter_buffer(data, sid_file.LogInterval, bema_wing = self.config['bema_wing'])
+        self.yesterday = numpy.array(data)
+        self.add_day(sid_file.sid_params['utc_starttime'][:10], data)
+
+    def add_day(self, day, data):
+        """ Adds one day (stations x samples array, 0.0 meaning no reading) to the rolling QDC window:
+            evicts the oldest day(s) beyond qdc_n_days or older than qdc_valid_days then updates the mean
+            with the running sums i.e. O(one day) whatever the window size """
+        data = numpy.array(data, dtype=float)
+        data[data == 0.0] = numpy.nan
+        valid = ~numpy.isnan(data)
+        if self._sum is None or self._sum.shape != data.shape:
+            self.days.clear()
+            self._sum, self._count = numpy.zeros(data.shape), numpy.zeros(data.shape, dtype=int)
+        if day in self.days:
+            self._remove_day(day)
+        self.days[day] = data
+        self._sum[valid] += data[valid]
+        self._count += valid
 
-        temp_d = temp_d.split('=',1)[-1]
-        temp_d = temp_d.split(' ',1)[-1]
-        temp_d = temp_d.split(' ',1)[0]
-        return temp_d
+        oldest_valid = (self.strtoDate(day) - timedelta(days=self._valid_days)).strftime(self.timestamp_format)
+        while len(self.days) > self._ndays or next(iter(self.days)) < oldest_valid:
+            self._remove_day(next(iter(self.days)))
+
+        self.qdays = list(self.days.keys())
+        if self._statistic == 'mean' and not self._bands and self._time_shift == 'no':
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                self.qdcData = self._sum / self._count
+        else:   # the whole window again: its days are shifted on the new day's sunrise/sunset
+            self.compute(list(self.days.values()), self.qdays)
+        self.is_ok = len(self.days) == self._ndays
+        print("- QDC updated with", day, "" if self.is_ok else "(%d/%d days)" % (len(self.days), self._ndays))
+
+    def _remove_day(self, day):
+        """ Takes one day out of the rolling QDC window """
+        data = self.days.pop(day)
+        valid = ~numpy.isnan(data)
+        self._sum[valid] -= data[valid]
+        self._count -= valid
+        self._sum[self._count == 0] = 0.0  # no rounding residue left where no day has a value
 
     def strtoDate(self,str):
         dte = datetime.strptime(str, self.timestamp_format)
         return dte
 
-    def is_ok_station(self,fstr,lines):
+    def is_ok_station(self,fstr,sid):
         """ Checks if read in sidfiles are valid """
 
         sys.stdout.write ("Reading {0}".format(fstr),)
-        #temp_station = lines[13]
-        for i in range(30):
-            if lines[i].startswith('# Stations ='):
-                temp_station = lines[i]
-                break
-
-        if temp_station:
-            temp_station = temp_station.replace(" ", "")
-            temp_station = temp_station.replace("\n", "")
-            temp_station = temp_station.split('=',1)[-1]
-            #temp_station = temp_station.split(',')
-            if temp_station != self.controller.config['stations']:
+        if sid.isSuperSID:
+            if ",".join([s.strip() for s in sid.stations]) != self.controller.config['stations']:
                 sys.stdout.write ("\t[BAD] inconsistent stations\n")
                 return False         
             else:
@@ -166,13 +250,32 @@ class Qdc():
             sys.stdout.write ("[\tBAD] No Station list\n")
             return False
 
-    def get_avg(self,inData):
-        """ Calculates the nanmean of read supersid file data """
-        self.qdcData = []
-        self.qdcData = numpy.nanmean(inData, axis=0)        
+    def get_avg(self, inData, inDays=None):
+        """ Calculates the QDC of read supersid file data """
+        self.compute(inData, inDays)
         self.is_ok = True
         print("- QDC Loaded")    
 
+    def compute(self, inData, inDays=None):
+        """ QDC statistic and bands of the given days' data (NaN meaning no reading), shifted if requested """
+        stack = numpy.array(inData, dtype=float)
+        if self._time_shift != 'no' and inDays:
+            stack = self.shift_days(stack, inDays)
+        self.qdcData, self.qdcBands = qdc_statistics(stack, self._statistic, self._trim, self._bands)
+
+    def shift_days(self, stack, inDays):
+        """ Shift each day (days x stations x samples) by the change of sunrise or sunset from this day to today,
+            e.g. a day with an earlier sunrise is delayed: the dawn of all the days fall on the same index """
+        today = self.sid_params['utc_starttime'][:10]
+        times = sun_times(list(inDays) + [today], float(self.config['latitude']), float(self.config['longitude']))
+        times = times[0] if self._time_shift == 'sunrise' else times[1]
+        shifts = numpy.round((times[-1] - times[:-1]) / self.controller.logger.sid_file.LogInterval).astype(int)
+        source = numpy.arange(stack.shape[-1])[numpy.newaxis, :] - shifts[:, numpy.newaxis]   # days x samples
+        outside = (source < 0) | (source >= stack.shape[-1])
+        shifted = numpy.take_along_axis(stack, numpy.clip(source, 0, stack.shape[-1] - 1)[:, numpy.newaxis, :], axis=2)
+        shifted[numpy.broadcast_to(outside[:, numpy.newaxis, :], shifted.shape)] = numpy.nan
+        return shifted
+
 
     def write_qdc(self,filename):
         """ Writes computed QDC to disk """
@@ -181,10 +284,17 @@ class Qdc():
             sys.stdout.write("Saving  %s" % filename,)
             with open(filename,'wt') as fout:
                 print(self.controller.logger.sid_file.create_header(True,'filtered'),file=fout,end="")
-                print('# Days Averaged = ' + ','.join(self.qdays), file=fout, end="")
-                for row in numpy.transpose(self.qdcData):
-                    floats_as_strings = ["%.15f" % x for x in row]
-                    print(", ".join(floats_as_strings), file=fout)
+                print('# Days Averaged = ' + ','.join(self.qdays), file=fout)
+                print('# Statistic = ' + self._statistic + ("" if self._time_shift == 'no' else
+                                                            ", shifted on " + self._time_shift), file=fout)
+                rows = numpy.atleast_2d(self.qdcData)
+                if self.qdcBands is not None:
+                    # after the QDC of each station, its bands station_pNN station by station
+                    stations = self.controller.logger.sid_file.stations
+                    print('# Bands = ' + ','.join('%s_p%g' % (station, q) for station in stations for q in self._bands),
+                          file=fout)
+                    rows = numpy.concatenate((rows, self.qdcBands.transpose(1, 0, 2).reshape(-1, rows.shape[-1])))
+                SidFile.write_rows(fout, rows)
 
                 sys.stdout.write("\t[OK]")
                 return True
@@ -203,8 +313,9 @@ class Qdc():
                 hdr += "# Current_Index = %s\n" % self.controller.timer.data_index
                 hdr += "# scaling_factor = %s\n" % self.config['scaling_factor']
                 print(hdr, file=fout, end="")
-                for i in range(len(ss)):
-                    print('{0:.2f}, {1:.15f}'.format(fq[i],ss[i]),file=fout)
+                # one column per captured channel
+                for frequency, densities in zip(fq, numpy.atleast_2d(ss).T):
+                    print('{0:.2f}, '.format(frequency) + ', '.join('{0:.15f}'.format(x) for x in densities), file=fout)
             return filename
         except IOError:
             return False
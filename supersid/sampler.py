@@ -14,14 +14,129 @@
      
     All these 'devices' must implement:
      - __init__: open the 'device' for future capture
-     - capture_1sec: obtain one second of sound and return as an array of 'audio_sampling_rate' integers
+     - capture_1sec: obtain one second of sound and return as an array of 'audio_sampling_rate' integers,
+                     or a (channels, audio_sampling_rate) array when more than one channel is captured
      - close: close the 'device'
 """
 # 20150801:
 #   - modify the __main__ to help debugging the soundcard
+# 20261018:
+#   - zero-copy capture: each device reads into its preallocated buffer, samples exposed by numpy.frombuffer
+#   - sounddevice: blocking record of the whole second (was returning only the first frame)
+#   - continuous capture: a thread or the audio callback fills a RingBuffer, capture_1sec returns the last second at once
+#   - capture_interval: all the samples captured since the previous reading, for the PSD averaged over the log interval
+#   - set_monitored_frequencies: BinReader precalculates the bins of each station for its interpolation method
+#   - multi-channel capture ([Capture] Channels): one device read returns all the channels, one row each
 from __future__ import print_function   # use the new Python 3 'print' function
-from struct import unpack as st_unpack
-from numpy import array
+import threading
+import time
+from numpy import frombuffer, empty, zeros, concatenate, int16
+
+from sidpsd import BinReader
+
+
+def deinterleave(samples, channels):
+    """Return the interleaved frames of 'samples' as a (channels, samples) view, unchanged for one channel"""
+    return samples if channels == 1 else samples.reshape(-1, channels).T
+
+
+def read_periods_into(buffer, read):
+    """Fill the bytearray 'buffer' with the data returned by successive read() calls, alsaaudio style:
+    read() returns (length, data) with length <= 0 when no data is available. Extra bytes of the last read are dropped."""
+    view, pos = memoryview(buffer), 0
+    while pos < len(buffer):
+        length, data = read()
+        if length > 0:
+            nbytes = min(len(data), len(buffer) - pos)
+            view[pos:pos + nbytes] = memoryview(data)[:nbytes]
+            pos += nbytes
+    return buffer
+
+
+def read_frames_into(buffer, read, frames_per_read):
+    """Fill the bytearray 'buffer' of 16 bits samples with the data returned by successive read(nb_frames) calls,
+    pyaudio style: read() returns the bytes of nb_frames samples or raises IOError (e.g. overflow) to be retried."""
+    view, pos = memoryview(buffer), 0
+    while pos < len(buffer):
+        try:
+            data = read(min(frames_per_read, (len(buffer) - pos) // 2))
+        except IOError:
+            continue
+        view[pos:pos + len(data)] = data
+        pos += len(data)
+    return buffer
+
+class RingBuffer(object):
+    """Circular buffer of the last 'capacity' samples, for one producer and one consumer without lock:
+    the producer (capture thread or audio callback) copies the new samples then only advances 'written',
+    the consumer reads the samples before 'written'. Safe as long as the consumer does not ask for samples
+    about to be overwritten i.e. the capacity exceeds what is read by more than one block of capture.
+    With more than one channel, samples are (channels, samples) arrays and 'written' counts the frames.
+    """
+    def __init__(self, capacity, channels = 1):
+        self.capacity = capacity
+        self.buffer = zeros((channels, capacity) if channels > 1 else capacity, dtype=int16)
+        self.written = 0    # number of samples written since the creation
+
+    def write(self, samples):
+        """Producer side: append the samples (only the last 'capacity' ones are kept)"""
+        total = samples.shape[-1]
+        samples = samples[..., -self.capacity:]
+        length = samples.shape[-1]
+        start = (self.written + total - length) % self.capacity
+        first = min(length, self.capacity - start)
+        self.buffer[..., start:start + first] = samples[..., :first]
+        self.buffer[..., :length - first] = samples[..., first:]
+        self.written += total
+
+    def read(self, start, stop):
+        """Consumer side: return a copy of the samples written in [start, stop[ still present in the buffer"""
+        start = max(start, stop - self.capacity, 0)
+        if stop <= start:
+            return self.buffer[..., :0].copy()
+        i, j = start % self.capacity, stop % self.capacity
+        if i < j:
+            return self.buffer[..., i:j].copy()
+        return concatenate((self.buffer[..., i:], self.buffer[..., :j]), axis=-1)
+
+    def latest(self, count):
+        """Consumer side: return a copy of the last 'count' samples written"""
+        stop = self.written
+        return self.read(stop - count, stop)
+
+    def wait_for(self, count, timeout):
+        """Wait until at least 'count' samples were written (only at start of the capture)"""
+        deadline = time.time() + timeout
+        while self.written < count and time.time() < deadline:
+            time.sleep(0.01)
+        return self.written >= count
+
+
+class CaptureThread(threading.Thread):
+    """Read the capture device without interruption, block after block, into a RingBuffer"""
+    def __init__(self, read_chunk, ring):
+        threading.Thread.__init__(self, name="SuperSID capture")
+        self.daemon = True  # a device blocked in a read must not prevent the application to exit
+        self.read_chunk = read_chunk
+        self.ring = ring
+        self.running = True
+        self.error = None
+
+    def run(self):
+        while self.running:
+            try:
+                samples = self.read_chunk()
+            except Exception as err:
+                print("Capture thread stopped on error:", err)
+                self.error, self.running = err, False
+            else:
+                if samples.shape[-1]:
+                    self.ring.write(samples)
+
+    def stop(self):
+        self.running = False
+        self.join(1.0)
+
 
 audioModule=[]
 try:
@@ -34,27 +149,34 @@ try:
 
     
     class alsaaudio_soundcard():
-        def __init__(self, card, periodsize, audio_sampling_rate):
+        def __init__(self, card, periodsize, audio_sampling_rate, channels = 1):
             self.FORMAT = alsaaudio.PCM_FORMAT_S16_LE
             self.audio_sampling_rate = audio_sampling_rate
+            self.channels = channels
             card = 'sysdefault:CARD=' + card  # to add in the .cfg file under [Linux] section
             #card_info = {}
             #for device_number, card_name in enumerate(alsaaudio.cards()):
             #    card_info[card_name] = "hw:%s,0" % device_number
             #print(card_info[card])
             self.inp = alsaaudio.PCM(alsaaudio.PCM_CAPTURE, alsaaudio.PCM_NORMAL, card)
-            self.inp.setchannels(1)
+            self.inp.setchannels(channels)
             self.inp.setrate(audio_sampling_rate)
             self.inp.setperiodsize(periodsize)
             self.inp.setformat(self.FORMAT)
             self.name = "alsaaudio sound card capture on " + card
+            # one second of S16_LE interleaved frames, filled in place at each capture
+            self.buffer = bytearray(2 * channels * audio_sampling_rate)
+            self.samples = deinterleave(frombuffer(self.buffer, dtype='<i2'), channels)
 
         def capture_1sec(self):
-            raw_data = b''
-            while len(raw_data) < 2 * self.audio_sampling_rate:
-                length,data = self.inp.read()
-                if length> 0: raw_data += data
-            return array(st_unpack("%ih"%self.audio_sampling_rate, raw_data[:2 * self.audio_sampling_rate]))
+            """Return one second of samples. The array is overwritten by the next capture."""
+            read_periods_into(self.buffer, self.inp.read)
+            return self.samples
+
+        def read_chunk(self):
+            """Return the samples of the next period, as a view on the bytes read"""
+            length, data = self.inp.read()
+            return deinterleave(frombuffer(data, dtype='<i2')[:max(length, 0) * self.channels], self.channels)
         
         def close(self):
             pass  # to check later if there is something to do
@@ -62,9 +184,9 @@ try:
         def info(self):
             print(self.name, "at", self.audio_sampling_rate,"Hz")
             one_sec = self.capture_1sec()
-            print(len(one_sec),"bytes read from", self.name, one_sec.shape)
-            print(one_sec[:10])
-            print("Vector sum", one_sec.sum())
+            print(one_sec.shape[-1],"frames read from", self.name, one_sec.shape)
+            print(one_sec[..., :10])
+            print("Vector sum", one_sec.sum(axis=-1))
         
 except ImportError:
     pass
@@ -75,33 +197,48 @@ try:
     audioModule.append("sounddevice")
 
     class sounddevice_soundcard():
-        def __init__(self, device, audio_sampling_rate):
+        def __init__(self, device, audio_sampling_rate, channels = 1):
             self.audio_sampling_rate = audio_sampling_rate
+            self.channels = channels
             sounddevice.default.samplerate = audio_sampling_rate
             sounddevice.default.device = int(device)
-            sounddevice.default.channels = 1
+            sounddevice.default.channels = channels
             self.name = "sounddevice capture on device " + str(device)
+            # duration = 1 sec hence   1 x self.audio_sampling_rate frames of all channels, recorded in place
+            self.buffer = empty((audio_sampling_rate, channels), dtype=int16)
+            self.samples = self.buffer[:, 0] if channels == 1 else self.buffer.T
+            self.stream = None
 
         def capture_1sec(self):
-            # duration = 1 sec hence   1 x self.audio_sampling_rate = self.audio_sampling_rate
-            one_sec_record = b''
+            """Return one second of samples. The array is overwritten by the next capture."""
             try:
-                one_sec_record = sounddevice.rec(self.audio_sampling_rate)
+                sounddevice.rec(out=self.buffer, blocking=True)
             except sounddevice.PortAudioError as err:
                 print("Error reading device", self.name)
                 print(err)
-            return one_sec_record[0]
+                return self.samples[..., :0]
+            return self.samples
+
+        def start_stream(self, write):
+            """Keep one input stream open: PortAudio calls write() with each new block of samples"""
+            def callback(indata, frames, time_info, status):
+                write(indata[:, 0] if self.channels == 1 else indata.T)
+            self.stream = sounddevice.InputStream(samplerate=self.audio_sampling_rate, channels=self.channels,
+                                                  dtype='int16', callback=callback)
+            self.stream.start()
 
         def close(self):
-            pass  # to check later if there is something to do
+            if self.stream:
+                self.stream.stop()
+                self.stream.close()
 
         def info(self):
             print(self.name, "at", self.audio_sampling_rate,"Hz")
             try:
                 one_sec = self.capture_1sec()
-                print(len(one_sec),"bytes read from", self.name, one_sec.shape)
-                print(one_sec[:10])
-                print("Vector sum", one_sec.sum())
+                print(one_sec.shape[-1],"frames read from", self.name, one_sec.shape)
+                print(one_sec[..., :10])
+                print("Vector sum", one_sec.sum(axis=-1))
             except IndexError:
                 print("Cannot read", self.name)
 
@@ -115,36 +252,43 @@ try:
     audioModule.append("pyaudio")
     
     class pyaudio_soundcard():
-        def __init__(self, audio_sampling_rate):
+        def __init__(self, audio_sampling_rate, channels = 1):
             self.FORMAT = pyaudio.paInt16
             self.CHUNK = 1024
             self.pa_lib = pyaudio.PyAudio()
             self.audio_sampling_rate = audio_sampling_rate
+            self.channels = channels
 
             self.pa_stream = self.pa_lib.open(format = self.FORMAT,
-                                          channels = 1,
+                                          channels = channels,
                                           rate = self.audio_sampling_rate,
                                           input = True,
                                           frames_per_buffer = self.audio_sampling_rate) #@S frames_per_buffer = self.CHUNK
             self.name = "pyaudio sound card capture"
+            # one second of paInt16 interleaved frames, filled in place at each capture
+            self.buffer = bytearray(2 * channels * audio_sampling_rate)
+            self.samples = deinterleave(frombuffer(self.buffer, dtype='<i2'), channels)
 
         def capture_1sec(self):
-            raw_data = b''.join(self.capture(1))  # self.pa_stream.read(self.audio_sampling_rate)
-            unpacked_data = st_unpack("{}h".format(self.audio_sampling_rate), raw_data)
-            return array(unpacked_data)
+            """Return one second of samples. The array is overwritten by the next capture."""
+            read_frames_into(self.buffer, self.read_frames, self.audio_sampling_rate)
+            return self.samples
+
+        def read_frames(self, nb_samples):
+            """Read the frames of 'nb_samples' 16 bits samples (all channels together)"""
+            return self.pa_stream.read(nb_samples // self.channels)
+
+        def read_chunk(self):
+            """Return the next CHUNK frames (none on overflow)"""
+            try:
+                return deinterleave(frombuffer(self.pa_stream.read(self.CHUNK), dtype='<i2'), self.channels)
+            except IOError:
+                return self.samples[..., :0]
 
         def capture(self, secs):
-            frames = []
-            expected_number_of_bytes = 2 * self.audio_sampling_rate * secs #int(self.audio_sampling_rate / self.CHUNK * secs)
-            while len(frames) < expected_number_of_bytes:
-                try:
-                    data = self.pa_stream.read(self.audio_sampling_rate) # self.CHUNK
-                    frames.extend(data)
-                    #print(len(data), len(frames))
-                except IOError as io:
-                    #print("IOError reading card:", str(io))
-                    pass
-            return frames[:expected_number_of_bytes]
+            """Return a new bytearray holding 'secs' seconds of raw interleaved frames"""
+            return read_frames_into(bytearray(2 * self.channels * self.audio_sampling_rate * secs),
+                                    self.read_frames, self.audio_sampling_rate)
         
         def close(self):
             self.pa_stream.stop_stream()
@@ -157,7 +301,7 @@ try:
             print("default device :", self.pa_lib.get_default_input_device_info())
             default_capability = self.pa_lib.get_default_host_api_info()
             print("default device Capability", default_capability)
-            is_supported = self.pa_lib.is_format_supported(input_format=self.FORMAT, input_channels=1,
+            is_supported = self.pa_lib.is_format_supported(input_format=self.FORMAT, input_channels=self.channels,
                                                        rate=self.audio_sampling_rate, input_device=0)
             print("expected format is supported?", is_supported)
             
@@ -174,17 +318,18 @@ class Sampler():
         
         self.audio_sampling_rate = audio_sampling_rate
         self.NFFT = NFFT
+        self.channels = controller.config.get('Channels', 1)
         self.sampler_ok = True
 
         try:
             if controller.config['Audio'] == 'pyaudio':
-                self.capture_device = pyaudio_soundcard(audio_sampling_rate)
+                self.capture_device = pyaudio_soundcard(audio_sampling_rate, self.channels)
             elif controller.config['Audio'] == 'sounddevice':
-                self.capture_device = sounddevice_soundcard(controller.config['Card'], audio_sampling_rate)
+                self.capture_device = sounddevice_soundcard(controller.config['Card'], audio_sampling_rate, self.channels)
             elif controller.config['Audio'] == 'alsaaudio':
                 self.capture_device = alsaaudio_soundcard(controller.config['Card'],
                                                           controller.config['PeriodSize'],
-                                                          audio_sampling_rate)
+                                                          audio_sampling_rate, self.channels)
             else:
                 self.display_error_message("Unknown audio module:" + controller.config['Audio'])
                 self.sampler_ok = False
@@ -196,20 +341,40 @@ class Sampler():
             print("To debugg: remove the try/except clause to get detail on what exception is triggered.")
 
         if self.sampler_ok:
-            print("-", self.capture_device.name)
+            print("-", self.capture_device.name, "" if self.channels == 1 else "(%d channels)" % self.channels)
+
+        # continuous capture: the ring keeps the whole log interval and some margin
+        self.continuous = self.sampler_ok and controller.config.get('Continuous', 'NO') == 'YES'
+        self.capture_thread = None
+        self.read_position = 0  # next sample to be returned by capture_interval
+        if self.continuous:
+            self.ring = RingBuffer((controller.config['log_interval'] + 2) * audio_sampling_rate, self.channels)
+            if hasattr(self.capture_device, 'start_stream'):
+                self.capture_device.start_stream(self.ring.write)
+            else:
+                self.capture_thread = CaptureThread(self.capture_device.read_chunk, self.ring)
+                self.capture_thread.start()
+            print("- continuous capture in a ring buffer of", self.ring.capacity, "samples")
 
-    def set_monitored_frequencies(self, stations):
-        self.monitored_bins = []
-        for station in stations:
-            binSample = int(((int(station['frequency']) * self.NFFT) / self.audio_sampling_rate))
-            self.monitored_bins.append(binSample)
-            #print ("monitored freq =", station[Config.FREQUENCY], " => bin = ", binSample)
+    def set_monitored_frequencies(self, stations, span = 1):
+        """Calculate once how each station's signal strength is read from the spectrum (bin_reader)
+        and the bins to calculate (monitored_bins)"""
+        self.bin_reader = BinReader([int(station['frequency']) for station in stations], self.NFFT,
+                                    self.audio_sampling_rate,
+                                    [station.get('interpolation', 'none') for station in stations], span,
+                                    [station.get('channel', 0) for station in stations])
+        self.monitored_bins = self.bin_reader.needed_bins
+        #print ("monitored freq =", station[Config.FREQUENCY], " => bins = ", self.bin_reader.station_bins)
 
     def capture_1sec(self):
-        """Capture 1 second of data, returned data as an array
+        """Capture 1 second of data, returned data as an array (one row per channel if more than one).
+        In continuous mode, the last second already captured is returned without waiting.
         """
         try:
-            self.data = self.capture_device.capture_1sec()
+            if self.continuous:
+                self.data = self.latest_samples(self.audio_sampling_rate)
+            else:
+                self.data = self.capture_device.capture_1sec()
         except:
             self.sampler_ok = False
             print ("Fail to read data from audio using " + self.capture_device.name)
@@ -221,7 +386,27 @@ class Sampler():
                 
         return self.data
 
+    def latest_samples(self, count):
+        """Continuous mode: return a copy of the last 'count' samples captured"""
+        if self.capture_thread and self.capture_thread.error:
+            raise self.capture_thread.error
+        self.ring.wait_for(count, timeout=2.0 * count / self.audio_sampling_rate)  # only at start
+        return self.ring.latest(count)
+
+    def capture_interval(self):
+        """Continuous mode: return all the samples captured since the previous call (the first call: since the start)"""
+        if self.capture_thread and self.capture_thread.error:
+            raise self.capture_thread.error
+        stop = self.ring.written
+        samples = self.ring.read(self.read_position, stop)
+        self.read_position = stop
+        if self.scaling_factor != 1.0:
+            samples = samples * self.scaling_factor
+        return samples
+
     def close(self):
+        if self.capture_thread:
+            self.capture_thread.stop()
         self.capture_device.close()
 
     def display_error_message(self, message):
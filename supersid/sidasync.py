@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+ Name:        sidasync.py
+ Purpose:     Optional asyncio runtime of the SuperSID controller ('runtime = asyncio' in the .cfg).
+
+              All the periodic work is a coroutine of one event loop instead of a thread of its own:
+              - AsyncTimer: the sampling ticks, same deadlines, overrun policy and statistics as SidTimer
+              - the blocking capture and spectrum calculation of each tick run in an executor thread,
+                the readings are then recorded in the day buffers by the loop itself
+              - AsyncSaveWorker: the files to write (persistence) are futures of a one thread executor,
+                in the order they were submitted as with the Logger's SaveWorker
+              - the text viewer's keyboard is read by a coroutine instead of a Timer re-armed every 0.5 s
+              Other coroutines (e.g. network serving) can be added by add_service() before run().
+
+              Text viewer: the loop runs in the main thread. Graphic viewers keep the main thread
+              for their own main loop: the asyncio loop then runs in one background thread.
+
+              Requires Python 3.5 or later.
+
+ Created:     18-10-2026
+"""
+from __future__ import print_function   # use the new Python 3 'print' function
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from sidtimer import SidTimer
+
+
+class AsyncTimer(SidTimer):
+    """SidTimer ticking as a coroutine of the loop: 'callback' is a coroutine function awaited at each tick"""
+    def __init__(self, interval, callback, loop, delay=0, overrun='skip'):
+        self.loop = loop
+        self._task = None
+        SidTimer.__init__(self, interval, callback, delay, overrun)
+
+    def start(self):
+        """Nothing to start now: run() is scheduled by the AsyncRuntime once its loop runs"""
+        pass
+
+    async def run(self):
+        self._task = asyncio.ensure_future(self._ticks())
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _ticks(self):
+        while True:
+            # the loop's clock is monotonic: the deadline is converted just before waiting as SidTimer does
+            await asyncio.sleep(max(self.expected_time - time.time(), 0))
+            self._ontimer()
+            # callback to perform tasks
+            await self.callback()
+            self._after_callback()
+
+    def stop(self):
+        """Cancel the ticks, from any thread"""
+        if self._task and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._task.cancel)
+
+
+class AsyncSaveWorker(object):
+    """Same interface as logger.SaveWorker: the jobs run one after the other in the thread of the executor,
+    scheduled by the loop. Once the loop is over, the jobs are performed at once by the caller."""
+    def __init__(self, loop):
+        self.loop = loop
+        self.executor = ThreadPoolExecutor(max_workers=1)   # one thread: the jobs keep their order
+        self.pending = set()
+
+    def submit(self, job, *args, **kwargs):
+        """Queue the call job(*args, **kwargs) and return at once"""
+        if self.loop.is_closed():   # too late for the loop
+            job(*args, **kwargs)
+        else:
+            self.loop.call_soon_threadsafe(self._schedule, partial(job, *args, **kwargs))
+
+    def _schedule(self, job):
+        future = self.loop.run_in_executor(self.executor, job)
+        self.pending.add(future)
+        future.add_done_callback(partial(self._done, getattr(job.func, '__name__', job.func)))
+
+    def _done(self, name, future):
+        self.pending.discard(future)
+        if future.exception():
+            print("\nError in background task", name, ":", future.exception())
+
+    async def drain(self):
+        """Wait for all the jobs submitted so far"""
+        await asyncio.sleep(0)      # let the submissions already called soon be scheduled
+        while self.pending:
+            await asyncio.wait(list(self.pending))
+
+    def stop(self):
+        """Wait for the pending jobs once the loop is over. While it runs, the AsyncRuntime drains them when it stops."""
+        if self.loop.is_closed():
+            self.executor.shutdown(wait=True)
+
+
+class AsyncRuntime(object):
+    """Run the controller's ticks, persistence and viewer input as coroutines of one asyncio loop"""
+    def __init__(self, controller):
+        self.controller = controller
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=1)   # capture and spectrum: one reading at a time
+        self.input_executor = ThreadPoolExecutor(max_workers=1)     # blocking keyboard reads
+        self.saver = AsyncSaveWorker(self.loop)
+        self.timer = AsyncTimer(controller.config['log_interval'], self.on_tick, self.loop,
+                                overrun=controller.config['timer_overrun'])
+        self.services = []
+        self.stopping = None
+        self.thread = None
+
+    def add_service(self, coroutine_function):
+        """Add a coroutine function to run on the loop with the sampling, until the runtime stops"""
+        self.services.append(coroutine_function)
+
+    async def on_tick(self):
+        signal_strengths = await self.loop.run_in_executor(self.executor, self.controller.read_spectrum)
+        self.controller.record_readings(signal_strengths)
+
+    async def keyboard(self):
+        """Text viewer: wait for each key in the input executor and perform its command, until 'x'"""
+        key = None
+        while key != 'x':
+            key = await self.loop.run_in_executor(self.input_executor, self.controller.viewer.read_key)
+
+    async def main(self):
+        self.stopping = asyncio.Event()
+        tasks = [asyncio.ensure_future(self.timer.run())]
+        if hasattr(self.controller.viewer, 'read_key'):
+            tasks.append(asyncio.ensure_future(self.keyboard()))
+        tasks += [asyncio.ensure_future(service()) for service in self.services]
+        await self.stopping.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.wait(tasks)
+        await self.saver.drain()
+
+    def run(self):
+        """Run the loop in the calling thread until stop()"""
+        asyncio.set_event_loop(self.loop)
+        main = asyncio.ensure_future(self.main(), loop=self.loop)
+        try:
+            self.loop.run_until_complete(main)
+        except (KeyboardInterrupt, SystemExit):
+            self.stop()
+            self.loop.run_until_complete(main)  # the pending files are still written
+        finally:
+            self.executor.shutdown(wait=True)
+            self.input_executor.shutdown(wait=False)    # a thread may still wait for a key
+            self.loop.close()
+            self.saver.stop()
+
+    def start(self):
+        """Run the loop in a background thread, for the graphic viewers which keep the main thread"""
+        self.thread = threading.Thread(target=self.run, name="SuperSID asyncio")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """End the main coroutine, from any thread"""
+        if self.stopping is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopping.set)
+
+    def join(self, timeout=5.0):
+        """Wait for the end of the background thread's loop (graphic viewers)"""
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
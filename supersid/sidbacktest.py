@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+ Name:        sidbacktest.py
+ Purpose:     Back-test the detection (siddetect.py) on an archive of SID/SuperSID files: sweep the parameters
+              'window', 'k_distance' and 'alpha' over days, months or years of recordings without running the
+              station in real time. The groups of files (one month each by default) are processed in parallel
+              by a pool of processes (one per CPU by default), each group once for all the parameter sets.
+
+ Usage examples:
+    sidbacktest.py -w 720 -k 3 -a 0.2 ../Data                      breach logs of every day with these parameters
+    sidbacktest.py -w 360,720,1440 -k 2,2.5,3 -a 0.1,1 --stats -r ../Data
+                                                                   statistics of the 18 parameter sets, no file written
+
+ The files of a group with the same stations are put side by side in date order as if the station had been
+ running the whole time: the window and the smoothing go on from one day to the next, as they do live. They start
+ again at each group. The generated files (sidbatch.py outputs, breach logs, QDC) are not back-tested.
+ For each day and parameter set, the breach log name.breach_w<window>_k<k_distance>_a<alpha>.csv is written
+ (same layout as Detect.write_breach) unless --stats is given. The breach statistics of each parameter set
+ are displayed at the end: number of readings in breach and of breach episodes per station.
+"""
+from __future__ import print_function   # use the new Python 3 'print' function
+from os import path
+import re
+import time
+import argparse
+import itertools
+import multiprocessing
+from collections import OrderedDict
+import numpy
+
+from sidfile import SidFile
+from siddetect import valid_readings, rolling_mean_std, exponential_smoothing, breach_limits, write_breach_log
+from sidbatch import list_files, output_name
+
+# date of the day in the file names like SITE_2015-03-21.csv or SITE_NWC_2015-03-21.csv
+_DATE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+GROUPS = {'day': 3, 'month': 2, 'year': 1}
+
+
+def group_files(filenames, group):
+    """Sort the files by date and gather them in groups of the same 'day', 'month' or 'year', or 'all' together"""
+    dated = []
+    for filename in filenames:
+        found = _DATE.search(path.basename(filename))
+        dated.append((found.groups() if found else (path.basename(filename),), filename))
+    dated.sort()
+    if group == 'all':
+        return [[f for _, f in dated]]
+    return [[f for _, f in files] for _, files in itertools.groupby(dated, key=lambda d: d[0][:GROUPS[group]])]
+
+
+def parameter_name(window, k, alpha):
+    """Suffix of the breach logs of one parameter set"""
+    return "w%d_k%g_a%g" % (window, k, alpha)
+
+
+def backtest_group(job):
+    """Executed by the pool's processes: detect the breaches of one group of files for all the parameter sets.
+    Return the group's first file, the number of files, {parameters: {station: [readings, in breach, episodes]}},
+    the names of the breach logs written, the files skipped (not recordings), the elapsed time and the error if any"""
+    filenames, parameters, options = job
+    start = time.time()
+    statistics, fnames, skipped = {}, [], []
+    try:
+        # the files of each list of stations side by side in date order, e.g. the days of NAA and those of NWC
+        # of a sid_format archive (one file per station) are two recordings, not one per day
+        recordings = OrderedDict()
+        for filename in filenames:
+            try:
+                sid = SidFile(filename)
+            except SystemExit:  # SidFile exits on the files without stations (e.g. PSD dumps)
+                skipped.append(filename)
+                continue
+            if 'days averaged' in sid.sid_params:   # a QDC written by Qdc.write_qdc, not a recording
+                skipped.append(filename)
+                continue
+            recordings.setdefault(tuple(sid.stations), []).append(sid)
+        for same_stations in recordings.values():
+            data = numpy.concatenate([sid.data for sid in same_stations], axis=1)
+            valid = valid_readings(data)
+            readings = data[:, valid]
+            # each window and each alpha once, whatever the number of parameter sets
+            rolling = dict((window, rolling_mean_std(readings, window)) for window in set(p[0] for p in parameters))
+            smoothed = dict((alpha, exponential_smoothing(readings, alpha)) for alpha in set(p[2] for p in parameters))
+            for window, k, alpha in parameters:
+                mean, std = rolling[window]
+                breach = numpy.full(data.shape, numpy.nan)
+                breach[:, valid] = breach_limits(smoothed[alpha], mean, std, k)[2]
+                in_breach = ~numpy.isnan(breach[:, valid])
+                episodes = in_breach[:, :1].sum(axis=1) + (in_breach[:, 1:] & ~in_breach[:, :-1]).sum(axis=1)
+                station_stats = statistics.setdefault((window, k, alpha), {})
+                for istation, station in enumerate(same_stations[0].stations):
+                    counts = station_stats.setdefault(station, [0, 0, 0])
+                    counts[0] += readings.shape[1]
+                    counts[1] += int(in_breach[istation].sum())
+                    counts[2] += int(episodes[istation])
+                if options.stats:
+                    continue
+                first = 0
+                for sid in same_stations:
+                    last = first + sid.data.shape[1]
+                    fname = output_name(sid.filename, options.output_dir, "%s.breach_%s.csv" % (
+                        path.splitext(sid.filename)[0], parameter_name(window, k, alpha)))
+                    write_breach_log(fname, sid, breach[:, first:last])
+                    fnames.append(fname)
+                    first = last
+        error = None
+    except (Exception, SystemExit) as err:  # SidFile exits on unreadable files: do not kill the worker
+        error = str(err) or err.__class__.__name__
+    return filenames[0], len(filenames), statistics, fnames, skipped, time.time() - start, error
+
+
+def number_list(text, cast):
+    """Parse a comma separated list of numbers like '360,720,1440'"""
+    return [cast(value) for value in text.split(",") if value.strip()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Back-test the detection parameters on SID/SuperSID files in parallel")
+    parser.add_argument("-w", "--window", dest="windows", required=True, type=lambda t: number_list(t, int),
+                        help="Window(s) of the control limits in number of readings, comma separated")
+    parser.add_argument("-k", "--k_distance", dest="k_distances", required=True, type=lambda t: number_list(t, float),
+                        help="Distance(s) of the limits in standard deviations, comma separated")
+    parser.add_argument("-a", "--alpha", dest="alphas", default=[1.0], type=lambda t: number_list(t, float),
+                        help="Exponential smoothing factor(s), comma separated (default=1 i.e. no smoothing)")
+    parser.add_argument("-g", "--group", dest="group", choices=['day', 'month', 'year', 'all'], default='month',
+                        help="Files processed together, the limits starting again at each group (default: month)")
+    parser.add_argument("--stats", action="store_true", dest="stats", default=False,
+                        help="Only display the breach statistics, do not write the breach logs")
+    parser.add_argument("-n", "--native", action="store_true", dest="native", default=False,
+                        help="Process the native binary files (.sid) instead of the csv files of the folders")
+    parser.add_argument("-o", "--output", dest="output_dir", default="",
+                        help="Folder for the breach logs (default: same folder as each file)")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=multiprocessing.cpu_count(),
+                        help="Number of parallel processes (default: number of CPUs)")
+    parser.add_argument("-r", "--recursive", action="store_true", dest="recursive", default=False,
+                        help="Look for files in the sub-folders of the given folders")
+    parser.add_argument("inputs", nargs="+", metavar="FILE|FILE*.csv|FOLDER",
+                        help="Raw files to back-test. Wildcards and folders accepted.")
+    args = parser.parse_args()
+
+    parameters = list(itertools.product(args.windows, args.k_distances, args.alphas))
+    filenames = list_files(args.inputs, args.recursive, "*" + SidFile._NATIVE_EXTENSION if args.native else "*.csv")
+    groups = group_files(filenames, args.group)
+    print("%d file(s) in %d group(s), %d parameter set(s) with %d process(es)" % (len(filenames), len(groups),
+                                                                               len(parameters), args.jobs))
+
+    start, nb_errors, statistics = time.time(), 0, {}
+    pool = multiprocessing.Pool(args.jobs)
+    for filename, nb_files, group_stats, fnames, skipped, elapsed, error in pool.imap_unordered(
+            backtest_group, [(files, parameters, args) for files in groups]):
+        if error:
+            nb_errors += 1
+            print("ERROR %s: %s" % (filename, error))
+            continue
+        print("%s: %d file(s), %d breach log(s) in %.2f s" % (filename, nb_files, len(fnames), elapsed))
+        for skipped_file in skipped:
+            print("  %s skipped: not a recording" % skipped_file)
+        for params, station_stats in group_stats.items():
+            for station, counts in station_stats.items():
+                totals = statistics.setdefault(params, {}).setdefault(station, [0, 0, 0])
+                for i, count in enumerate(counts):
+                    totals[i] += count
+    pool.close()
+    pool.join()
+
+    print("\n%-24s %-10s %10s %10s %8s %9s" % ("parameters", "station", "readings", "in breach", "%", "episodes"))
+    for params in sorted(statistics):
+        for station in sorted(statistics[params]):
+            readings, in_breach, episodes = statistics[params][station]
+            print("%-24s %-10s %10d %10d %8.2f %9d" % (parameter_name(*params), station, readings, in_breach,
+                                                       100.0 * in_breach / max(readings, 1), episodes))
+    elapsed = time.time() - start
+    print("%d file(s) in %.1f s, %d error(s)" % (len(filenames), elapsed, nb_errors))
+    exit(1 if nb_errors else 0)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""
+ Name:        sidbatch.py
+ Purpose:     Apply the sidfile.py manipulations to a whole archive of SID/SuperSID files,
+              files being processed in parallel by a pool of processes (one per CPU by default)
+
+ Usage examples:
+    sidbatch.py --filter --bema_wing 8 ../Data                  all the .csv files of ../Data filtered again
+    sidbatch.py --split "../Data/MYSITE_2015-*.csv" -o /tmp     one SID file per station for upload
+    sidbatch.py --native -r ../Data                             convert a whole tree to the native binary format
+    sidbatch.py --merge ../Data2 ../Data                        merge the files having the same name in both folders
+
+ Each process reads its file, writes its result(s) to disk and only reports the file names and timing,
+ so that memory stays flat whatever the number of files. Throughput is displayed per file and in total.
+ The files created by these operations (name.filtered.csv, name.merge.csv, *.split.csv) are not taken again
+ from the folders and wildcards, only when given by their name.
+"""
+from __future__ import print_function   # use the new Python 3 'print' function
+import os
+from os import path
+import glob
+import fnmatch
+import time
+import argparse
+import multiprocessing
+
+from sidfile import SidFile
+from config import FILTERED, RAW
+
+
+def output_name(filename, output_dir, new_name):
+    """Return new_name in output_dir if given else in the folder of filename"""
+    return path.join(output_dir or path.dirname(filename), path.basename(new_name))
+
+
+def filter_file(filename, options):
+    """Filter one file (raw or not) in the same format: name.filtered.csv"""
+    sid = SidFile(filename, force_read_timestamp = True)
+    fname = output_name(filename, options.output_dir, "%s.filtered%s" % path.splitext(filename))
+    if sid.isSuperSID:
+        sid.write_data_supersid(fname, FILTERED, apply_bema = True, extended = sid.is_extended, bema_wing = options.bema_wing)
+    else:
+        sid.write_data_sid(sid.stations[0], fname, FILTERED, apply_bema = True, extended = sid.is_extended,
+                           bema_wing = options.bema_wing)
+    return [fname]
+
+
+def split_file(filename, options):
+    """Split one SuperSID file in one SID file per station: site_station_date.split.csv"""
+    sid = SidFile(filename, force_read_timestamp = True)
+    fnames = []
+    for station in sid.stations:
+        fname = output_name(filename, options.output_dir, "%s_%s_%s.split.csv" % (sid.sid_params['site'], station,
+                                                                                 sid.sid_params['utc_starttime'][:10]))
+        sid.write_data_sid(station, fname, sid.sid_params['logtype'], apply_bema = False)
+        fnames.append(fname)
+    return fnames
+
+
+def native_file(filename, options):
+    """Convert one csv file to the native binary format: name.sid"""
+    sid = SidFile(filename, force_read_timestamp = True)
+    fname = output_name(filename, options.output_dir, path.splitext(filename)[0] + SidFile._NATIVE_EXTENSION)
+    sid.write_data_native(fname, log_type = sid.sid_params['logtype'], extended = sid.is_extended)
+    return [fname]
+
+
+def csv_file(filename, options):
+    """Generate the csv file of one native binary file: name.csv"""
+    sid = SidFile(filename)
+    fname = output_name(filename, options.output_dir, path.splitext(filename)[0] + ".csv")
+    if sid.isSuperSID:
+        sid.write_data_supersid(fname, sid.sid_params['logtype'], apply_bema = False, extended = sid.is_extended)
+    else:
+        sid.write_data_sid(sid.stations[0], fname, sid.sid_params['logtype'], apply_bema = False, extended = sid.is_extended)
+    return [fname]
+
+
+def merge_file(filename, options):
+    """Add the data of the file of the same name found in the --merge folder: name.merge.csv"""
+    sid1, sid2 = SidFile(filename), SidFile(path.join(options.merge_dir, path.basename(filename)))
+    fname = output_name(filename, options.output_dir, "%s.merge%s" % path.splitext(filename))
+    if sid1.isSuperSID:
+        for istation, station in enumerate(sid1.stations):
+            station_data = sid2.get_station_data(station)
+            if len(station_data):
+                sid1.data[istation] += station_data
+        sid1.write_data_supersid(fname, sid1.sid_params['logtype'], apply_bema = False, extended = sid1.is_extended)
+    else:
+        sid1.data[0] += sid2.get_station_data(sid1.stations[0])
+        sid1.write_data_sid(sid1.stations[0], fname, sid1.sid_params['logtype'], apply_bema = False, extended = sid1.is_extended)
+    return [fname]
+
+
+OPERATIONS = {'filter': filter_file, 'split': split_file, 'native': native_file, 'csv': csv_file, 'merge': merge_file}
+
+
+def process_one(job):
+    """Executed by the pool's processes: perform the operation on one file and return its statistics"""
+    operation, filename, options = job
+    start = time.time()
+    try:
+        fnames, error = OPERATIONS[operation](filename, options), None
+    except (Exception, SystemExit) as err:  # SidFile exits on unreadable files: do not kill the worker
+        fnames, error = [], str(err) or err.__class__.__name__
+    return filename, fnames, time.time() - start, error
+
+
+# tags in the names of the files created by the tools (sidbatch.py, sidbacktest.py's breach logs), not recordings
+GENERATED_TAGS = ('.filtered.', '.merge.', '.split.', '.breach_')
+
+
+def is_generated(filename):
+    """True if 'filename' was created by one of the tools from a recording, see GENERATED_TAGS"""
+    return any(tag in path.basename(filename) for tag in GENERATED_TAGS)
+
+
+def list_files(inputs, recursive = False, pattern = "*.csv"):
+    """Expand the files, wildcards and folders (their 'pattern' files, recursively if requested) to a sorted list.
+    The generated files (see is_generated) found in folders or by wildcards are left out"""
+    filenames = set()
+    for item in inputs:
+        item = path.expanduser(item)
+        if path.isdir(item):
+            if recursive:
+                found = [path.join(root, f) for root, _, files in os.walk(item) for f in fnmatch.filter(files, pattern)]
+            else:
+                found = glob.glob(path.join(item, pattern))
+        elif path.isfile(item):
+            found = [item]     # given by its name: taken as it is
+        else:
+            found = glob.glob(item)
+        filenames.update([f for f in found if f == item or not is_generated(f)])
+    return sorted(filenames)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Process many SID/SuperSID files in parallel")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("-f", "--filter", dest="operation", action="store_const", const="filter",
+                       help="Filter each file with the given --bema_wing")
+    group.add_argument("-s", "--split", dest="operation", action="store_const", const="split",
+                       help="Split each SuperSID file in one SID file per station")
+    group.add_argument("-n", "--native", dest="operation", action="store_const", const="native",
+                       help="Convert each csv file to the native binary format (.sid)")
+    group.add_argument("-c", "--csv", dest="operation", action="store_const", const="csv",
+                       help="Convert each native binary file (.sid) to csv")
+    group.add_argument("-m", "--merge", dest="merge_dir", metavar="FOLDER",
+                       help="Merge each file with the file of the same name in FOLDER")
+    parser.add_argument("-b", "--bema_wing", dest="bema_wing", type=int, default=6,
+                        help="Width of the window used in filtering a.k.a. 'bema_wing' (default=6)")
+    parser.add_argument("-o", "--output", dest="output_dir", default="",
+                        help="Folder for the created files (default: same folder as each file)")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=multiprocessing.cpu_count(),
+                        help="Number of parallel processes (default: number of CPUs)")
+    parser.add_argument("-r", "--recursive", action="store_true", dest="recursive", default=False,
+                        help="Look for files in the sub-folders of the given folders")
+    parser.add_argument("inputs", nargs="+", metavar="FILE|FILE*.csv|FOLDER",
+                        help="Files to process. Wildcards and folders accepted.")
+    args = parser.parse_args()
+    if args.merge_dir:
+        args.operation = "merge"
+
+    filenames = list_files(args.inputs, args.recursive, "*" + SidFile._NATIVE_EXTENSION if args.operation == "csv" else "*.csv")
+    if args.operation == "merge":
+        filenames = [f for f in filenames if path.isfile(path.join(args.merge_dir, path.basename(f)))]
+    print("%d file(s) to %s with %d process(es)" % (len(filenames), args.operation, args.jobs))
+
+    start, total_bytes, nb_errors = time.time(), 0, 0
+    pool = multiprocessing.Pool(args.jobs)
+    for filename, fnames, elapsed, error in pool.imap_unordered(process_one,
+                                                                [(args.operation, f, args) for f in filenames]):
+        size = path.getsize(filename)
+        total_bytes += size
+        if error:
+            nb_errors += 1
+            print("ERROR %s: %s" % (filename, error))
+        else:
+            print("%s: %d file(s) created in %.2f s (%.1f MB/s)" % (filename, len(fnames), elapsed,
+                                                                   size / 1048576.0 / max(elapsed, 1e-6)))
+    pool.close()
+    pool.join()
+    elapsed = time.time() - start
+    print("%d file(s) in %.1f s: %.1f files/s, %.1f MB/s, %d error(s)" % (len(filenames), elapsed,
+                                                                        len(filenames) / max(elapsed, 1e-6),
+                                                                        total_bytes / 1048576.0 / max(elapsed, 1e-6),
+                                                                        nb_errors))
+    exit(1 if nb_errors else 0)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+ Name:        sidcache.py
+ Purpose:     Usage 1: Provide a Class to load SID and SuperSID files through a persistent cache
+              Usage 2: Prewarm, purge or display the cache from the command line
+
+ Each csv file, once parsed, is saved in the cache directory as a native binary file (see SidFile.write_data_native)
+ named after its path, modification time and size: the next loads of the same unchanged file only map that
+ binary 'sidecar' file. A modified file gets a new key, its previous sidecar is no longer used.
+ The cache size is bounded: the least recently used sidecars are deleted first.
+
+ Default cache directory and size can be set in the .cfg file [PARAMETERS] section:
+    cache_path = ~/.supersid_cache
+    cache_size = 500    (MB)
+"""
+from __future__ import print_function   # use the new Python 3 'print' function
+import os
+from os import path
+import glob
+import hashlib
+import itertools
+
+from sidfile import SidFile
+
+
+class SidCache():
+    """Load SID/SuperSID files as SidFile objects, parsing each csv file only once"""
+    DEFAULT_PATH = "~/.supersid_cache"
+    DEFAULT_SIZE = 500  # MB
+    # header entries added by the native format, not part of the original file's sid_params
+    _NATIVE_KEYS = ('sidnative', 'dataoffset', 'datashape', 'timestamps', 'cached_extended')
+
+    def __init__(self, cache_path = "", max_size = 0, config = None):
+        """Use 'cache_path' and 'max_size' (MB) if given else the .cfg 'config' entries else the defaults"""
+        config = config or {}
+        self.version = "1.0 20261018"
+        self.cache_path = path.expanduser(cache_path or config.get('cache_path', "") or SidCache.DEFAULT_PATH)
+        self.max_size = int(max_size or config.get('cache_size', 0) or SidCache.DEFAULT_SIZE) * 1024 * 1024
+        self.enabled = True
+        if not path.isdir(self.cache_path):
+            try:
+                os.makedirs(self.cache_path)
+            except OSError as why:
+                # the cache is optional: the files are then parsed at each load
+                print("Warning: cannot create the cache", self.cache_path, why, "- files will not be cached")
+                self.enabled = False
+
+    def sidecar_filename(self, filename):
+        """Return the cache file name for the current version of 'filename' i.e. key on path + mtime + size"""
+        stats = os.stat(filename)
+        key = "%s|%r|%d" % (path.abspath(filename), stats.st_mtime, stats.st_size)
+        return path.join(self.cache_path, hashlib.sha1(key.encode('utf-8')).hexdigest() + SidFile._NATIVE_EXTENSION)
+
+    def load(self, filename):
+        """Return the SidFile of 'filename' (timestamps always read), from the cache when possible"""
+        if SidFile.is_native_file(filename):
+            return SidFile(filename)  # already as fast as a sidecar
+        if not self.enabled:
+            return SidFile(filename, force_read_timestamp = True)
+        sidecar = self.sidecar_filename(filename)
+        if path.isfile(sidecar):
+            os.utime(sidecar, None)  # most recently used
+            sid = SidFile(sidecar)
+            sid.filename = filename
+            sid.is_extended = sid.sid_params['cached_extended'] == 'yes'
+            sid.timestamp_format = SidFile._TIMESTAMP_EXTENDED if sid.is_extended else SidFile._TIMESTAMP_STANDARD
+            for key in SidCache._NATIVE_KEYS:
+                sid.sid_params.pop(key, None)
+            return sid
+        sid = SidFile(filename, force_read_timestamp = True)
+        self.store(sid, sidecar)
+        return sid
+
+    def store(self, sid, sidecar):
+        """Write the sidecar of a parsed SidFile keeping all its header entries, then enforce the cache size"""
+        if not self.enabled:
+            return
+        header = "".join(["# %s = %s\n" % (key, value) for key, value in sid.sid_params.items()])
+        header += "# cached_extended = %s\n" % ("yes" if sid.is_extended else "no")
+        try:
+            sid.write_data_native(sidecar + ".tmp", sid.sid_params.get('logtype', 'raw'), extended = True, header = header)
+            os.rename(sidecar + ".tmp", sidecar)  # never a partial sidecar, even if several processes share the cache
+        except (IOError, OSError, ValueError) as why:   # UnicodeError is a ValueError: the parsed SidFile is still used
+            print("Warning: cannot write in the cache", sidecar, why)
+            if path.isfile(sidecar + ".tmp"):
+                os.remove(sidecar + ".tmp")
+        self.evict()
+
+    def sidecars(self):
+        """Return the list of (last use time, size, sidecar filename) in the cache, least recently used first"""
+        entries = []
+        if not self.enabled:
+            return entries
+        for sidecar in glob.glob(path.join(self.cache_path, "*" + SidFile._NATIVE_EXTENSION)):
+            try:
+                stats = os.stat(sidecar)
+                entries.append((stats.st_mtime, stats.st_size, sidecar))
+            except OSError:
+                pass    # deleted by another process meanwhile
+        return sorted(entries)
+
+    def evict(self):
+        """Delete the least recently used sidecars until the cache is within its maximum size"""
+        entries = self.sidecars()
+        total_size = sum([size for _, size, _ in entries])
+        for _, size, sidecar in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(sidecar)
+            except OSError:
+                pass
+            total_size -= size
+
+    def purge(self):
+        """Delete all the sidecars"""
+        for _, _, sidecar in self.sidecars():
+            os.remove(sidecar)
+
+    def prewarm(self, filelist):
+        """Parse and cache all the files (wildcards accepted) not yet in the cache. Return the number of files parsed"""
+        nb_parsed = 0
+        if not self.enabled:
+            return nb_parsed
+        for filename in itertools.chain.from_iterable([glob.glob(path.expanduser(f)) for f in filelist]):
+            if not SidFile.is_native_file(filename) and not path.isfile(self.sidecar_filename(filename)):
+                self.load(filename)
+                nb_parsed += 1
+        return nb_parsed
+
+
+#-------------------------------------------------------------------------------
+if __name__ == '__main__':
+    import argparse
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Manage the cache of parsed SID/SuperSID files")
+    parser.add_argument("-c", "--config", dest="cfg_filename", required=False, default='',
+                        help="SuperSID Configuration file for cache_path and cache_size")
+    parser.add_argument("-p", "--prewarm", dest="prewarm", nargs="+", metavar="FILE|FILE*.csv",
+                        help="Parse and cache the given files. Wildcards accepted.")
+    parser.add_argument("--purge", action="store_true", dest="purge", default=False,
+                        help="Delete all the cached files")
+    args = parser.parse_args()
+
+    cache = SidCache(config = Config(args.cfg_filename) if args.cfg_filename else None)
+    if args.purge:
+        cache.purge()
+        print("Cache", cache.cache_path, "purged.")
+    if args.prewarm:
+        print(cache.prewarm(args.prewarm), "file(s) added to the cache.")
+    entries = cache.sidecars()
+    print("Cache %s: %d file(s), %.1f MB used of %.1f MB" % (cache.cache_path, len(entries),
+                                                            sum([size for _, size, _ in entries]) / 1048576.0,
+                                                            cache.max_size / 1048576.0))
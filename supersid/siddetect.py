@@ -5,110 +5,302 @@ Algorithm is based from Control Charts by Shewhart 1931
 
 SML
 20181213
+20261018: all stations at once, running sums of the window in a 2-D ring buffer (RunningWindow),
+          standard deviation as square root of the variance, alpha outside ]0, 1[ means no smoothing
+          offline mode: detect_offline() gives the same limits and breaches for whole days/months at once
+          (rolling mean/std by cumulative sums, smoothing as a recursive filter), see sidbacktest.py
+          breaches recorded as events (start, peak, end, magnitude) in an append-only SQLite log (BreachLog),
+          limits and breach buffers of the day preallocated once as float32 and reused every day
 """
 
 from __future__ import print_function   # use the new Python 3 'print' function
+import sys
+import sqlite3
+from collections import namedtuple
 from os import path
 from datetime import datetime, timedelta
-import itertools
 import numpy
 
+from sidfile import SidFile
+
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None  # exponential smoothing by a loop over the readings (all stations at once)
+
+
+class RunningWindow():
+    """ Last 'window' values of all stations in one 2-D ring buffer (stations x window)
+        with their running sum and sum of squares: O(1) per station to add a value and get mean and std """
+    def __init__(self, nb_stations, window):
+        self.window = window
+        self.values = numpy.zeros((nb_stations, window))
+        self.sums = numpy.zeros(nb_stations)
+        self.sums2 = numpy.zeros(nb_stations)
+        self.position = 0   # column of the next value
+        self.count = 0      # number of values in the window, up to 'window'
+
+    def push(self, values):
+        """ Add one value per station, replacing the oldest one when the window is full """
+        oldest = self.values[:, self.position]
+        self.sums += values - oldest
+        self.sums2 += values ** 2 - oldest ** 2
+        self.values[:, self.position] = values
+        self.position = (self.position + 1) % self.window
+        self.count = min(self.count + 1, self.window)
+        if self.position == 0:
+            # once per turn, cancel the rounding errors accumulated by the running sums
+            self.sums = self.values.sum(axis=1)
+            self.sums2 = (self.values ** 2).sum(axis=1)
+
+    def mean_std(self):
+        """ Mean and sample standard deviation of each station's values in the window """
+        n = float(self.count)
+        mean = self.sums / n
+        variance = (self.sums2 - self.sums ** 2 / n) / (n - 1) if self.count > 1 else numpy.zeros_like(mean)
+        return mean, numpy.sqrt(numpy.maximum(variance, 0.0))
+
+
+def valid_readings(data):
+    """ Columns of 'data' (stations x samples) really read: the live Detect is not fed when the reading is
+        missing, i.e. values still 0 for all stations in the day buffer, or not a number """
+    data = numpy.atleast_2d(data)
+    return numpy.isfinite(data).all(axis=0) & (data != 0.0).any(axis=0)
+
+
+def rolling_mean_std(data, window):
+    """ Mean and sample standard deviation of the last 'window' readings (fewer at the beginning) at each
+        column of 'data' (stations x samples), as RunningWindow.mean_std() after each push.
+        Computed by cumulative sums of the values centred on each station's mean (less rounding errors) """
+    data = numpy.atleast_2d(numpy.asarray(data, dtype=float))
+    nb_samples = data.shape[1]
+    if nb_samples == 0:
+        return data.copy(), data.copy()
+    offset = data.mean(axis=1)[:, numpy.newaxis]
+    centred = data - offset
+    sums = numpy.zeros((data.shape[0], nb_samples + 1))
+    sums2 = numpy.zeros((data.shape[0], nb_samples + 1))
+    numpy.cumsum(centred, axis=1, out=sums[:, 1:])
+    numpy.cumsum(centred ** 2, axis=1, out=sums2[:, 1:])
+    end = numpy.arange(1, nb_samples + 1)
+    start = numpy.maximum(end - window, 0)
+    n = (end - start).astype(float)
+    s, s2 = sums[:, end] - sums[:, start], sums2[:, end] - sums2[:, start]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        variance = numpy.where(n > 1, (s2 - s ** 2 / n) / (n - 1), 0.0)
+    return offset + s / n, numpy.sqrt(numpy.maximum(variance, 0.0))
+
+
+def exponential_smoothing(data, alpha):
+    """ Detect.lowpassfilt() of all the columns of 'data' (stations x samples): y[0] = x[0] then
+        y[i] = y[i-1] + alpha * (x[i] - y[i-1]), no smoothing if alpha is not in ]0, 1[ """
+    data = numpy.atleast_2d(numpy.asarray(data, dtype=float))
+    if alpha >= 1 or alpha <= 0 or data.shape[1] == 0:
+        return data.copy()
+    if lfilter is not None:
+        # first order recursive filter, initial state such that y[0] = x[0]
+        return lfilter([alpha], [1.0, alpha - 1.0], data, axis=1, zi=(1.0 - alpha) * data[:, :1])[0]
+    filtered = numpy.empty_like(data)
+    previous = filtered[:, 0] = data[:, 0]
+    for i in range(1, data.shape[1]):
+        previous = filtered[:, i] = previous + alpha * (data[:, i] - previous)
+    return filtered
+
+
+def breach_limits(filtered, mean, std, k):
+    """ Upper and lower control limits and the breaches (filtered values outside the limits, NaN elsewhere) """
+    ul = mean + k * std
+    dl = numpy.maximum(mean - k * std, 0.0)
+    breach = numpy.where(((filtered >= ul) | (filtered <= dl)) & (filtered != 0.0), filtered, numpy.nan)
+    return ul, dl, breach
+
+
+def detect_offline(data, window, k, alpha):
+    """ Limits and breaches of a whole recording 'data' (stations x samples, e.g. the days of a month side by side)
+        as the live Detect would have computed them reading after reading with these parameters.
+        Return the arrays filtered, uplimit, dnlimit and breach shaped as 'data', NaN where no reading """
+    data = numpy.atleast_2d(numpy.asarray(data, dtype=float))
+    valid = valid_readings(data)
+    readings = data[:, valid]
+    mean, std = rolling_mean_std(readings, window)
+    filtered = exponential_smoothing(readings, alpha)
+    results = []
+    for values in (filtered,) + breach_limits(filtered, mean, std, k):
+        result = numpy.full(data.shape, numpy.nan)
+        result[:, valid] = values
+        results.append(result)
+    return tuple(results)
+
+
+# one breach of one station: readings 'start' to 'end' (indexes in the day) outside the limits,
+# the largest one at 'peak' of 'peak_value', 'magnitude' standard deviations away from the window's mean
+BreachEvent = namedtuple('BreachEvent', 'station start peak end peak_value magnitude')
+
+
+class BreachLog():
+    """ Append-only SQLite log of the breach events, indexed by day 'YYYY-MM-DD',
+        and of the flare events grouping them (sidevents.FlareEvent), indexed by onset """
+    _SCHEMA = ("CREATE TABLE IF NOT EXISTS events (day TEXT NOT NULL, station TEXT NOT NULL, start INTEGER NOT NULL, "
+               "peak INTEGER NOT NULL, end INTEGER NOT NULL, peak_value REAL, magnitude REAL)",
+               "CREATE INDEX IF NOT EXISTS events_day ON events (day)",
+               "CREATE TABLE IF NOT EXISTS flares (onset TEXT NOT NULL, peak TEXT, end TEXT, stations TEXT, "
+               "readings INTEGER, peak_magnitude REAL, confidence REAL)",
+               "CREATE INDEX IF NOT EXISTS flares_onset ON flares (onset)")
+
+    def __init__(self, filename):
+        self.filename = filename
+        connection = self._connect()
+        try:
+            with connection:
+                for statement in BreachLog._SCHEMA:
+                    connection.execute(statement)
+        finally:
+            connection.close()
+
+    def _connect(self):
+        # one short connection per call: the events are appended by the Logger's background thread
+        return sqlite3.connect(self.filename)
+
+    def append(self, day, events):
+        """ Add the BreachEvents of the given day at the end of the log """
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                       [(day, e.station, int(e.start), int(e.peak), int(e.end),
+                                         float(e.peak_value), float(e.magnitude)) for e in events])
+        finally:
+            connection.close()
+
+    def append_flare(self, flare):
+        """ Add one ended flare event at the end of the log, times as 'YYYY-MM-DD HH:MM:SS' """
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("INSERT INTO flares VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   (str(flare.onset)[:19], str(flare.peak)[:19], str(flare.end)[:19],
+                                    ",".join(flare.stations), flare.readings, float(flare.peak_magnitude),
+                                    float(flare.confidence)))
+        finally:
+            connection.close()
+
+    def day_events(self, day):
+        """ BreachEvents of the given day, by start """
+        connection = self._connect()
+        try:
+            rows = connection.execute("SELECT station, start, peak, end, peak_value, magnitude FROM events "
+                                      "WHERE day = ? ORDER BY start, station", (day,)).fetchall()
+        finally:
+            connection.close()
+        return [BreachEvent(*row) for row in rows]
+
+
+def write_breach_log(filename, sid_file, breach):
+    """ Write the breach log 'breach' (stations x samples of the day) with the header of 'sid_file' """
+    with open(filename, 'wt') as fout:
+        print(sid_file.create_header(sid_file.isSuperSID, 'raw'), file=fout, end="")
+        SidFile.write_rows(fout, breach)
+
+
 class Detect():
     def __init__(self,controller):
         self.controller = controller
-        self.version = "SML 1.0 20181213"
+        self.version = "SML 1.2 20261018"
         self.config = controller.config
         self.sid_file = controller.logger.sid_file
   
         self.control_header()
 
-        self.sidbuffer = []     # window
-        self.uplimit = []       # of len(sid)
-        self.dnlimit = []
+        self.uplimit = None     # (stations x samples of the day) float32, allocated once
+        self.dnlimit = None
 
-        self.minibreach = []
-        self.breach = []
+        self.breach = None
+        self.events = []        # BreachEvents of the day, ended
 
-        self.filtered = []
+        self.filtered = None
 
         # initial conditions of algorithm
         lenstations = len(self.sid_file.stations)
-        self.prevs = lenstations*[0]
-        self.prevq = lenstations*[0]
+        self.sidbuffer = RunningWindow(lenstations, self.w)     # window
+        self.previous = None    # last filtered values
         self.n = 0
 
-        self.limit_alloc()
-        self.buffer_alloc()
-        
+        # breach going on per station: start (-1 if none), peak and its value and magnitude
+        self.event_start = numpy.full(lenstations, -1)
+        self.event_peak = numpy.zeros(lenstations, dtype=int)
+        self.event_value = numpy.zeros(lenstations)
+        self.event_magnitude = numpy.zeros(lenstations)
+        self.last_index = 0     # index of the previous reading
+        self.day = None
+
+        # opt-in: no log unless a file name is given, 'yes' for the default one
+        if self.breach_log_name.lower() in ('', 'no'):
+            self.breach_log = None
+        elif self.breach_log_name.lower() == 'yes':
+            self.breach_log = BreachLog("%s%s_breaches.sqlite" % (controller.config.data_path, self.config['site_name']))
+        else:
+            self.breach_log = BreachLog(self.breach_log_name)
 
-    def window_append(self, signal_strengths):
-        """ Fixed window buffer append, pushes at the bottom truncates on top """
-        for bfr, sig in itertools.izip(self.sidbuffer, signal_strengths):
-            bfr.append(sig)            
+        self.limit_alloc()
         
 
     def lowpassfilt(self, signal_strengths, current_index):
         """ Applies exponential smoothing to signal for detection """
         a = self.alpha
-        i = current_index
-
-        for sig, filt in itertools.izip(signal_strengths, self.filtered):
-            if (a >= 1 and a <= 0) or self.n == 0:
-                filt[i] = sig
-            else:
-                filt[i] = filt[i-1] + a * (sig - filt[i-1])
+        if a >= 1 or a <= 0 or self.previous is None:
+            self.previous = signal_strengths
+        else:
+            self.previous = self.previous + a * (signal_strengths - self.previous)
+        self.filtered[:, current_index] = self.previous
 
 
     def compute_limits(self, signal_strengths, current_index):
-        """ Function that computes for the limits and logs breaches """
-        self.window_append(signal_strengths)
+        """ Function that computes for the limits and logs breaches.
+            Return the breach (boolean) and its magnitude (standard deviations) of each station, None if no reading """
+        signal_strengths = numpy.asarray(signal_strengths, dtype=float)
+        if len(signal_strengths) != len(self.filtered):
+            return None  # no reading this time
+        self.sidbuffer.push(signal_strengths)
         self.lowpassfilt(signal_strengths, current_index)
-
-        if self.n < self.w:
-            self.n += 1
-            isFull = False
-        else:
-            isFull = True
-
-        for prs, prq, upl, dnl, bfr, filt, bx, bmx in itertools.izip(self.prevs, self.prevq, self.uplimit, self.dnlimit, self.sidbuffer, self.filtered, self.breach, self.minibreach):
-
-            if isFull:
-                last = bfr.pop(0)   # first entry of buffer
-            else:
-                last = 0            # buffer is still incomplete default to 0
-            
-            new = bfr[-1]
-            s = prs + new - last
-            q = prq + new**2 - last**2
-
-            mean = s/float(self.n)
-            s2n = s**2/float(self.n)
-            o2 = q - s2n
-
-            if self.n > 1:
-                o2 = o2/float(self.n - 1)
-
-            std = numpy.std(o2)
-
-            prs = s
-            prq = q
-
-            ul = mean + self.k*std
-            dl = mean - self.k*std
-
-            if dl <= 0:
-                dl = 0.0
-
-            upl[current_index] = ul
-            dnl[current_index] = dl
-
-            sig = filt[current_index]
-            if (sig >= ul or sig <= dl) and sig != 0.0:
-                
-                bx[current_index] = sig
-                bmx.append([self.sid_file.timestamp[current_index], sig])
-                
-        
+        self.n = self.sidbuffer.count
+
+        mean, std = self.sidbuffer.mean_std()
+        ul = mean + self.k*std
+        dl = numpy.maximum(mean - self.k*std, 0.0)
+
+        self.uplimit[:, current_index] = ul
+        self.dnlimit[:, current_index] = dl
+
+        sig = self.previous     # full precision, the buffers are float32
+        in_breach = ((sig >= ul) | (sig <= dl)) & (sig != 0.0)
+        self.breach[:, current_index] = numpy.where(in_breach, sig, numpy.nan)
+        magnitude = numpy.abs(sig - mean) / numpy.where(std > 0, std, numpy.inf)
+        self.update_events(in_breach, sig, magnitude, current_index)
+        self.last_index = current_index
+        return in_breach, magnitude
+
+    def update_events(self, in_breach, sig, magnitude, current_index):
+        """ Start, extend or end the breach event of each station """
+        going_on = self.event_start >= 0
+        starting = in_breach & ~going_on
+        self.event_start[starting] = current_index
+        higher = starting | (in_breach & (magnitude > self.event_magnitude))
+        self.event_peak[higher] = current_index
+        self.event_value[higher] = sig[higher]
+        self.event_magnitude[higher] = magnitude[higher]
+        self.end_events(going_on & ~in_breach)
+
+    def end_events(self, ending):
+        """ Record the events of the stations 'ending' (boolean per station), ended at the previous reading """
+        ended = [BreachEvent(self.sid_file.stations[station], self.event_start[station], self.event_peak[station],
+                             self.last_index, self.event_value[station], self.event_magnitude[station])
+                 for station in numpy.nonzero(ending)[0]]
+        self.event_start[ending] = -1
+        self.event_magnitude[ending] = 0.0
+        if ended:
+            self.events += ended
+            if self.breach_log:
+                self.controller.logger.saver.submit(self.breach_log.append, self.day, ended)
 
     def control_header(self):
         """ Parse detection parameters """
@@ -124,55 +316,36 @@ class Detect():
         if 'data_path2' in self.config:
             self.data_path = self.config['data_path2']
 
-    def buffer_alloc(self):
-        """ Allocate buffer window """
-        for stations in self.sid_file.stations:
-            self.sidbuffer.append(self.w*[numpy.nan])        
+        self.breach_log_name = self.config.get('breach_log', "")
 
     def limit_alloc(self):
-        """ Rest limits and breach log, invoked at new day """
-        del self.uplimit[:]
-        del self.dnlimit[:]
-
-        del self.filtered[:]
-
-        del self.minibreach[:] 
-        del self.breach[:]
-
-        for stations in self.sid_file.stations:         
-            tmp = ((24*60*60)/self.sid_file.LogInterval)*[numpy.nan]
-            tmp[0] = 0
-            tmp[-1] = 0
-            
-            self.minibreach.append([])      
-            self.breach.append(list(tmp))
-
-            self.uplimit.append(list(tmp))
-            self.filtered.append(list(tmp))
-            self.dnlimit.append(list(tmp))
-        
+        """ Rest limits and breach log, invoked at new day: the buffers are allocated once then refilled """
+        # the events going on end with the finished day
+        self.end_events(self.event_start >= 0)
+        self.events = []
+        self.day = self.sid_file.sid_params['utc_starttime'][:10]
+
+        shape = (len(self.sid_file.stations), (24*60*60)//self.sid_file.LogInterval)
+        if self.breach is None or self.breach.shape != shape:
+            self.breach, self.uplimit, self.filtered, self.dnlimit = \
+                [numpy.empty(shape, dtype=numpy.float32) for _ in range(4)]
+        for buffer in (self.breach, self.uplimit, self.filtered, self.dnlimit):
+            buffer.fill(numpy.nan)
+            buffer[:, 0] = 0
+            buffer[:, -1] = 0
+
+    def close(self):
+        """ Record the events going on at the end of the recording """
+        self.end_events(self.event_start >= 0)
 
     def write_breach(self,filename):
         """ Writes detected anomalies to disk """
         try:
             filename = self.data_path + filename
             sys.stdout.write("Saving  %s" % filename,)
-            with open(filename,'wt') as fout:
-                print(self.controller.logger.sid_file.create_header(True,'raw'),file=fout,end="")
-
-                for row in numpy.transpose(self.breach):
-                    floats_as_strings = ["%.15f" % x for x in row]
-                    print(", ".join(floats_as_strings), file=fout)
-
-                sys.stdout.write("\t[OK]")
-                return True
+            write_breach_log(filename, self.controller.logger.sid_file, self.breach)
+            sys.stdout.write("\t[OK]")
+            return True
         except IOError:
             sys.stdout.write("[ERROR]")
             return False       
-            
-        
-
-
-
-        
-
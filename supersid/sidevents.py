@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+ Name:        sidevents.py
+ Purpose:     Group the breaches found by Detect into flare events.
+
+              A SID disturbs the signal of all the stations received in daylight within minutes, while the
+              breaches of a lone station or of a single reading are mostly noise. FlareDetector follows the
+              breaches reading after reading (constant work per reading) and merges those of all the stations,
+              separated by at most 'gap' quiet readings, into one FlareEvent: onset, peak and recovery times,
+              stations involved and a confidence score in [0, 1]:
+                  coverage * persistence * strength
+              - coverage: part of the stations involved
+              - persistence: 1 - exp(-readings in breach / min_readings)
+              - strength: largest distance from the window's mean, in standard deviations, over 2 * k_distance
+                (at most 1)
+
+              The listeners added by add_listener(listener) are called as listener(kind, event) with kind ONSET
+              at the first breach (event still going on: end is None) and END once recovered. They are called by
+              the sampling thread: they must return at once, e.g. submitting their work to the Logger's saver.
+
+ Created:     18-10-2026
+"""
+from __future__ import print_function   # use the new Python 3 'print' function
+import math
+import shlex
+import subprocess
+from collections import deque, namedtuple
+
+import numpy
+
+ONSET, END = 'onset', 'end'
+
+# onset, peak and end (last reading in breach, None while going on) as utc datetimes
+FlareEvent = namedtuple('FlareEvent', 'onset peak end stations readings peak_magnitude confidence')
+
+
+class FlareDetector(object):
+    """Streaming clustering of the stations' breaches into FlareEvents"""
+    def __init__(self, stations, k_distance, gap=12, min_readings=3, history=100):
+        self.stations = list(stations)
+        self.k_distance = k_distance
+        self.gap = gap
+        self.min_readings = min_readings
+        self.listeners = []
+        self.events = deque(maxlen=history)     # last ended events, for the viewers
+        self._reset()
+
+    def _reset(self):
+        self.onset = None       # no event going on
+        self.last_breach = None
+        self.peak = None
+        self.peak_magnitude = 0.0
+        self.involved = numpy.zeros(len(self.stations), dtype=bool)
+        self.readings = 0       # readings with at least one breach
+        self.quiet = 0          # readings without breach since the last one
+
+    def add_listener(self, listener):
+        """Call listener(kind, event) at the ONSET and at the END of each event"""
+        self.listeners.append(listener)
+
+    def _notify(self, kind, event):
+        for listener in self.listeners:
+            try:
+                listener(kind, event)
+            except Exception as err:    # a failing listener must not stop the sampling
+                print("\nError in flare listener", getattr(listener, '__name__', listener), ":", err)
+
+    @property
+    def current(self):
+        """The event going on (end is None) or None"""
+        if self.onset is None:
+            return None
+        return self._event(None)
+
+    def _event(self, end):
+        coverage = float(self.involved.sum()) / len(self.stations)
+        persistence = 1.0 - math.exp(-self.readings / float(max(self.min_readings, 1)))
+        strength = min(1.0, self.peak_magnitude / (2.0 * self.k_distance)) if self.k_distance > 0 else 1.0
+        return FlareEvent(self.onset, self.peak, end, tuple(s for s, i in zip(self.stations, self.involved) if i),
+                          self.readings, self.peak_magnitude, coverage * persistence * strength)
+
+    def update(self, in_breach, magnitude, utc_time):
+        """Follow one reading: 'in_breach' (boolean) and 'magnitude' (standard deviations) per station"""
+        if numpy.any(in_breach):
+            strongest = float(numpy.max(numpy.where(in_breach, magnitude, 0.0)))
+            starting = self.onset is None
+            if starting:
+                self.onset = self.peak = utc_time
+            if starting or strongest > self.peak_magnitude:
+                self.peak, self.peak_magnitude = utc_time, strongest
+            self.involved |= in_breach
+            self.readings += 1
+            self.quiet = 0
+            self.last_breach = utc_time
+            if starting:
+                self._notify(ONSET, self.current)
+        elif self.onset is not None:
+            self.quiet += 1
+            if self.quiet > self.gap:
+                self.close()
+
+    def close(self):
+        """End the event going on, if any, at its last breach"""
+        if self.onset is not None:
+            event = self._event(self.last_breach)
+            self._reset()
+            self.events.append(event)
+            self._notify(END, event)
+
+
+class CommandNotifier(object):
+    """Listener running a command at the end of each event of confidence at least 'min_confidence'.
+    The command line may use the fields {onset}, {peak}, {end}, {stations}, {readings}, {peak_magnitude}
+    and {confidence} of the event, e.g. 'notify-send "SID {peak} {stations} {confidence:.2f}"'"""
+    def __init__(self, command, min_confidence=0.5):
+        self.command = command
+        self.min_confidence = min_confidence
+
+    def __call__(self, kind, event):
+        if kind == END and event.confidence >= self.min_confidence:
+            fields = event._asdict()
+            fields['stations'] = ",".join(event.stations)
+            # not waited for: the command runs on its own
+            subprocess.Popen([arg.format(**fields) for arg in shlex.split(self.command)])
@@ -13,12 +13,24 @@
 
     20150801:
     - truncate ['utc_starttime'] to 19 chars
+    20261018:
+    - filter_buffer: vectorized sliding minimum, all stations filtered in one 2D pass (no more matplotlib movavg)
+    - native binary format (.sid): write_data_native (utf-8 header), memory-mapped on read, --native/--csv conversions
+    - map_native_buffer: day buffer backed by a native file, durable at each reading
+    - timestamps held as numpy.datetime64 (timestamp64), vectorized parsing, python datetimes only on demand
+    - write_rows: csv data lines formatted by blocks and written at once
+    - snapshot, swap_buffer: hand the buffers over to the background saving thread
+    - prepare_next_day: next day's native file mapped in advance, taken over at midnight by swap_buffer
+    - streaming reader: header parsed line by line, data rows decoded by chunks in a preallocated array (no more self.lines)
 
 """
 from __future__ import print_function   # use the new Python 3 'print' function
-from datetime import datetime, timedelta
+from datetime import datetime
+from os import path
+from copy import copy
+from itertools import chain, islice
 import numpy
-from matplotlib.mlab import movavg
+from numpy.lib.stride_tricks import as_strided
 
 from config import FILTERED, RAW
 
@@ -33,13 +45,19 @@ Provide some utilities to manipulate SID/SuperSID files:
        - both are SuperSID: MERGE in one SuperSID with "station to station" matching
 """
 
-class SidFile():
+class SidFile(object):
     """Class to read SID or SuperSID files.
     Provides header information and data content access.
     """
     _TIMESTAMP_STANDARD = "%Y-%m-%d %H:%M:%S"
     _TIMESTAMP_EXTENDED = "%Y-%m-%d %H:%M:%S.%f"
     _timestamp_format = _TIMESTAMP_STANDARD  # conservative default
+    # Native binary format: text header (same as CSV) padded to _NATIVE_ALIGN bytes followed by
+    # the data matrix as float64 (one row per station) then optionally the timestamps as int64 microseconds
+    _NATIVE_MAGIC = "# SidNative = 1"
+    _NATIVE_EXTENSION = ".sid"
+    _NATIVE_ALIGN = 64
+    _READ_CHUNK = 2048  # number of data lines decoded at once by read_data
 
     def __init__(self, filename = "", sid_params = {}, force_read_timestamp = False):
         """Two ways to create a SIDfile:
@@ -54,25 +72,29 @@ class SidFile():
         """
         self.version = "1.4 20150801"
         self.filename = filename
-        self.sid_params = sid_params    # dictionary of all header pairs
+        self.sid_params = {} if filename else sid_params   # dictionary of all header pairs, own dictionary if read
         self.is_extended = False
         self.timestamp_format = SidFile._TIMESTAMP_STANDARD
+        self.native_filename = None     # set when the day buffer is memory-mapped on a native file
+        self.prepared_day = None        # next day's SidFile mapped in advance by prepare_next_day
+        self._timestamp = None          # python datetime version of self.timestamp64, created on demand
 
         if filename:
-            # Read all lines in a buffer used by 'read_data' and 'read_header'
+            if SidFile.is_native_file(filename):
+                self.read_native()
+                return
+            # Stream the file: header line by line then the data lines by chunks, never the whole file in memory
             try:
                 with open(self.filename, "rt") as fin:
-                    self.lines = fin.readlines()
+                    first_data_line = self.read_header(fin)
+                    self.read_timestamp_format(first_data_line)
+                    self.control_header()
+                    self.read_data(fin, first_data_line, force_read_timestamp)
             except IOError as why:
                 print ("Error reading", filename)
                 print(str(why))
                 exit(1)
 
-            self.read_header()
-            self.read_timestamp_format()
-            self.control_header()
-            self.read_data(force_read_timestamp)
-
         elif self.sid_params:
             # create zeroes numpy arrays to receive data
             self.control_header()
@@ -80,11 +102,27 @@ class SidFile():
     ##
     ##  Read a SID File and control header's consistency
     ##
-    def clear_buffer(self, next_day=False):
-        """creates zeroes numpy arrays to receive data and generates the timestamp vector"""
-        if next_day:
+    def clear_buffer(self, next_day=False, utc_day=None):
+        """creates zeroes numpy arrays to receive data and generates the timestamp vector.
+        The next day is 'utc_day' (a datetime) if given else today (UTC)"""
+        if next_day and self.native_filename:
+            # memory-mapped day buffer: take over the new day's file mapped in advance by prepare_next_day,
+            # no disk access here. The finished day's file stays with the finished day's SidFile.
+            prepared, self.prepared_day = self.prepared_day, None
+            self.set_all_date_attributes(utc_day = utc_day)
+            if prepared is not None and prepared.UTC_StartTime == self.UTC_StartTime \
+                    and prepared.data.shape == self.data.shape:
+                self.data, self.timestamp64 = prepared.data, prepared.timestamp64
+                self.native_filename = prepared.native_filename
+                return
+            # not prepared in time: buffers in memory until mapped with map_native_buffer(keep_data = True)
+            self.native_filename = None
+            self.data = numpy.zeros(self.data.shape)
+            self.generate_timestamp()
+            return
+        elif next_day:
             self.data.fill(0.0)
-            self.set_all_date_attributes()
+            self.set_all_date_attributes(utc_day = utc_day)
         else:
             nb_data_per_day = int ( (24 * 3600) / self.LogInterval)
             self.data = numpy.zeros((len(self.stations), nb_data_per_day))
@@ -118,33 +156,35 @@ class SidFile():
             print ("Warning: Log_Interval is missing! Please check. I assume 5 sec...")
             self.LogInterval, self.sid_params["log_interval"] = 5, 5
 
-    def set_all_date_attributes(self, keep_file_date = False):
+    def set_all_date_attributes(self, keep_file_date = False, utc_day = None):
         if not keep_file_date or "utc_starttime" not in self.sid_params:
-            utcnow = datetime.utcnow()
+            utcnow = utc_day or datetime.utcnow()
             self.sid_params["utc_starttime"] = "%d-%02d-%02d 00:00:00" % (utcnow.year, utcnow.month, utcnow.day)
             if SidFile._timestamp_format == SidFile._TIMESTAMP_EXTENDED:
                 self.sid_params["utc_starttime"] += ".00000"
         self.UTC_StartTime = self.sid_params["utc_starttime"]
         self.startTime = SidFile._StringToDatetime(self.sid_params["utc_starttime"])
 
-    def read_header(self):
+    def read_header(self, lines):
         """Reads the first lines of a SID file to extract the 'sid_params'.
-        No more file access: all in memory using 'self.lines'
+        'lines' is an open file or any iterable of lines, consumed up to the first data line which is returned
+        ("" if there is none).
         """
         self.sid_params.clear()
         self.headerNbLines = 0  # number of header lines
-        for line in self.lines:
-            if line[0] != "#": break   # end of header
+        for line in lines:
+            if line[0] != "#": return line   # end of header
             self.headerNbLines += 1
             tokens = line.split("=")
             if len(tokens) == 2:
                 # remove the '#' and force the key to lower case to avoid ambiguity from user's supersid.cfg
                 key = tokens[0][1:].strip().lower()
                 self.sid_params[key] = tokens[1].strip()
+        return ""
 
-    def read_timestamp_format(self):
-        """Check the timestamp found on the first line to deduce the timestamp format"""
-        first_data_line = self.lines[self.headerNbLines].split(",")
+    def read_timestamp_format(self, first_data_line):
+        """Check the timestamp found on the first data line to deduce the timestamp format"""
+        first_data_line = first_data_line.split(",")
         if ':' in first_data_line[0]: # yes, a time stamp is found in the first data column
             try:
                 datetime.strptime(first_data_line[0], SidFile._TIMESTAMP_EXTENDED)
@@ -157,45 +197,135 @@ class SidFile():
                 SidFile._timestamp_format = SidFile._TIMESTAMP_STANDARD
                 self.timestamp_format = SidFile._TIMESTAMP_STANDARD
 
-    def read_data(self, force_read_timestamp = False):
-        """Using the self.lines buffer, converts the data lines in numpy arrays.
+    def read_data(self, fin, first_data_line, force_read_timestamp = False):
+        """Converts the data lines of the open file 'fin', starting with 'first_data_line', in numpy arrays.
             - One array self.data for the data (one column/vector per station)
-            - One array self.timestamp for the timestamps (i.e. timestamp vector)
+            - One array self.timestamp64 for the timestamps (i.e. timestamp vector)
+        Lines are decoded by chunks of _READ_CHUNK straight into arrays preallocated for one day of data,
+        enlarged if the file holds more, so that memory stays proportional to the result.
         Reading method differs accordingly to the self.isSuperSID flag
         New: Extended format supports a timestamp for SuperSID format as well as .%f for second decimals
         """
-        # necessary to convert timestamp string (extended or not) to datetime AND decode byte array to string to float for python 3
-        converters_dict = {0: SidFile._StringToDatetime }
-        for i in range(len(self.stations)):
-            converters_dict[i+1] = SidFile._StringToFloat
-
+        has_timestamp = not self.isSuperSID or self.is_extended
         if self.isSuperSID and not self.is_extended:
             # classic SuperSID file format: one data column per station, no time stamp (has to be generated)
             print ("Warning: read SuperSid non extended file and generate time stamps.")
-            self.data = numpy.loadtxt(self.lines, comments='#', delimiter=",").transpose()
-            self.generate_timestamp()
-        elif self.isSuperSID and self.is_extended:
+        elif self.isSuperSID:
             # extended SuperSID file format: one extended time stamp then one data column per station
             print ("Warning: read SuperSid extended file, time stamps are read & converted from file.")
-            inData = numpy.loadtxt(self.lines, dtype=datetime, comments='#', delimiter=",", converters=converters_dict)
-            self.timestamp = inData[:,0] # column 0
-            self.data = numpy.array(inData[:,1:], dtype=float).transpose()
-        else:
-            # classic SID file format:
-            # two columns file: [timestamp, data]. Try to avoid reading timestamps: date str to num conversion takes time
-            # self.data must still be a 2 dimensions numpy.array even so only one vector is contained
-            if len(self.lines) - self.headerNbLines != (60 * 60 * 24) / self.LogInterval  \
-            or force_read_timestamp or self.is_extended:
-                print ("Warning: read SID file, timestamps are read & converted from file.")
-                inData = numpy.loadtxt(self.lines, dtype=datetime, comments='#', delimiter=",", converters=converters_dict)
-                self.timestamp = inData[:,0] # column 0
-                self.data = numpy.array(inData[:,1], dtype=float, ndmin=2) # column 1
+        # classic SID file format: two columns file [timestamp, data]
+        nb_values = len(first_data_line.split(",")) - (1 if has_timestamp else 0)
+        nb_rows = int((24 * 3600) / self.LogInterval)
+        data = numpy.empty((nb_rows, nb_values))
+        t_stamps = numpy.empty(nb_rows, dtype='datetime64[us]') if has_timestamp else None
+        nb_read = 0
+        lines = chain([first_data_line], fin)
+        while True:
+            chunk = list(islice(lines, SidFile._READ_CHUNK))
+            if not chunk:
+                break
+            cells = numpy.array([line.split(",") for line in chunk if line.strip() and line[0] != "#"])
+            if len(cells) == 0:
+                continue
+            if nb_read + len(cells) > len(data):  # more lines than expected: enlarge in place
+                nb_rows = max(2 * nb_rows, nb_read + len(cells))
+                data.resize((nb_rows, nb_values), refcheck=False)
+                if has_timestamp:
+                    t_stamps.resize(nb_rows, refcheck=False)
+            if has_timestamp:
+                t_stamps[nb_read:nb_read + len(cells)] = SidFile._StringsToDatetime64(cells[:,0]) # column 0
+                data[nb_read:nb_read + len(cells)] = cells[:,1:].astype(float)
             else:
-                print ("Optimization: read SID file, generate timestamp instead of reading & converting them from file.")
-                self.data = numpy.array(numpy.loadtxt(self.lines, comments='#', delimiter=",", usecols=(1,)), ndmin=2) # only read data column
-                self.generate_timestamp()
+                data[nb_read:nb_read + len(cells)] = cells.astype(float)
+            nb_read += len(cells)
+        if nb_read != nb_rows:  # partial day: release the unused rows
+            data.resize((nb_read, nb_values), refcheck=False)
+            if has_timestamp:
+                t_stamps.resize(nb_read, refcheck=False)
+        self.data = data.transpose()
+
+        if self.isSuperSID and not self.is_extended:
+            self.generate_timestamp()
+        elif self.isSuperSID or nb_read != (60 * 60 * 24) / self.LogInterval or force_read_timestamp or self.is_extended:
+            if not self.isSuperSID:
+                print ("Warning: read SID file, timestamps are read & converted from file.")
+            self.timestamp64 = t_stamps
+        else:
+            # a complete day of data: keep the regular timestamps, immune to rounding in the file
+            print ("Optimization: read SID file, generate timestamp instead of reading & converting them from file.")
+            self.generate_timestamp()
         #print("self.data.shape =", self.data.shape)
 
+    @classmethod
+    def is_native_file(cls, filename):
+        """Return True if 'filename' is written in the native binary format"""
+        try:
+            with open(filename, "rb") as fin:
+                return fin.read(len(SidFile._NATIVE_MAGIC)) == SidFile._NATIVE_MAGIC.encode('ascii')
+        except IOError:
+            return False
+
+    @classmethod
+    def _native_data_offset(cls, filename):
+        """Return the position of the data matrix in a native binary file"""
+        with open(filename, "rb") as fin:
+            fin.readline()  # magic
+            return int(fin.readline().decode('utf-8').split("=")[1])
+
+    def read_native(self):
+        """Read a native binary file: the header is parsed as for the CSV formats,
+        the data (and the timestamps if present) are memory-mapped, not read.
+        The map is copy-on-write: changes to self.data are never written back to the file.
+        """
+        try:
+            data_offset = SidFile._native_data_offset(self.filename)
+            with open(self.filename, "rb") as fin:
+                self.read_header(fin.read(data_offset).decode('utf-8').splitlines(True))
+        except (IOError, ValueError, IndexError) as why:
+            print ("Error reading", self.filename)
+            print(str(why))
+            exit(1)
+        self.control_header()
+        nb_stations, nb_data = [int(x) for x in self.sid_params['datashape'].split(",")]
+        self.data = numpy.memmap(self.filename, dtype='<f8', mode='c', offset=data_offset, shape=(nb_stations, nb_data))
+        self.is_extended = self.sid_params.get('timestamps', 'no') == 'yes'
+        if self.is_extended:
+            self.timestamp_format = SidFile._TIMESTAMP_EXTENDED
+            t_stamps = numpy.memmap(self.filename, dtype='<i8', mode='c', shape=(nb_data,),
+                                    offset=data_offset + self.data.nbytes)
+            self.timestamp64 = t_stamps.view('datetime64[us]')
+        else:
+            self.generate_timestamp()
+
+    @property
+    def timestamp(self):
+        """Timestamps as an array of python datetime, only created from self.timestamp64 when a caller asks for it"""
+        if self._timestamp is None:
+            self._timestamp = self.timestamp64.astype(datetime)
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, timestamps):
+        self.timestamp64 = numpy.array(timestamps, dtype='datetime64[us]')
+
+    @property
+    def timestamp64(self):
+        """Timestamps as a numpy.datetime64 array (microseconds)"""
+        return self._timestamp64
+
+    @timestamp64.setter
+    def timestamp64(self, timestamps):
+        self._timestamp64 = timestamps
+        self._timestamp = None
+
+    @classmethod
+    def _StringsToDatetime64(cls, strTimestamps):
+        """Convert a vector of timestamp strings, standard or extended, in one numpy.datetime64 array"""
+        try:
+            return numpy.array(numpy.char.strip(strTimestamps), dtype='datetime64[us]')
+        except ValueError: # not ISO like: let's convert one by one
+            return numpy.array([SidFile._StringToDatetime(t) for t in strTimestamps], dtype='datetime64[us]')
+
     @classmethod
     def _StringToDatetime(cls, strTimestamp):
         if type(strTimestamp) is not str: # i.e. byte array in Python 3
@@ -217,13 +347,74 @@ class SidFile():
 
     def generate_timestamp(self):
         """Create the timestamp vector by adding LogInterval seconds to UTC_StartTime"""
-        self.timestamp = numpy.empty(len(self.data[0]), dtype=datetime)
-        # add 'interval' seconds to UTC_StartTime for each entries
-        interval =  timedelta(seconds=self.LogInterval)
-        currentTimestamp = self.startTime
-        for i in range(len(self.timestamp)):
-            self.timestamp[i] =  currentTimestamp
-            currentTimestamp += interval
+        self.timestamp64 = numpy.datetime64(self.startTime, 'us') + \
+                           numpy.arange(len(self.data[0])) * numpy.timedelta64(self.LogInterval, 's')
+
+    def map_native_buffer(self, filename, keep_data = False):
+        """Back the day buffer (data and timestamps) by the native binary file 'filename' opened in read/write mode:
+        every change made to self.data is in the file at once, there is no need to save the buffers.
+        If 'filename' already holds this day with the same stations then its content is resumed
+        (restart after a crash) unless 'keep_data' requests to write the current buffers over it.
+        """
+        resume = False
+        if not keep_data and SidFile.is_native_file(filename):
+            previous = SidFile(filename)
+            resume = previous.stations == self.stations and previous.data.shape == self.data.shape \
+                     and previous.is_extended and previous.UTC_StartTime[:19] == self.UTC_StartTime[:19]
+            del previous
+            print("Resume recording from" if resume else "Overwrite", filename)
+        if not resume:
+            self.write_data_native(filename, RAW, extended = True)
+        data_offset = SidFile._native_data_offset(filename)
+        self.data = numpy.memmap(filename, dtype='<f8', mode='r+', offset=data_offset, shape=self.data.shape)
+        self.timestamp64 = numpy.memmap(filename, dtype='<i8', mode='r+', shape=(self.data.shape[1],),
+                                        offset=data_offset + self.data.nbytes).view('datetime64[us]')
+        self.native_filename = filename
+
+    def prepare_next_day(self, utc_day):
+        """Create and map the native file of the day 'utc_day' next to the mapped day buffer, e.g. from the saving
+        thread before midnight: clear_buffer(next_day = True) then takes it over without disk access"""
+        next_day = copy(self)
+        next_day.sid_params = dict(self.sid_params)
+        next_day.prepared_day = None
+        next_day.set_all_date_attributes(utc_day = utc_day)
+        next_day.data = numpy.zeros(self.data.shape)
+        next_day.generate_timestamp()
+        next_day.map_native_buffer(path.join(path.dirname(self.native_filename), next_day.get_native_filename()))
+        self.prepared_day = next_day
+
+    def snapshot(self):
+        """Return a copy of this SidFile with its own copy of the buffers, e.g. to save them from another thread"""
+        snap = copy(self)
+        snap.sid_params = dict(self.sid_params)
+        snap.native_filename = None  # the copy is in memory
+        snap.prepared_day = None
+        snap.data = numpy.array(self.data)
+        snap.timestamp64 = numpy.array(self.timestamp64)
+        return snap
+
+    def swap_buffer(self, utc_day = None):
+        """Pass to the next day ('utc_day' if given else today) without copy: return a SidFile holding the finished
+        day's buffers and give new cleared buffers to this SidFile (mapped on the new day's file if memory-mapped)"""
+        finished_day = copy(self)
+        finished_day.sid_params = dict(self.sid_params)
+        if not self.native_filename:
+            self.data = numpy.zeros(self.data.shape)
+        self.clear_buffer(next_day = True, utc_day = utc_day)
+        return finished_day
+
+    def set_timestamp(self, index, utc_time):
+        """Record the time of the reading at position 'index' (in the mapped file too if any)"""
+        self.timestamp64[index] = numpy.datetime64(utc_time, 'us')
+        if self._timestamp is not None:
+            self._timestamp[index] = utc_time
+
+    def flush(self):
+        """Force the memory-mapped day buffer to be written on disk. Nothing to do if not mapped."""
+        if self.native_filename:
+            self.data.flush()
+            self.timestamp64.base.flush()
+
     ##
     ##  Facilitator functions
     ##
@@ -237,6 +428,10 @@ class SidFile():
         site = self.sid_params['site_name'] if 'site_name' in self.sid_params else self.sid_params['site']
         return "%s_%s.csv" % (site, self.sid_params["utc_starttime"][:10])
 
+    def get_native_filename(self):
+        """Return a file name as <Site Name>_<UTC Start Date>.sid like RASPI_2013-08-31.sid"""
+        return self.get_supersid_filename()[:-4] + SidFile._NATIVE_EXTENSION
+
     def get_station_data(self, stationId):
         """Return the numpy array of the given station's data"""
         try:
@@ -270,7 +465,7 @@ class SidFile():
                 # missing station in the second file
                 pass
         if has_copied:
-            self.timestamp = second_sidfile.timestamp[:] # deep copy
+            self.timestamp64 = numpy.array(second_sidfile.timestamp64) # deep copy
 
     ##
     ##  Write a SID File
@@ -326,9 +521,7 @@ class SidFile():
             hdr = self.create_header(isSuperSid = False, log_type = log_type)
             print(hdr, file=fout, end="")
             # generate the "timestamp, data" serie i.e. data lines
-            timestamp_format = SidFile._TIMESTAMP_EXTENDED if extended else SidFile._TIMESTAMP_STANDARD ###"%Y-%m-%d %H:%M:%S.%f" if extended else "%Y-%m-%d %H:%M:%S"
-            for t_stamp, x in zip(self.timestamp, tmp_data):
-                print("%s, %.15f" % (t_stamp.strftime(timestamp_format), x), file=fout)
+            SidFile.write_rows(fout, tmp_data, self.timestamp64, extended)
 
     def write_data_supersid(self, filename, log_type, apply_bema = True, extended = False, bema_wing = 6):
         """Write the SuperSID file. Attention: self.sid_params must contain all expected entries."""
@@ -341,24 +534,61 @@ class SidFile():
             if log_type == RAW or apply_bema == False:
                 tmp_data = self.data
             else: # filtered
-                tmp_data = []
-                for stationData in self.data:
-                    tmp_data.append(SidFile.filter_buffer(stationData, self.LogInterval, bema_wing = bema_wing))
-                tmp_data = numpy.array(tmp_data)
+                tmp_data = SidFile.filter_buffer(self.data, self.LogInterval, bema_wing = bema_wing)
             #print(tmp_data.shape)  # should be like (2, 17280)
-            if extended:
-                for t_stamp, row in zip(self.timestamp, numpy.transpose(tmp_data)):
-                    floats_as_strings = ["%.15f" % x for x in row]
-                    print( t_stamp.strftime(SidFile._TIMESTAMP_EXTENDED+","), ", ".join(floats_as_strings), file=fout)
-            else:
-                for row in numpy.transpose(tmp_data):
-                    floats_as_strings = ["%.15f" % x for x in row]
-                    print(", ".join(floats_as_strings), file=fout)
+            SidFile.write_rows(fout, tmp_data, self.timestamp64 if extended else None, extended)
 
-        # append data to file using numpy function (symmetric to loadtxt)
-        # note for future: version 1.7 offers "header=hdr" as new function parameter
-        # but for now (1.6) we write header first then savetxt() append data lines
-        #numpy.savetxt(filename, tmp_data, delimiter=",", newline="\n", header=hdr)
+    @classmethod
+    def write_rows(cls, fout, data, timestamps64 = None, extended = False, block_size = 4096):
+        """Write the data lines "[timestamp, ]value1, value2..." in one call to fout.write().
+        'data' is one station's vector or one row per station; each line is one column of 'data' with
+        values as "%.15f" and the timestamp (standard or extended format) only if 'timestamps64' is given.
+        Lines are formatted by blocks with one '%' operation per block instead of one per value.
+        """
+        data = numpy.atleast_2d(data)
+        nb_values, nb_lines = data.shape
+        line_format = ", ".join(["%.15f"] * nb_values) + "\n"
+        if timestamps64 is not None:
+            line_format = "%s, " + line_format
+            # datetime_as_string gives "YYYY-MM-DDTHH:MM:SS[.ffffff]" i.e. strftime(_TIMESTAMP_EXTENDED/STANDARD) with a T
+            str_timestamps = numpy.char.replace(numpy.datetime_as_string(timestamps64[:nb_lines],
+                                                                         unit='us' if extended else 's'), 'T', ' ')
+            columns = numpy.empty((nb_lines, nb_values + 1), dtype=object)
+            columns[:, 0] = str_timestamps
+            columns[:, 1:] = data.T
+        else:
+            columns = data.T
+        blocks = []
+        for start in range(0, nb_lines, block_size):
+            block = columns[start:start+block_size]
+            blocks.append((line_format * len(block)) % tuple(block.ravel().tolist()))
+        fout.write("".join(blocks))
+
+    def write_data_native(self, filename, log_type = RAW, apply_bema = False, extended = True, bema_wing = 6, header = None):
+        """Write the native binary file: same header as the CSV formats followed by the raw float64 data matrix.
+        Timestamps are stored only if 'extended' else they are generated from UTC_StartTime and LogInterval on read.
+        Keep 'log_type' RAW (default) so that the filtered CSV formats can be generated later from this file.
+        'header' can replace the header lines built by create_header() e.g. to keep all the entries of a read file.
+        """
+        if log_type == RAW or apply_bema == False:
+            tmp_data = self.data
+        else: # filtered
+            tmp_data = SidFile.filter_buffer(self.data, self.LogInterval, bema_wing = bema_wing)
+        hdr = header or self.create_header(isSuperSid = self.isSuperSID, log_type = log_type)
+        hdr += "# DataShape = %d,%d\n" % tmp_data.shape
+        hdr += "# Timestamps = %s\n" % ("yes" if extended else "no")
+        # utf-8 header: site, contact... may not be ascii. Lengths and padding are counted in bytes.
+        hdr = hdr if isinstance(hdr, bytes) else hdr.encode('utf-8')
+        # magic + offset line of fixed length, then pad the header with a comment line to align the data
+        hdr_len = len(SidFile._NATIVE_MAGIC) + len("\n# DataOffset = 0000000000\n") + len(hdr) + len("#\n")
+        data_offset = -(-hdr_len // SidFile._NATIVE_ALIGN) * SidFile._NATIVE_ALIGN
+        with open(filename, "wb") as fout:
+            fout.write(("%s\n# DataOffset = %010d\n" % (SidFile._NATIVE_MAGIC, data_offset)).encode('ascii'))
+            fout.write(hdr)
+            fout.write(("#%s\n" % (" " * (data_offset - hdr_len))).encode('ascii'))
+            fout.write(numpy.ascontiguousarray(tmp_data, dtype='<f8').tobytes())
+            if extended:
+                fout.write(self.timestamp64.astype('<i8').tobytes())
 
     @classmethod
     def filter_buffer(cls, raw_buffer, data_interval, bema_wing = 6, gmt_offset = 0):
@@ -366,32 +596,43 @@ class SidFile():
             Return bema filtered version of the buffer, with optional time_zone_offset.
             bema filter uses the minimal found value to represent the data points within a range (bema_window)
             bema_wing = 6 => window = 13 (bema_wing + evaluating point + bema_wing)
+            'raw_buffer' can be one station's vector or a 2 dimensions array (one row per station, like self.data):
+            all rows are then filtered in one pass and the result has the same shape as 'raw_buffer'.
             '''
-            length = len(raw_buffer)
-            # Extend 2 wings to the raw data buffer before taking min and average
-            dstack = numpy.hstack((raw_buffer[length-bema_wing:length],
-                                   raw_buffer[0:length],
-                                   raw_buffer[0:bema_wing]))
-            # Fill the 2 wings with the values at the edge
-            dstack[0:bema_wing] = raw_buffer[0]  #  dstack[bema_wing]
-            dstack[length+bema_wing:length+bema_wing*2] = raw_buffer[-1]  # dstack[length+bema_wing-1]
+            raw_buffer = numpy.asarray(raw_buffer, dtype=float)
+            one_station = raw_buffer.ndim == 1
+            rows = numpy.atleast_2d(raw_buffer)
+            length = rows.shape[1]
+            # Extend 2 wings to the raw data buffer filled with the values at the edge
+            dstack = numpy.hstack((numpy.repeat(rows[:, :1], bema_wing, axis=1),
+                                   rows,
+                                   numpy.repeat(rows[:, -1:], bema_wing, axis=1)))
             # Use the lowest point found in window to represent its value
-            dmin = numpy.zeros(len(dstack))
-            for i in range(bema_wing, length+bema_wing):
-                dmin[i] = min(dstack[i-bema_wing:i+bema_wing])
+            # window of point i is dstack[i-bema_wing:i+bema_wing] i.e. 2*bema_wing values for all i in one pass
+            dmin = numpy.empty_like(dstack)
+            dmin[:, bema_wing:length+bema_wing] = SidFile._sliding_windows(dstack[:, :length+2*bema_wing-1],
+                                                                           2*bema_wing).min(axis=2)
             # The points beyond the left edge, set to the starting point value
-            dmin[0:bema_wing] = dmin[bema_wing]
+            dmin[:, 0:bema_wing] = dmin[:, bema_wing:bema_wing+1]
             # The points beyond the right edge, set to the ending point value
-            dmin[length+bema_wing:length+bema_wing*2] = dmin[length+bema_wing-1]
+            dmin[:, length+bema_wing:length+bema_wing*2] = dmin[:, length+bema_wing-1:length+bema_wing]
             # Moving Average. This actually truncates array to original size
-            daverage = movavg(dmin, (bema_wing*2+1))
-
-            if gmt_offset == 0:
-                return daverage
-            else:
-                gmt_mark = gmt_offset * (60/data_interval) * 60
-                doffset = numpy.hstack((daverage[gmt_mark:length],daverage[0:gmt_mark]))
-                return doffset
+            kernel = numpy.empty(bema_wing*2+1)
+            kernel.fill(1.0/(bema_wing*2+1))
+            daverage = numpy.array([numpy.convolve(row, kernel, mode='valid') for row in dmin])
+
+            if gmt_offset != 0:
+                gmt_mark = int(gmt_offset * (60/data_interval) * 60)
+                daverage = numpy.hstack((daverage[:, gmt_mark:length], daverage[:, 0:gmt_mark]))
+            return daverage[0] if one_station else daverage
+
+    @staticmethod
+    def _sliding_windows(rows, width):
+        """Return a read-only (rows, positions, width) view of all the 'width' long windows of each row, no copy"""
+        nb_rows, length = rows.shape
+        rows = numpy.ascontiguousarray(rows)
+        return as_strided(rows, shape=(nb_rows, length - width + 1, width),
+                          strides=(rows.strides[0], rows.strides[1], rows.strides[1]), writeable=False)
 
 ##-------------------------------------------------------------------------------
 ##  This module can be used alone as a utility to manipulate SID Files
@@ -420,11 +661,24 @@ if __name__ == '__main__':
                             help="Display information about one file")
     parser.add_argument("-f", "--filter", dest="filename_filter", required=False, type=exist_file,
                             help="Filter a raw file")
-    parser.add_argument("-b", "--bema_wing", dest="bema_wing", required=False, type=int, default=6,
+    parser.add_argument("-n", "--native", dest="filename_native", required=False, type=exist_file,
+                            help="Convert a SID/SuperSID csv file to the native binary format (.sid)")
+    parser.add_argument("-c", "--csv", dest="filename_csv", required=False, type=exist_file,
+                            help="Convert a native binary file (.sid) to its csv format, filtered if --bema_wing is given")
+    parser.add_argument("-b", "--bema_wing", dest="bema_wing", required=False, type=int, default=None,
                             help="Width of the window used in filtering a.k.a. 'bema_wing' (default=6)")
+    parser.add_argument("--no_cache", action="store_false", dest="use_cache", default=True,
+                            help="Parse the file even if it is in the cache of parsed files (see sidcache.py)")
     args, unk = parser.parse_known_args()
+    # files are parsed only once and kept as binary in the cache: see sidcache.py
+    if args.use_cache:
+        from sidcache import SidCache
+        SidFileLoader = SidCache().load
+    else:
+        SidFileLoader = lambda filename: SidFile(filename, force_read_timestamp = True)
+
     if args.filename_info:
-        sid = SidFile(args.filename_info, force_read_timestamp = True)
+        sid = SidFileLoader(args.filename_info)
         print("-" * 5, "Header information", "-" * 5)
         if sid.is_extended:
             print("Time stamps are extended.")
@@ -451,7 +705,7 @@ if __name__ == '__main__':
     # Some 'real' manipulations:
     elif args.filename_split:
         # Explode this SuperSID file in one file per station in SID format
-        sid = SidFile(args.filename_split, force_read_timestamp = True)
+        sid = SidFileLoader(args.filename_split)
         print("Proceed to split this SuperSID file in %d SID files:" % sid.data.shape[0])
         for station in sid.stations:
             fname = "%s/%s_%s_%s.split.csv" % (path.dirname(sid.filename),
@@ -462,7 +716,7 @@ if __name__ == '__main__':
             print(fname, "created.")
     elif args.filename_merge:
         # Merge 2 SuperSID files station by station
-        sid1, sid2 = SidFile(args.filename_merge[0]), SidFile(args.filename_merge[1])
+        sid1, sid2 = SidFileLoader(args.filename_merge[0]), SidFileLoader(args.filename_merge[1])
         if sid1.isSuperSID and sid2.isSuperSID:
             for istation in range(len(sid1.stations)):
                 sid1.data[:, istation] += sid2.get_station_data(sid1.stations[istation])
@@ -491,14 +745,32 @@ if __name__ == '__main__':
     elif args.filename_filter:
         # Convert a RAW file into a Filtered one. Can filter an already filtered file too...
         # optional parameter --bema_wing can be specified
-        sid = SidFile(args.filename_filter, force_read_timestamp = True)
+        sid = SidFileLoader(args.filename_filter)
         fname = "%s.filtered%s" % path.splitext(args.filename_filter)
         if sid.sid_params['logtype'] != RAW:
             print("Warning: %s is not a raw file. This might filter an already filtered file." % args.filename_filter)
-        bema_wing = args.bema_wing if args.bema_wing else 6
+        bema_wing = args.bema_wing or 6
         if sid.isSuperSID:
             sid.write_data_supersid(fname, log_type=FILTERED, apply_bema = True, extended = sid.is_extended, bema_wing=bema_wing)
         else:
             sid.write_data_sid(sid.stations[0], fname, log_type=FILTERED, apply_bema = True, extended = sid.is_extended, bema_wing=bema_wing)
+    elif args.filename_native:
+        # Convert a csv file to the native binary format, keeping its log type
+        sid = SidFileLoader(args.filename_native)
+        fname = path.splitext(args.filename_native)[0] + SidFile._NATIVE_EXTENSION
+        sid.write_data_native(fname, log_type=sid.sid_params['logtype'], extended = sid.is_extended)
+        print(fname, "created.")
+    elif args.filename_csv:
+        # Generate the csv file(s) from a native binary file e.g. before upload
+        sid = SidFile(args.filename_csv)
+        log_type = FILTERED if args.bema_wing else sid.sid_params['logtype']
+        fname = path.splitext(args.filename_csv)[0] + ".csv"
+        if sid.isSuperSID:
+            sid.write_data_supersid(fname, log_type, apply_bema = bool(args.bema_wing), extended = sid.is_extended,
+                                    bema_wing = args.bema_wing)
+        else:
+            sid.write_data_sid(sid.stations[0], fname, log_type, apply_bema = bool(args.bema_wing), extended = sid.is_extended,
+                               bema_wing = args.bema_wing)
+        print(fname, "created.")
     else:
         parser.print_help()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""
+ Name:        sidpsd.py
+ Purpose:     Power Spectral Density estimation for the signal strengths of the monitored stations.
+
+              WelchAccumulator averages the periodograms of all the NFFT long segments of a continuous
+              stream of samples, i.e. of the whole log interval instead of one second only: the variance
+              of each reading is divided by the number of averaged segments for the same cost per sample.
+              The result is scaled as matplotlib.mlab.psd() (Hanning window, no overlap, one-sided density)
+              so that the readings stay comparable with the ones of the one second snapshots.
+
+              TargetedDFT gives the same values for the monitored bins only: each segment is projected on the
+              windowed complex exponentials of these bins (what the Goertzel algorithm computes, here done for
+              all segments by one matrix product). Cheaper than the full FFT for a handful of stations.
+
+              PSD_BACKENDS registers the factories of psd(data, NFFT, Fs) selectable with 'psd_backend':
+              numpy, scipy (multi-threaded FFT), pyfftw (planned FFT) and welch (scipy.signal.welch) keep their
+              window and FFT plan from one call to the next; mlab is matplotlib.mlab.psd, the reference.
+              Only the selected backend's library is imported.
+
+              The window ('psd_window') and the overlap of the segments ('psd_overlap', in samples) are
+              configurable; the density is scaled by the window's power as mlab.psd() does for any window.
+
+              BinReader reads the signal strength of each station from Pxx with the frequency to bin mapping
+              calculated once: historical truncated bin, nearest bin, parabolic interpolation of the peak or
+              power sum of the bins around the station's frequency.
+
+              Multi-channel: samples given as a (channels, samples) array are processed in one batched FFT
+              (one transform call for the segments of all channels); Pxx is then a (channels, bins) array
+              and BinReader reads each station in the row of its channel.
+
+ Created:     18-10-2026
+"""
+from __future__ import print_function   # use the new Python 3 'print' function
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+
+def numpy_rfft():
+    """Return a function computing the FFT of the rows of a real array with numpy"""
+    return lambda segments: numpy.fft.rfft(segments, axis=-1)
+
+
+def scipy_rfft():
+    """Return a function computing the FFT of the rows of a real array with scipy, on all the CPUs"""
+    import scipy.fft
+    return lambda segments: scipy.fft.rfft(segments, axis=-1, workers=-1)
+
+
+def pyfftw_rfft():
+    """Return a function computing the FFT of the rows of a real array with FFTW,
+    with one plan per shape of array, created at the first call then reused"""
+    import pyfftw
+    plans = {}
+    def rfft(segments):
+        if segments.shape not in plans:
+            plans[segments.shape] = pyfftw.builders.rfft(pyfftw.empty_aligned(segments.shape), axis=-1,
+                                                         threads=pyfftw.config.NUM_THREADS)
+        return plans[segments.shape](segments)
+    return rfft
+
+
+FFT_BACKENDS = {'numpy': numpy_rfft, 'scipy': scipy_rfft, 'pyfftw': pyfftw_rfft}
+
+# window functions selectable with 'psd_window': name -> function(NFFT) returning the window's array
+WINDOWS = {'hanning': numpy.hanning,    # as matplotlib.mlab.window_hanning, the historical window
+           'hamming': numpy.hamming,
+           'blackman': numpy.blackman,
+           'rectangular': numpy.ones,
+           }
+
+
+class WelchAccumulator(object):
+    """Accumulate the periodograms of consecutive segments of NFFT samples and return their average.
+    Consecutive segments start every NFFT - noverlap samples.
+    Samples left over after the last complete segment are kept for the next call to add(): no sample is lost.
+    With channels > 1, add() takes (channels, samples) arrays and psd() returns a (channels, bins) Pxx.
+    """
+    BLOCK = 256     # number of segments transformed at once by add(), to bound the memory used
+
+    def __init__(self, NFFT, Fs, fft = 'numpy', window = 'hanning', noverlap = 0, channels = 1):
+        self.NFFT = NFFT
+        self.Fs = Fs
+        self.channels = channels
+        self.leading_shape = (channels,) if channels > 1 else ()   # one row per channel, mono stays 1-D
+        self.noverlap = noverlap
+        self.step = NFFT - noverlap
+        self.rfft = FFT_BACKENDS[fft]()
+        self.window = WINDOWS[window](NFFT)
+        self.scale = 1.0 / (Fs * (self.window ** 2).sum())
+        self.freqs = numpy.fft.rfftfreq(NFFT, 1.0 / Fs)
+        self.clear()
+
+    def reset(self):
+        """Start a new average (the left over samples are kept)"""
+        self.power_sum = numpy.zeros(self.leading_shape + (self.NFFT // 2 + 1,))
+        self.nb_segments = 0
+
+    def add(self, samples):
+        """Add the periodograms of all the complete segments found in the left over samples followed by 'samples'"""
+        samples = numpy.concatenate((self.remainder, samples), axis=-1) if self.remainder.shape[-1] \
+                  else numpy.ascontiguousarray(samples)
+        length = samples.shape[-1]
+        nb_segments = (length - self.noverlap) // self.step if length >= self.NFFT else 0
+        # overlapping segments of each channel as a read only view of the samples: no copy
+        item = samples.strides[-1]
+        segments = as_strided(samples, shape=samples.shape[:-1] + (nb_segments, self.NFFT),
+                              strides=samples.strides[:-1] + (self.step * item, item))
+        for start in range(0, nb_segments, WelchAccumulator.BLOCK):
+            self.power_sum += self.segments_power(segments[..., start:start + WelchAccumulator.BLOCK, :])
+        self.nb_segments += nb_segments
+        self.remainder = numpy.array(samples[..., nb_segments * self.step:], dtype=float)
+
+    def clear(self):
+        """Start a new average without the left over samples i.e. the next samples are not contiguous"""
+        self.remainder = numpy.empty(self.leading_shape + (0,))
+        self.reset()
+
+    def segments_power(self, segments):
+        """Return the sum of the periodograms (not scaled) of the segments, per channel"""
+        spectrum = self.rfft(segments * self.window)
+        return (spectrum.real ** 2 + spectrum.imag ** 2).sum(axis=-2)
+
+    def psd(self, reset=True):
+        """Return (Pxx, freqs): the average one-sided density of the segments added since the last reset"""
+        Pxx = self.power_sum * (self.scale / max(self.nb_segments, 1))
+        # one-sided: the power of the negative frequencies is added, except for DC and Nyquist (even NFFT)
+        Pxx[..., 1:-1 if self.NFFT % 2 == 0 else None] *= 2
+        if reset:
+            self.reset()
+        return Pxx, self.freqs
+
+
+class TargetedDFT(WelchAccumulator):
+    """WelchAccumulator evaluating only the given bins: the other values of Pxx are NaN"""
+
+    def __init__(self, NFFT, Fs, bins, window = 'hanning', noverlap = 0, channels = 1):
+        self.bins = numpy.array(bins, dtype=int)
+        WelchAccumulator.__init__(self, NFFT, Fs, window=window, noverlap=noverlap, channels=channels)   # no FFT used
+        # windowed cosines then sines of the bins: one real matrix product gives real and imaginary parts
+        phase = 2 * numpy.pi * numpy.outer(numpy.arange(NFFT), self.bins) / NFFT
+        self.basis = numpy.hstack((self.window[:, None] * numpy.cos(phase), self.window[:, None] * numpy.sin(phase)))
+
+    def reset(self):
+        self.power_sum = numpy.zeros(self.leading_shape + (len(self.bins),))
+        self.nb_segments = 0
+
+    def segments_power(self, segments):
+        projections = numpy.dot(segments, self.basis) ** 2
+        return projections[..., :len(self.bins)].sum(axis=-2) + projections[..., len(self.bins):].sum(axis=-2)
+
+    def psd(self, reset=True):
+        Pxx = numpy.empty(self.leading_shape + (self.NFFT // 2 + 1,))
+        Pxx.fill(numpy.nan)
+        Pxx[..., self.bins] = self.power_sum * (self.scale / max(self.nb_segments, 1))
+        # one-sided: as WelchAccumulator.psd()
+        Pxx[..., self.bins] *= numpy.where((self.bins == 0) | ((self.NFFT % 2 == 0) & (self.bins == self.NFFT // 2)), 1, 2)
+        if reset:
+            self.reset()
+        return Pxx, self.freqs
+
+
+class FftPsd(object):
+    """psd(data, NFFT, Fs) computed by a WelchAccumulator kept from one call to the next"""
+    def __init__(self, fft = 'numpy', window = 'hanning', noverlap = 0):
+        FFT_BACKENDS[fft]()     # import the library now: ImportError if not installed
+        self.fft = fft
+        self.window = window
+        self.noverlap = noverlap
+        self.accumulator = None
+
+    def __call__(self, data, NFFT, Fs):
+        channels = len(data) if numpy.ndim(data) > 1 else 1
+        if self.accumulator is None or (self.accumulator.NFFT, self.accumulator.Fs, self.accumulator.channels) \
+                                       != (NFFT, Fs, channels):
+            self.accumulator = WelchAccumulator(NFFT, Fs, self.fft, self.window, self.noverlap, channels)
+        self.accumulator.clear()
+        self.accumulator.add(data)
+        return self.accumulator.psd()
+
+
+class ScipyWelchPsd(object):
+    """psd(data, NFFT, Fs) by scipy.signal.welch with the window and settings of matplotlib.mlab.psd"""
+    def __init__(self, window = 'hanning', noverlap = 0):
+        from scipy.signal import welch
+        self.welch = welch
+        self.window_function = WINDOWS[window]
+        self.noverlap = noverlap
+        self.window = None
+
+    def __call__(self, data, NFFT, Fs):
+        if self.window is None or len(self.window) != NFFT:
+            self.window = self.window_function(NFFT)
+        # float64 data: scipy would compute int16 samples in single precision
+        freqs, Pxx = self.welch(numpy.asarray(data, dtype=float), fs=Fs, window=self.window,
+                                noverlap=self.noverlap, detrend=False)
+        return Pxx, freqs
+
+
+def mlab_psd(window = 'hanning', noverlap = 0):
+    """matplotlib.mlab.psd, the reference implementation (one call per channel)"""
+    from matplotlib.mlab import psd
+    def mlab(data, NFFT, Fs):
+        if numpy.ndim(data) > 1:
+            spectra = [mlab(channel, NFFT, Fs) for channel in data]
+            return numpy.array([Pxx for Pxx, freqs in spectra]), spectra[0][1]
+        return psd(data, NFFT=NFFT, Fs=Fs, window=WINDOWS[window](NFFT), noverlap=noverlap)
+    return mlab
+
+
+PSD_BACKENDS = {'numpy': lambda window, noverlap: FftPsd('numpy', window, noverlap),
+                'scipy': lambda window, noverlap: FftPsd('scipy', window, noverlap),
+                'pyfftw': lambda window, noverlap: FftPsd('pyfftw', window, noverlap),
+                'welch': ScipyWelchPsd,
+                'mlab': mlab_psd,
+                }
+
+
+def psd_function(backend, window = 'hanning', noverlap = 0):
+    """Return the psd(data, NFFT, Fs) function of the registered 'backend' for the given window and overlap.
+    Raise ImportError if the backend's library is not installed."""
+    return PSD_BACKENDS[backend](window, noverlap)
+
+
+class BinReader(object):
+    """Read the signal strength of each station from a one-sided Pxx.
+    The bins of each station are calculated once from its frequency and its method:
+      - none: bin int(f * NFFT / Fs), the historical truncation
+      - nearest: the bin closest to f
+      - parabolic: the highest bin within +/- span of the closest one, its value refined by the
+                   parabola through this bin and its neighbours (in dB): corrects the scalloping loss
+      - sum: sum of the bins within +/- span of the closest one, i.e. all the power the window spread
+    With a (channels, bins) Pxx, each station is read in the row of its channel (0 by default).
+    """
+    METHODS = ('none', 'nearest', 'parabolic', 'sum')
+
+    def __init__(self, frequencies, NFFT, Fs, methods, span = 1, channels = None):
+        last_bin = NFFT // 2
+        self.methods = list(methods)
+        self.channels = list(channels) if channels is not None else [0] * len(self.methods)
+        self.station_bins = []   # for each station: the bins of Pxx it reads
+        for frequency, method in zip(frequencies, self.methods):
+            center = int(round(frequency * NFFT / float(Fs)))
+            if method == 'none':
+                bins = [int(frequency * NFFT / Fs)]
+            elif method == 'nearest':
+                bins = [center]
+            elif method == 'sum':
+                bins = range(center - span, center + span + 1)
+            else:   # parabolic: the neighbours of the candidate peaks are needed too
+                bins = range(center - span - 1, center + span + 2)
+            self.station_bins.append(numpy.clip(numpy.array(bins, dtype=int), 0, last_bin))
+        self.needed_bins = sorted(set(numpy.concatenate(self.station_bins).tolist())) if self.station_bins else []
+
+    def read(self, Pxx):
+        """Return the list of the stations' signal strengths in Pxx"""
+        if Pxx.ndim > 1:
+            return [self.read_station(Pxx[channel, bins], method)
+                    for bins, method, channel in zip(self.station_bins, self.methods, self.channels)]
+        return [self.read_station(Pxx[bins], method) for bins, method in zip(self.station_bins, self.methods)]
+
+    @staticmethod
+    def read_station(values, method):
+        if method == 'sum':
+            return values.sum()
+        if method != 'parabolic':
+            return values[0]
+        peak = values[1:-1].argmax() + 1
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            before, top, after = numpy.log(values[peak - 1:peak + 2])
+            curvature = before - 2 * top + after
+            if not numpy.isfinite(curvature) or curvature >= 0:     # flat or not a maximum: no interpolation
+                return values[peak]
+            offset = 0.5 * (before - after) / curvature
+            return numpy.exp(top - 0.25 * (before - after) * offset)
@@ -2,51 +2,124 @@
 """Class SidTimer
     Define a timer with auto-correction to ensure that data acquisition is done
     on the 'interval' and as accurately as possible.
-    The auto-correction compensates for the micro-seconds lost from one tick to the next.
+    One scheduler thread lives as long as the timer: each tick has an absolute deadline 'start_time + X * interval'
+    waited for with Event.wait() on a monotonic clock, so no error accumulates from one tick to the next
+    and stop() interrupts the wait at once.
+    A callback lasting longer than the interval is an overrun: the missed ticks are either skipped (default)
+    or performed at once to catch up, each with the data_index of its own slot.
     Implemenation examples are provided at the source's end, which can be used to test the module/class.
 """
+# 20261018:
+#   - single scheduler thread with absolute deadlines instead of a new threading.Timer per tick
+#   - no busy wait for the synchro: the first deadline is calculated
+#   - data_index from the tick's expected time (a tick a few micro-seconds early stays in its slot)
+#   - overrun policy 'skip' or 'catchup', lateness/jitter/overrun statistics in stats()
+#   - utc_slot: scheduled UTC time of the tick's slot, to date the reading whatever the tick's lateness
 from __future__ import print_function   # use the new Python 3 'print' function
+import math
 import time
-from datetime import datetime 
+from datetime import datetime, timedelta
 import threading
 
+try:
+    monotonic = time.monotonic
+except AttributeError:
+    monotonic = time.time   # Python 2: no monotonic clock
+
+SKIP, CATCHUP = 'skip', 'catchup'
+
+
 class SidTimer():
-    def __init__(self, interval, callback, delay=0):
+    def __init__(self, interval, callback, delay=0, overrun=SKIP):
         """Synchronize the timer and start the trigger mechanism.
             Public properties:
             - start_time: reference startig time.time() in local time *on the interval* (synchro)
             - expected_time: theoritical time the trigger should happen as 'start_time + X * interval'
             - time_now: real time.time() when the trigger happened
+            - utc_slot: UTC datetime of the slot 'data_index' of the tick, i.e. its scheduled time
+            - lateness, max_lateness: delay of the last trigger after its expected time, worst delay so far (sec)
+            - overruns, skipped: number of callbacks longer than the interval, number of ticks skipped because of them
         """
-        self.version = "1.3.1 20130907"
+        self.version = "1.4 20261018"
         self.callback = callback
         self.interval = interval
+        self.overrun = overrun
         self.lock = threading.Lock()
-        # wait for synchro on the next 'interval' sec
-        now = time.gmtime() 
-        while now.tm_sec % self.interval != 0:
-            time.sleep(0.05)
-            now = time.gmtime()
-        # request a Timer   
-        self.start_time = int(time.time() / self.interval) * self.interval + delay
+        self.lateness, self.max_lateness = 0.0, 0.0
+        self.ticks, self.overruns, self.skipped = 0, 0, 0
+        self.sum_lateness, self.sum_lateness2, self.max_duration = 0.0, 0.0, 0.0
+        # synchro on the next 'interval' sec: the first tick is one interval later
+        self.start_time = math.ceil(time.time() / self.interval) * self.interval + delay
         self.expected_time = self.start_time + self.interval
-        self._timer = threading.Timer(self.expected_time - time.time(), self._ontimer)
-        self._timer.start()
+        self.start()
+
+    def start(self):
+        """Start the scheduler thread"""
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="SidTimer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _wait_until(self, wall_deadline):
+        """Wait for the time.time() 'wall_deadline' on the monotonic clock. Return False if stopped meanwhile."""
+        # the deadline is converted just before waiting: a wall clock correction (NTP) is followed at the next tick
+        remaining = wall_deadline - time.time()
+        deadline = monotonic() + remaining
+        while remaining > 0:
+            if self._stop_event.wait(remaining):
+                return False
+            remaining = deadline - monotonic()
+        return not self._stop_event.is_set()
+
+    def _run(self):
+        """Scheduler thread: wait for each deadline, perform the callback, handle the overruns"""
+        while self._wait_until(self.expected_time):
+            self._ontimer()
+            # callback to perform tasks
+            self.callback()
+            self._after_callback()
 
     def _ontimer(self):
-        """Retrigger a timer for the next INTERVAL with adjustment if necessary i.e. running late/fast then perform callback"""
+        """Record the tick's timing before the callback"""
         self.time_now = time.time()
         self.utc_now = datetime.utcnow()
-        self._timer = threading.Timer(self.interval + self.expected_time - self.time_now, self._ontimer)
-        self._timer.start()
-        self.data_index = int((self.utc_now.hour * 3600 + self.utc_now.minute * 60 + self.utc_now.second) / self.interval)
+        self.lateness = self.time_now - self.expected_time
+        self.max_lateness = max(self.max_lateness, self.lateness)
+        self.ticks += 1
+        self.sum_lateness += self.lateness
+        self.sum_lateness2 += self.lateness ** 2
+        # slot of the expected time: seconds of the UTC day
+        expected_second = int(round(self.expected_time))
+        self.data_index = int((expected_second % 86400) / self.interval)
+        self.utc_slot = datetime(1970, 1, 1) + timedelta(seconds=expected_second - expected_second % 86400
+                                                         + self.data_index * self.interval)
         self.expected_time += self.interval
-        # callback to perform tasks
-        self.callback()
-        
+
+    def _after_callback(self):
+        """Detect an overrun i.e. the next deadline passed during the callback: skip the missed ticks or not"""
+        now = time.time()
+        self.max_duration = max(self.max_duration, now - self.time_now)
+        if now >= self.expected_time:
+            self.overruns += 1
+            if self.overrun != CATCHUP:     # else next deadline already passed: triggered at once
+                missed = int((now - self.expected_time) // self.interval) + 1
+                self.skipped += missed
+                self.expected_time += missed * self.interval
+
+    def stats(self):
+        """Return a dictionary of the timer's accuracy so far (seconds): ticks, mean and max lateness,
+        jitter (standard deviation of the lateness), longest callback, overruns and skipped ticks"""
+        mean = self.sum_lateness / self.ticks if self.ticks else 0.0
+        variance = self.sum_lateness2 / self.ticks - mean ** 2 if self.ticks else 0.0
+        return {'ticks': self.ticks, 'mean_lateness': mean, 'max_lateness': self.max_lateness,
+                'jitter': math.sqrt(max(variance, 0.0)), 'max_duration': self.max_duration,
+                'overruns': self.overruns, 'skipped': self.skipped}
+
     def stop(self):
-        """Cancel the timer currently running in background"""
-        self._timer.cancel()
+        """Stop the scheduler thread (at once if waiting, else after the running callback)"""
+        self._stop_event.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join(1.0)
     
     def get_utc_now(self):
         return self.utc_now.strftime("%Y-%m-%d %H:%M:%S.%f")
@@ -115,3 +188,4 @@ if __name__ == '__main__':
     tst.cancel_timer()
     print ("max positive error: ", tst.max_plus_error)
     print ("max negative error: ", tst.max_minus_error)
+    print ("timer statistics:", getattr(tst, 'sidtimer', tst).stats())
@@ -19,18 +19,17 @@ from __future__ import print_function   # use the new Python 3 'print' function
 import os.path
 import argparse
 
-# matplotlib ONLY used in Controller for its PSD function, not for any graphic
-from matplotlib.mlab import psd as mlab_psd
-
 # SuperSID Package classes
 from sidtimer import SidTimer
 from sampler import Sampler
 from config import Config
 from logger import Logger
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from qdc import Qdc
 from siddetect import Detect
+from sidevents import FlareDetector, CommandNotifier, END
+from sidpsd import WelchAccumulator, TargetedDFT, FFT_BACKENDS, psd_function
 
     # @s SuperSid() is startup class
     # Config Class is used to Parse the cfg file
@@ -46,8 +45,12 @@ class SuperSID():
     def __init__(self, config_file='', read_file=None):
         self.version = "EG 1.4 20150801"
         self.timer = None
+        self.runtime = None
         self.sampler = None
         self.viewer = None
+        self.logger = None
+        self.detect = None
+        self.last_slot = None   # UTC time of the slot of the previous reading
         
         # Read Config file here
         print(datetime.utcnow())
@@ -64,8 +67,13 @@ class SuperSID():
             print(self.config.filenames) # good for debugging: what .cfg file(s) were actually read
         self.config["supersid_version"] = self.version
 
+        # Optional asyncio runtime: ticks, capture, file writing and keyboard as coroutines of one loop
+        if self.config['runtime'] == 'asyncio':
+            from sidasync import AsyncRuntime
+            self.runtime = AsyncRuntime(self)
+
         # Create Logger - Logger will read an existing file if specified as -r|--read script argument
-        self.logger = Logger(self, read_file)
+        self.logger = Logger(self, read_file, saver=self.runtime.saver if self.runtime else None)
         if 'utc_starttime' not in self.config:
             self.config['utc_starttime'] = self.logger.sid_file.sid_params["utc_starttime"]
 
@@ -74,6 +82,13 @@ class SuperSID():
         self.qdc = Qdc(self)
         self.detect = Detect(self)
 
+        # Breaches of all the stations grouped in flare events: listeners added by add_flare_listener()
+        self.flares = FlareDetector([station['call_sign'] for station in self.config.stations],
+                                    self.detect.k, gap=self.config.get('flare_gap', 12))
+        self.add_flare_listener(self.on_flare)
+        if self.config.get('flare_command'):
+            self.add_flare_listener(CommandNotifier(self.config['flare_command'], self.config['flare_confidence']))
+
         # Create the viewer based on the .cfg specification (or set default):
         # Note: the list of Viewers can be extended provided they implement the same interface
         if self.config['viewer'] == 'wx':
@@ -98,23 +113,36 @@ class SuperSID():
             print("ERROR: Unknown viewer", self.config['viewer'])
             exit(2)
 
-        # Assign desired psd function for calculation after capture
-        # currently: using matplotlib's psd
-        if (self.config['viewer'] == 'wx' and wx_imported) or self.config['viewer'] == 'tk':
-            self.psd = self.viewer.get_psd  # calculate psd and draw result in one call
-        else:
-            self.psd = mlab_psd             # calculation only
+        # Assign desired psd function for calculation after capture: the 'psd_backend'
+        # calculation only, the viewer receives the result to display it (update_psd)
+        try:
+            self.psd = psd_function(self.config['psd_backend'], self.config['psd_window'], self.config['psd_overlap'])
+        except ImportError as err:
+            print("Warning: psd_backend '%s' not available (%s), using 'numpy'" % (self.config['psd_backend'], err))
+            self.config['psd_backend'] = 'numpy'
+            self.psd = psd_function('numpy', self.config['psd_window'], self.config['psd_overlap'])
 
         # calculate Stations' buffer_size
         self.buffer_size = int(24*60*60 / self.config['log_interval'])
 
         # Create Sampler to collect audio buffer (sound card or other server)
-        self.sampler = Sampler(self, audio_sampling_rate = self.config['audio_sampling_rate'], NFFT = 1024);
+        self.sampler = Sampler(self, audio_sampling_rate = self.config['audio_sampling_rate'], NFFT = self.config['nfft']);
         if not self.sampler.sampler_ok:
             self.close()
             exit(3)
         else:
-            self.sampler.set_monitored_frequencies(self.config.stations);
+            self.sampler.set_monitored_frequencies(self.config.stations, self.config['bin_span']);
+
+        # PSD engine: monitored frequencies only or full spectrum averaged over the whole log_interval
+        # from the continuous capture; None to use self.psd on the last second
+        self.psd_engine = None
+        if self.config['psd_engine'] == 'targeted':
+            self.psd_engine = TargetedDFT(self.sampler.NFFT, self.sampler.audio_sampling_rate, self.sampler.monitored_bins,
+                                          self.config['psd_window'], self.config['psd_overlap'], self.sampler.channels)
+        elif self.config['psd_average'] == 'interval':
+            fft = self.config['psd_backend'] if self.config['psd_backend'] in FFT_BACKENDS else 'numpy'
+            self.psd_engine = WelchAccumulator(self.sampler.NFFT, self.sampler.audio_sampling_rate, fft,
+                                               self.config['psd_window'], self.config['psd_overlap'], self.sampler.channels)
 
         # Link the logger.sid_file.data buffers to the config.stations
         for ibuffer, station  in enumerate(self.config.stations):
@@ -122,88 +150,157 @@ class SuperSID():
 
         # Create Timer
         self.viewer.status_display("Waiting for Timer ... ")
-        self.timer = SidTimer(self.config['log_interval'], self.on_timer)
+        if self.runtime:
+            self.timer = self.runtime.timer     # ticks once the runtime runs
+        else:
+            self.timer = SidTimer(self.config['log_interval'], self.on_timer, overrun=self.config['timer_overrun'])
 
 
-    def clear_all_data_buffers(self):
-        """Clear the current memory buffers and pass to the next day"""
-        self.logger.sid_file.clear_buffer(next_day = True)
+    def clear_all_data_buffers(self, utc_day=None):
+        """Pass to the next day ('utc_day' if given else today) with new cleared buffers and return the finished day's SidFile"""
+        finished_day = self.logger.sid_file.swap_buffer(utc_day)
+        # the new day has new arrays: link them again to the stations
+        for ibuffer, station  in enumerate(self.config.stations):
+            station['raw_buffer'] =  self.logger.sid_file.data[ibuffer]
+        return finished_day
 
     def on_timer(self):
         """Callback function triggered by SidTimer every 'log_interval' seconds"""
-        # current_index is the position in the buffer calculated from current UTC time
-        current_index = self.timer.data_index
-        utc_now = self.timer.utc_now
+        self.record_readings(self.read_spectrum())
 
+    def read_spectrum(self):
+        """Capture the sound, calculate its spectrum and return the signal strengths of the stations.
+        Blocking (capture and calculation): executed by the asyncio runtime in its executor"""
         # Get new data and pass them to the View
-        message = "%s  [%d]  Capturing data..." % (self.timer.get_utc_now(), current_index)
+        message = "%s  [%d]  Capturing data..." % (self.timer.get_utc_now(), self.timer.data_index)
         self.viewer.status_display(message, level=1)
         signal_strengths = []
         try:
-            data = self.sampler.capture_1sec()  # return a list of 1 second signal strength
-            Pxx, freqs = self.psd(data, self.sampler.NFFT, self.sampler.audio_sampling_rate)
+            if self.psd_engine:
+                if self.config['psd_average'] == 'interval':
+                    # all the sound captured since the previous reading: average of its segments' spectra
+                    data = self.sampler.capture_interval()
+                else:
+                    data = self.sampler.capture_1sec()
+                    self.psd_engine.clear()  # not contiguous with the previous reading's samples
+                self.psd_engine.add(data)
+                Pxx, freqs = self.psd_engine.psd()
+            else:
+                data = self.sampler.capture_1sec()  # return a list of 1 second signal strength
+                Pxx, freqs = self.psd(data, self.sampler.NFFT, self.sampler.audio_sampling_rate)
             
             self.Pxx = Pxx
             self.freqs = freqs
+            self.viewer.update_psd(Pxx, freqs)  # no drawing in this thread: the viewer only keeps the arrays
 
-            for binSample in self.sampler.monitored_bins:
-                signal_strengths.append(Pxx[binSample])
+            # each station read with its interpolation method, bins calculated once by the sampler
+            signal_strengths = self.sampler.bin_reader.read(Pxx)
         except IndexError as idxerr:
             print("Index Error:", idxerr)
             print("Data len:", len(data))
         except TypeError as err_te:
             print("Warning:", err_te)
+        return signal_strengths
+
+    def record_readings(self, signal_strengths):
+        """Store the signal strengths of the current tick in the day buffers and submit the files to write"""
+        # current_index is the position in the buffer of the tick's scheduled time, utc_slot the time of this slot:
+        # a tick a little early or late, or the skipped ticks of an overrun, do not change the hour or the day
+        current_index = self.timer.data_index
+        utc_slot = self.timer.utc_slot
 
         # ensure that one thread at the time accesses the sid_file's' buffers
         with self.timer.lock:
             # do we need to save some files (hourly) or switch to a new day?
-            if self.timer.utc_now.minute == 0 and self.timer.utc_now.second < self.config['log_interval']:
-                if self.config['hourly_save'] == 'YES':
+            # files are written by the Logger's background thread from a copy of the buffers: no disk access here
+            last_slot, self.last_slot = self.last_slot, utc_slot
+            if last_slot is not None and (last_slot.date(), last_slot.hour) != (utc_slot.date(), utc_slot.hour):
+                # not needed when the day buffer is memory-mapped: the file is always up to date
+                if self.config['hourly_save'] == 'YES' and not self.logger.sid_file.native_filename:
                     fileName = "hourly_current_buffers.raw.ext.%s.csv" % (self.logger.sid_file.sid_params['utc_starttime'][:10])
-                    self.save_current_buffers(filename=fileName, log_type='raw', log_format='supersid_extended')
+                    self.logger.saver.submit(self.save_current_buffers, filename=fileName, log_type='raw',
+                                             log_format='supersid_extended', sid_file=self.logger.sid_file.snapshot())
+                # memory-mapped day buffer: the next day's file is created and mapped during the last hour
+                if self.logger.sid_file.native_filename and utc_slot.hour == 23:
+                    self.logger.saver.submit(self.logger.sid_file.prepare_next_day, utc_slot + timedelta(hours=1))
                 # a new day!
-                if self.timer.utc_now.hour == 0:
-                    # use log_type and log_format(s) requested by the user in the .cfg
-                    for log_format in self.config['log_format'].split(','):
-                        self.save_current_buffers(log_type=self.config['log_type'], log_format=log_format)
-                    self.clear_all_data_buffers()
-
-                    #S save todays data as yesterday
-                    #self.qdc.yesterday = self.logger.sid_file.data
-                    
-                    #S calculate new qdc curve
-                    self.qdc.load_files()
+                if last_slot.date() != utc_slot.date():
+                    # the finished day's buffers are handed over as they are, new ones are given for the new day
+                    finished_day = self.clear_all_data_buffers(utc_slot)
+                    self.logger.saver.submit(self.save_finished_day, finished_day)
+                    if self.config['memmap_buffer'] == 'YES' and not self.logger.sid_file.native_filename:
+                        self.logger.saver.submit(self.map_day_buffer)   # the new day's file was not prepared in time
 
                     #S initialize limits
                     self.detect.limit_alloc()
-                    self.viewer.axes2.cla()
-                    self.viewer.refreshArgs()
+                    if hasattr(self.viewer, 'refreshArgs'):
+                        self.viewer.refreshArgs()   # day plots of the new buffers, created by the GUI thread
             
             #S save latest buffer to detect window        
-            self.detect.compute_limits(signal_strengths, current_index)
+            breaches = self.detect.compute_limits(signal_strengths, current_index)
+            if breaches is not None:
+                self.flares.update(breaches[0], breaches[1], utc_slot)
 
             # Save signal strengths into memory buffers ; prepare message for status bar
             message = self.timer.get_utc_now() + "  [%d]  " % current_index
             for station, strength in zip(self.config.stations, signal_strengths):
                 station['raw_buffer'][current_index] = strength
                 message +=  station['call_sign'] + "=%f " % strength
-            self.logger.sid_file.timestamp[current_index] = utc_now
+            if self.flares.current:
+                message += " flare since %s" % self.flares.current.onset.strftime("%H:%M:%S")
+            self.logger.sid_file.set_timestamp(current_index, utc_slot)
+            if self.logger.sid_file.native_filename:
+                self.logger.saver.submit(self.logger.sid_file.flush)
 
         # end of this thread/need to handle to View to display captured data & message
         # print(data[19800])
         self.viewer.status_display(message, level=2)
 
-    def save_current_buffers(self, filename='', log_type='raw', log_format = 'both'):
-        ''' Save buffer data from logger.sid_file
+    def add_flare_listener(self, listener):
+        """Call listener(kind, event) at the onset and at the end of each flare event (see sidevents.py),
+        from the sampling thread: the listener must return at once"""
+        self.flares.add_listener(listener)
+
+    def on_flare(self, kind, event):
+        """Log each ended flare event with the breaches"""
+        if kind == END and self.detect.breach_log:
+            self.logger.saver.submit(self.detect.breach_log.append_flare, event)
+
+    def save_finished_day(self, finished_day):
+        """Executed by the Logger's background thread at the beginning of a new day:
+        write the finished day in the format(s) requested in the .cfg then update the QDC with it"""
+        finished_day.flush()    # memory-mapped day buffer: its file complete on disk
+        # use log_type and log_format(s) requested by the user in the .cfg
+        for log_format in self.config['log_format'].split(','):
+            self.save_current_buffers(log_type=self.config['log_type'], log_format=log_format, sid_file=finished_day)
+
+        #S update the qdc curve with the finished day
+        self.qdc.add_sidfile(finished_day)
+        if hasattr(self.viewer, 'refreshArgs'):
+            self.viewer.refreshArgs()   # the day plot of the QDC is a new array
+
+    def map_day_buffer(self):
+        """Executed by the Logger's background thread when the new day's file was not prepared before midnight:
+        map the day buffer on it, keeping the readings already made"""
+        with self.timer.lock:
+            sid_file = self.logger.sid_file
+            sid_file.map_native_buffer(self.config.data_path + sid_file.get_native_filename(), keep_data = True)
+            for ibuffer, station  in enumerate(self.config.stations):
+                station['raw_buffer'] =  sid_file.data[ibuffer]
+
+    def save_current_buffers(self, filename='', log_type='raw', log_format = 'both', sid_file = None):
+        ''' Save buffer data from logger.sid_file or from the given 'sid_file' (copy of the buffers)
 
             log_type = raw or filtered
-            log_format = sid_format|sid_extended|supersid_format|supersid_extended|both|both_extended'''
+            log_format = sid_format|sid_extended|supersid_format|supersid_extended|both|both_extended|native_format'''
         filenames = []
+        if log_format.startswith('native'):
+            return self.logger.log_native_format(filename, sid_file=sid_file)
         if log_format.startswith('both') or log_format.startswith('sid'):
-            fnames = self.logger.log_sid_format(self.config.stations, '', log_type=log_type, extended=log_format.endswith('extended')) # filename is '' to ensure one file per station
+            fnames = self.logger.log_sid_format(self.config.stations, '', log_type=log_type, extended=log_format.endswith('extended'), sid_file=sid_file) # filename is '' to ensure one file per station
             filenames += fnames
         if log_format.startswith('both') or log_format.startswith('supersid'):
-            fnames = self.logger.log_supersid_format(self.config.stations, filename, log_type=log_type, extended=log_format.endswith('extended'))
+            fnames = self.logger.log_supersid_format(self.config.stations, filename, log_type=log_type, extended=log_format.endswith('extended'), sid_file=sid_file)
             filenames += fnames
         return filenames
 
@@ -213,15 +310,29 @@ class SuperSID():
     def run(self, wx_app = None):
         """Start the application as infinite loop accordingly to need"""
         self.__class__.running = True
-        self.viewer.run()
+        if self.runtime and self.config['viewer'] == 'text':
+            self.runtime.run()      # the loop in the main thread, until 'x' or CTRL-C
+        elif self.runtime:
+            self.runtime.start()    # the graphic viewers keep the main thread
+            self.viewer.run()
+        else:
+            self.viewer.run()
 
     def close(self):
         """Call all necessary stop/close functions of children objects"""
         self.__class__.running = False
+        if self.runtime:
+            self.runtime.stop()
+            self.runtime.join()
         if self.sampler:
             self.sampler.close()
         if self.timer:
             self.timer.stop()
+        if self.detect:
+            self.flares.close()
+            self.detect.close()
+        if self.logger:
+            self.logger.close()
         if self.viewer:
             self.viewer.close()
 
@@ -231,7 +342,8 @@ class SuperSID():
 which are caused by a blast of intense X-ray radiation when there is a Solar Flare on the Sun.\n\n""" + \
             "Controller: " + self.version + "\n" +  \
             "Sampler: " + self.sampler.version  + "\n"  \
-            "Timer: " + self.timer.version  + "\n"  \
+            "Timer: " + self.timer.version  + " (tick late by %.1f ms, at most %.1f ms, jitter %.3f ms, %d overruns)" \
+                % (1000 * self.timer.lateness, 1000 * self.timer.max_lateness, 1000 * self.timer.stats()['jitter'], self.timer.overruns) + "\n"  \
             "Config: " + self.config.version  + "\n"  \
             "Logger: " + self.logger.version  + "\n"  \
             "Sidfile: " + self.logger.sid_file.version  + "\n" + \
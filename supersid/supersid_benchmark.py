@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+"""
+ Name:        supersid_benchmark.py
+ Purpose:     Compare the current SuperSID implementations with their previous (reference) versions:
+              - check that results are identical (equal to 1e-9 relative for the floating point calculations)
+              - report the time taken by each version and the speedup
+              The 'leakage' benchmark measures the selectivity of each window and bin interpolation method instead:
+              power read at the other stations' frequencies and variation with the position of the carrier in its bin.
+
+ Usage:       supersid_benchmark.py [-h] [-n STATIONS] [-i LOG_INTERVAL] [-b BEMA_WING] [-p PERIOD_SIZE] [-f NFFT]
+                                     [-w WINDOW] [-o OVERLAP] [-s SPAN] [-r REPEAT] [benchmark ...]
+              without benchmark name, all benchmarks are executed
+"""
+from __future__ import print_function   # use the new Python 3 'print' function
+import argparse
+import io
+import timeit
+import tracemalloc
+from struct import unpack as st_unpack
+from datetime import datetime
+import numpy
+
+from sidfile import SidFile
+from sampler import read_periods_into, read_frames_into
+from sidpsd import TargetedDFT, PSD_BACKENDS, WINDOWS, BinReader, psd_function
+
+
+def legacy_filter_buffer(raw_buffer, data_interval, bema_wing = 6):
+    """SidFile.filter_buffer as it was before vectorization: one Python min() per sample and one station at a time"""
+    length = len(raw_buffer)
+    dstack = numpy.hstack((raw_buffer[length-bema_wing:length],
+                           raw_buffer[0:length],
+                           raw_buffer[0:bema_wing]))
+    dstack[0:bema_wing] = raw_buffer[0]
+    dstack[length+bema_wing:length+bema_wing*2] = raw_buffer[-1]
+    dmin = numpy.zeros(len(dstack))
+    for i in range(bema_wing, length+bema_wing):
+        dmin[i] = min(dstack[i-bema_wing:i+bema_wing])
+    dmin[0:bema_wing] = dmin[bema_wing]
+    dmin[length+bema_wing:length+bema_wing*2] = dmin[length+bema_wing-1]
+    # matplotlib.mlab.movavg(dmin, n) was numpy.convolve(dmin, ones(n)/n, mode='valid')
+    kernel = numpy.empty(bema_wing*2+1)
+    kernel[:] = 1.0/(bema_wing*2+1)
+    return numpy.convolve(dmin, kernel, mode='valid')
+
+
+def legacy_write_rows(fout, data, timestamps, extended, isSuperSid):
+    """Data lines of SidFile.write_data_supersid/write_data_sid as they were: one print() per line"""
+    if not isSuperSid:
+        timestamp_format = SidFile._TIMESTAMP_EXTENDED if extended else SidFile._TIMESTAMP_STANDARD
+        for t_stamp, x in zip(timestamps, data[0]):
+            print("%s, %.15f" % (t_stamp.strftime(timestamp_format), x), file=fout)
+    elif extended:
+        for t_stamp, row in zip(timestamps, numpy.transpose(data)):
+            floats_as_strings = ["%.15f" % x for x in row]
+            print( t_stamp.strftime(SidFile._TIMESTAMP_EXTENDED+","), ", ".join(floats_as_strings), file=fout)
+    else:
+        for row in numpy.transpose(data):
+            floats_as_strings = ["%.15f" % x for x in row]
+            print(", ".join(floats_as_strings), file=fout)
+
+
+def legacy_capture_alsaaudio(read, audio_sampling_rate):
+    """alsaaudio_soundcard.capture_1sec as it was: bytes grown by concatenation then unpacked to a tuple"""
+    raw_data = b''
+    while len(raw_data) < 2 * audio_sampling_rate:
+        length,data = read()
+        if length> 0: raw_data += data
+    return numpy.array(st_unpack("%ih"%audio_sampling_rate, raw_data[:2 * audio_sampling_rate]))
+
+
+def legacy_capture_pyaudio(read, audio_sampling_rate):
+    """pyaudio_soundcard.capture_1sec as it was: list extended byte by byte then unpacked to a tuple"""
+    frames = []
+    expected_number_of_bytes = 2 * audio_sampling_rate
+    while len(frames) < expected_number_of_bytes:
+        frames.extend(bytearray(read(audio_sampling_rate)))
+    return numpy.array(st_unpack("{}h".format(audio_sampling_rate), bytes(bytearray(frames[:expected_number_of_bytes]))))
+
+
+class FakeCard(object):
+    """Stand-in for the sound card APIs, serving a recorded second of noise"""
+    def __init__(self, audio_sampling_rate, period_size):
+        self.samples = numpy.random.RandomState(0).randint(-32768, 32767, audio_sampling_rate).astype('<i2')
+        self.raw = self.samples.tobytes()
+        self.period_bytes = 2 * period_size
+        self.pos = 0
+
+    def read_period(self):
+        """alsaaudio PCM.read(): (number of frames, bytes of one period)"""
+        data = self.raw[self.pos:self.pos + self.period_bytes]
+        self.pos = (self.pos + self.period_bytes) % len(self.raw)
+        return len(data) // 2, data
+
+    def read_frames(self, nb_frames):
+        """pyaudio Stream.read(nb_frames)"""
+        self.pos = 0
+        return self.raw[:2 * nb_frames]
+
+    def rec(self, frames=None, dtype='float32', out=None, blocking=False):
+        """sounddevice.rec(), into 'out' if given"""
+        if out is None:
+            out = numpy.empty((frames, 1), dtype=dtype)
+        out[:, 0] = self.samples[:len(out)]
+        return out
+
+
+def measure(capture, repeat):
+    """Return the best time and the peak of memory allocated during one call to capture()"""
+    best_time = min(timeit.repeat(capture, number=1, repeat=repeat))
+    tracemalloc.start()
+    capture()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best_time, peak
+
+
+def random_day(nb_stations, log_interval):
+    """Return a (nb_stations, samples per day) array looking like a day of signal strengths"""
+    nb_data_per_day = int((24 * 3600) / log_interval)
+    rng = numpy.random.RandomState(20150801)
+    return numpy.abs(rng.normal(loc=1.0e5, scale=2.0e4, size=(nb_stations, nb_data_per_day)))
+
+
+def report(name, legacy_time, new_time, identical):
+    print("%-24s legacy %9.4f s   new %9.4f s   speedup x%8.1f   identical: %s" %
+          (name, legacy_time, new_time, legacy_time / new_time, identical))
+    return identical
+
+
+def bench_filter(args):
+    """BEMA filter: legacy per station loop vs vectorized 2D filter_buffer"""
+    data = random_day(args.stations, args.log_interval)
+    legacy = numpy.array([legacy_filter_buffer(row, args.log_interval, args.bema_wing) for row in data])
+    new = SidFile.filter_buffer(data, args.log_interval, bema_wing = args.bema_wing)
+    identical = legacy.shape == new.shape and numpy.array_equal(legacy, new)
+    legacy_time = min(timeit.repeat(lambda: [legacy_filter_buffer(row, args.log_interval, args.bema_wing) for row in data],
+                                    number=1, repeat=args.repeat))
+    new_time = min(timeit.repeat(lambda: SidFile.filter_buffer(data, args.log_interval, bema_wing = args.bema_wing),
+                                 number=1, repeat=args.repeat))
+    return report("filter", legacy_time, new_time, identical)
+
+
+def bench_writer(args):
+    """CSV data lines: legacy one print() per line vs block formatted SidFile.write_rows, for the 4 csv formats"""
+    data = random_day(args.stations, args.log_interval)
+    # extended timestamps with some microseconds as recorded by SuperSID.on_timer
+    timestamps64 = numpy.datetime64(datetime(2015, 8, 1), 'us') + \
+                   numpy.arange(data.shape[1]) * numpy.timedelta64(args.log_interval, 's') + \
+                   numpy.random.RandomState(1).randint(0, 999999, data.shape[1]).astype('timedelta64[us]')
+    timestamps = timestamps64.astype(datetime)
+    all_identical = True
+    for name, isSuperSid, extended in (("supersid", True, False), ("supersid_ext", True, True),
+                                       ("sid", False, False), ("sid_ext", False, True)):
+        rows = data if isSuperSid else data[:1]
+        def legacy():
+            fout = io.StringIO()
+            legacy_write_rows(fout, rows, timestamps, extended, isSuperSid)
+            return fout.getvalue()
+        def new():
+            fout = io.StringIO()
+            SidFile.write_rows(fout, rows, timestamps64 if extended or not isSuperSid else None, extended)
+            return fout.getvalue()
+        identical = legacy() == new()
+        legacy_time = min(timeit.repeat(legacy, number=1, repeat=args.repeat))
+        new_time = min(timeit.repeat(new, number=1, repeat=args.repeat))
+        all_identical = report("writer " + name, legacy_time, new_time, identical) and all_identical
+    return all_identical
+
+
+def bench_capture(args):
+    """One second of capture per backend: legacy concatenations and tuples vs preallocated buffers and frombuffer"""
+    all_identical = True
+    for rate in (48000, 96000, 192000):
+        card = FakeCard(rate, args.period_size)
+        buffer = bytearray(2 * rate)
+        samples = numpy.frombuffer(buffer, dtype='<i2')
+        sd_buffer = numpy.empty((rate, 1), dtype=numpy.int16)
+        backends = (("alsaaudio", lambda: legacy_capture_alsaaudio(card.read_period, rate),
+                                  lambda: read_periods_into(buffer, card.read_period) and samples),
+                    ("pyaudio", lambda: legacy_capture_pyaudio(card.read_frames, rate),
+                                lambda: read_frames_into(buffer, card.read_frames, rate) and samples),
+                    ("sounddevice", lambda: card.rec(rate, dtype=numpy.int16)[:, 0],
+                                    lambda: card.rec(out=sd_buffer, blocking=True)[:, 0]))
+        for name, legacy, new in backends:
+            card.pos = 0
+            legacy_samples = legacy().copy()
+            card.pos = 0
+            identical = numpy.array_equal(legacy_samples, new()) and numpy.array_equal(legacy_samples, card.samples)
+            legacy_time, legacy_peak = measure(legacy, args.repeat)
+            new_time, new_peak = measure(new, args.repeat)
+            all_identical = report("capture %-11s %3dk" % (name, rate // 1000), legacy_time, new_time, identical) \
+                            and all_identical
+            print("%-24s legacy %9.1f kB allocated   new %9.1f kB allocated" %
+                  ("", legacy_peak / 1024.0, new_peak / 1024.0))
+    return all_identical
+
+
+def random_second(audio_sampling_rate):
+    """Return one second of int16 noise with a VLF like carrier at 19.8 kHz"""
+    rng = numpy.random.RandomState(20150801)
+    t = numpy.arange(audio_sampling_rate) / float(audio_sampling_rate)
+    return (rng.normal(0, 3000, audio_sampling_rate) + 8000 * numpy.sin(2 * numpy.pi * 19800 * t)).astype(numpy.int16)
+
+
+def bench_targeted(args):
+    """Signal strengths of the stations: full matplotlib.mlab.psd vs TargetedDFT of the monitored bins only"""
+    from matplotlib.mlab import psd as mlab_psd
+    all_identical = True
+    for rate in (48000, 96000, 192000):
+        data = random_second(rate)
+        # stations spread between 16 and 24 kHz as usual VLF transmitters
+        bins = [int(f * 1024 / rate) for f in numpy.linspace(16000, 24000, args.stations)]
+        engine = TargetedDFT(1024, rate, bins)
+        def new():
+            engine.clear()
+            engine.add(data)
+            return engine.psd()[0][bins]
+        legacy = lambda: mlab_psd(data, NFFT=1024, Fs=rate)[0][bins]
+        identical = numpy.allclose(legacy(), new(), rtol=1e-9, atol=0)
+        legacy_time = min(timeit.repeat(legacy, number=1, repeat=args.repeat))
+        new_time = min(timeit.repeat(new, number=1, repeat=args.repeat))
+        all_identical = report("targeted %d st %3dk" % (args.stations, rate // 1000), legacy_time, new_time, identical) \
+                        and all_identical
+    return all_identical
+
+
+def bench_psd(args):
+    """One second PSD: matplotlib.mlab.psd vs each available psd_backend, for the given NFFT, window and overlap"""
+    from matplotlib.mlab import psd as mlab_psd
+    all_identical = True
+    for rate in (48000, 96000, 192000):
+        data = random_second(rate)
+        legacy = lambda: mlab_psd(data, NFFT=args.nfft, Fs=rate, window=WINDOWS[args.window](args.nfft), noverlap=args.overlap)
+        legacy_time = min(timeit.repeat(legacy, number=1, repeat=args.repeat))
+        for backend in sorted(PSD_BACKENDS):
+            if backend == 'mlab':
+                continue
+            try:
+                psd = psd_function(backend, args.window, args.overlap)
+            except ImportError as err:
+                print("%-24s not available: %s" % ("psd %s" % backend, err))
+                continue
+            new = lambda: psd(data, args.nfft, rate)
+            identical = numpy.allclose(legacy()[0], new()[0], rtol=1e-9, atol=0) and numpy.allclose(legacy()[1], new()[1])
+            new_time = min(timeit.repeat(new, number=1, repeat=args.repeat))
+            all_identical = report("psd %-6s %5d %3dk" % (backend, args.nfft, rate // 1000), legacy_time, new_time, identical) \
+                            and all_identical
+    return all_identical
+
+
+def bench_channels(args):
+    """Two antennas on a stereo card: two mono mlab.psd (formerly two SuperSID processes) vs one batched FFT"""
+    from matplotlib.mlab import psd as mlab_psd
+    all_identical = True
+    psd = psd_function('numpy', args.window, args.overlap)
+    for rate in (48000, 96000, 192000):
+        data = numpy.array([random_second(rate), random_second(rate)[::-1]])
+        legacy = lambda: numpy.array([mlab_psd(channel, NFFT=args.nfft, Fs=rate, window=WINDOWS[args.window](args.nfft),
+                                               noverlap=args.overlap)[0] for channel in data])
+        new = lambda: psd(data, args.nfft, rate)[0]
+        identical = numpy.allclose(legacy(), new(), rtol=1e-9, atol=0)
+        legacy_time = min(timeit.repeat(legacy, number=1, repeat=args.repeat))
+        new_time = min(timeit.repeat(new, number=1, repeat=args.repeat))
+        all_identical = report("channels 2 %5d %3dk" % (args.nfft, rate // 1000), legacy_time, new_time, identical) \
+                        and all_identical
+    return all_identical
+
+
+# VLF transmitters close to each other: NWC, ICV, FTA, HWU, GQD, DHO, NAA
+LEAKAGE_STATIONS = (19800, 20270, 20900, 21750, 22100, 23400, 24000)
+
+
+def bench_leakage(args):
+    """Selectivity at 96 kHz for the given NFFT and overlap, for each window and bin interpolation method:
+    - leakage: highest power read at another station's frequency when only one station transmits (dB)
+    - scalloping: variation of the power read for a carrier moving across its bin (dB)"""
+    rate = 96000
+    t = numpy.arange(rate) / float(rate)
+    tone = lambda frequency: (8000 * numpy.sin(2 * numpy.pi * frequency * t)).astype(numpy.int16)
+    bin_width = float(rate) / args.nfft
+    # carriers from one bin center to the next: the worst case is half way
+    offsets = numpy.linspace(-0.5, 0.5, 11) * bin_width
+    center = round(LEAKAGE_STATIONS[0] / bin_width) * bin_width
+    print("%-24s resolution %.1f Hz, stations %s Hz" % ("leakage %d %3dk" % (args.nfft, rate // 1000), bin_width,
+                                                        ", ".join(str(f) for f in LEAKAGE_STATIONS)))
+    for window in sorted(WINDOWS):
+        psd = psd_function('numpy', window, args.overlap)
+        for method in BinReader.METHODS:
+            reader = BinReader(LEAKAGE_STATIONS, args.nfft, rate, [method] * len(LEAKAGE_STATIONS), args.span)
+            leakage = -numpy.inf
+            for station, frequency in enumerate(LEAKAGE_STATIONS):
+                strengths = numpy.array(reader.read(psd(tone(frequency), args.nfft, rate)[0]))
+                others = numpy.delete(strengths, station)
+                leakage = max(leakage, 10 * numpy.log10(max(others.max(), 1e-30) / strengths[station]))
+            reader = BinReader([center + offset for offset in offsets], args.nfft, rate, [method] * len(offsets), args.span)
+            own = [reader.read(psd(tone(center + offset), args.nfft, rate)[0])[i] for i, offset in enumerate(offsets)]
+            scalloping = 10 * numpy.log10(max(own) / min(own))
+            print("%-24s leakage %7.1f dB   scalloping %6.2f dB" % ("  %s %s" % (window, method), leakage, scalloping))
+    return True
+
+
+BENCHMARKS = {'capture': bench_capture,
+              'channels': bench_channels,
+              'filter': bench_filter,
+              'leakage': bench_leakage,
+              'psd': bench_psd,
+              'targeted': bench_targeted,
+              'writer': bench_writer,
+              }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--stations", dest="stations", type=int, default=5,
+                        help="Number of stations in the generated day (default=5)")
+    parser.add_argument("-i", "--log_interval", dest="log_interval", type=int, default=5,
+                        help="Log interval in seconds of the generated day (default=5)")
+    parser.add_argument("-b", "--bema_wing", dest="bema_wing", type=int, default=6,
+                        help="bema_wing used for filtering (default=6)")
+    parser.add_argument("-p", "--period_size", dest="period_size", type=int, default=128,
+                        help="alsaaudio period size, in frames, for the capture benchmark (default=128)")
+    parser.add_argument("-f", "--nfft", dest="nfft", type=int, default=1024,
+                        help="NFFT for the psd, channels and leakage benchmarks (default=1024)")
+    parser.add_argument("-w", "--window", dest="window", choices=sorted(WINDOWS), default='hanning',
+                        help="Window for the psd and channels benchmarks (default=hanning)")
+    parser.add_argument("-o", "--overlap", dest="overlap", type=int, default=0,
+                        help="Overlap in samples for the psd, channels and leakage benchmarks (default=0)")
+    parser.add_argument("-s", "--span", dest="span", type=int, default=1,
+                        help="bin_span for the leakage benchmark (default=1)")
+    parser.add_argument("-r", "--repeat", dest="repeat", type=int, default=3,
+                        help="Number of timed runs, the best one is reported (default=3)")
+    parser.add_argument("benchmarks", nargs="*",
+                        help="Benchmark(s) to run among %s (default: all)" % ", ".join(sorted(BENCHMARKS)))
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark '%s'" % name)
+    all_identical = True
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        all_identical = BENCHMARKS[name](args) and all_identical
+    exit(0 if all_identical else 1)
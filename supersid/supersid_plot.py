@@ -37,6 +37,7 @@ from email import encoders, utils
 import argparse
 # SuperSID modules
 from sidfile import SidFile
+from sidcache import SidCache
 from config import Config
 
 def sendMail(config, To_mail, msgBody, PDFfile):
@@ -141,9 +142,10 @@ class SUPERSID_PLOT():
         colorIdx = 0
 
         time.clock()
+        cache = SidCache(config = config if isinstance(config, Config) else None)  # each file is parsed only once
         for filename in sorted(filenames):
             figTitle.append(os.path.basename(filename)[:-4]) # extension .csv assumed
-            sFile = SidFile(filename)
+            sFile = cache.load(filename)
             for station in sFile.stations:
                 # Does this station already have a color? if not, reserve one
                 if station not in colorStation:
@@ -11,14 +11,13 @@
 """
 from __future__ import print_function   # use the new Python 3 'print' function
 import os.path
-# matplotlib ONLY used in Controller for its PSD function, not for any graphic
-from matplotlib.mlab import psd as mlab_psd
 from time import sleep
 import argparse
 
 # SuperSID Package classes
 from sidtimer import SidTimer
 from sampler import Sampler
+from sidpsd import psd_function
 from config import Config
 from logger import Logger
 from textsidviewer import textSidViewer
@@ -68,18 +67,18 @@ class SuperSID_scanner():
         # Note: the list of Viewers can be extended provided they implement the same interface
         self.config['viewer'] = 'text'   # Lighter text version a.k.a. "console mode"
         self.viewer = textSidViewer(self)
-        self.psd = mlab_psd             # calculation only
+        self.psd = psd_function(self.config['psd_backend'], self.config['psd_window'], self.config['psd_overlap'])   # calculation only
 
         # calculate Stations' buffer_size
         self.buffer_size = int(24*60*60 / self.config['log_interval'])
 
         # Create Sampler to collect audio buffer (sound card or other server)
-        self.sampler = Sampler(self, audio_sampling_rate = self.config['audio_sampling_rate'], NFFT = 1024)
+        self.sampler = Sampler(self, audio_sampling_rate = self.config['audio_sampling_rate'], NFFT = self.config['nfft'])
         if not self.sampler.sampler_ok:
             self.close()
             exit(3)
         else:
-            self.sampler.set_monitored_frequencies(self.config.stations)
+            self.sampler.set_monitored_frequencies(self.config.stations, self.config['bin_span'])
 
         # Link the logger.sid_file.data buffers to the config.stations
         for ibuffer, station  in enumerate(self.config.stations):
@@ -99,7 +98,7 @@ class SuperSID_scanner():
         """Callback function triggered by SidTimer every 'log_interval' seconds"""
         # current_index is the position in the buffer calculated from current UTC time
         current_index = self.timer.data_index
-        utc_now = self.timer.utc_now
+        utc_slot = self.timer.utc_slot
         # clear the View to prepare for new data display
         self.viewer.clear()
         
@@ -115,9 +114,7 @@ class SuperSID_scanner():
             print("Index Error:", idxerr)
             print("Data len:", len(data))
 
-        signal_strengths = []
-        for binSample in self.sampler.monitored_bins:
-            signal_strengths.append(Pxx[binSample])
+        signal_strengths = self.sampler.bin_reader.read(Pxx)
 
         # ensure that one thread at the time accesses the sid_file's' buffers
         with self.timer.lock:
@@ -126,7 +123,7 @@ class SuperSID_scanner():
             message += "%d" % (self.scan_end_time - self.timer.time_now)
             for station, strength in zip(self.config.stations, signal_strengths):
                 station['raw_buffer'][current_index] = strength
-            self.logger.sid_file.timestamp[current_index] = utc_now
+            self.logger.sid_file.set_timestamp(current_index, utc_slot)
 
             # did we complete the expected scanning duration?
             if self.timer.time_now >= self.scan_end_time:
@@ -223,7 +220,7 @@ if __name__ == '__main__':
         wf.setnchannels(1)
         wf.setsampwidth(card.pa_lib.get_sample_size(card.FORMAT))
         wf.setframerate(RATE)
-        wf.writeframes(b''.join(frames))
+        wf.writeframes(frames)
         wf.close()
 
 
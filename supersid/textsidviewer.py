@@ -8,6 +8,7 @@ Each Viewer must implement:
 - run(): main loop to get user input
 - close(): cleaning up
 - status_display(): display a message in a status bar or equivalent
+- update_psd(): receive the spectrum calculated by the controller
 
 """
 from __future__ import print_function   # use the new Python 3 'print' function
@@ -26,8 +27,11 @@ class textSidViewer:
         self.getch = _Getch()
         self.MAXLINE = 70
         self.print_menu()
-        self.timer = Timer(0.5, self.check_keyboard)
-        self.timer.start()
+        self.timer = None
+        # the asyncio runtime reads the keyboard itself with read_key()
+        if controller.config.get('runtime') != 'asyncio':
+            self.timer = Timer(0.5, self.check_keyboard)
+            self.timer.start()
 
     def run(self):
         """main loop waiting for keyboard interrupt i.e. do nothing until user press 'X' or CTRL-C"""
@@ -42,8 +46,12 @@ class textSidViewer:
         print (("\r" + msg + " "*self.MAXLINE)[:self.MAXLINE],  end='')
         sys.stdout.flush()
 
+    def update_psd(self, Pxx, freqs):
+        pass    # no spectrum display in text mode
+
     def close(self):
-        self.timer.cancel()
+        if self.timer:
+            self.timer.cancel()
 
     def print_menu(self):
         print ("\n" + "-" * self.MAXLINE)
@@ -61,6 +69,14 @@ class textSidViewer:
         print ("-" * self.MAXLINE)
 
     def check_keyboard(self):
+        s = self.read_key()
+        # call myself again in half a second to check if a new key has been pressed
+        if s != 'x':
+            self.timer = Timer(0.5, self.check_keyboard)
+            self.timer.start()
+
+    def read_key(self):
+        """Wait for a key, perform its command and return it"""
         s = self.getch().lower()
         if s == 'x':
             self.controller.close()
@@ -85,8 +101,5 @@ class textSidViewer:
                 print("Warning: cannot get all modules' versions")
         else:
             sys.stdout.write('\a')  # terminal bell
-        # call myself again in half a second to check if a new key has been pressed
-        if s != 'x':
-            self.timer = Timer(0.5, self.check_keyboard)
-            self.timer.start()
+        return s
 
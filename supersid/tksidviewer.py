@@ -3,11 +3,13 @@ tkSidViewer class implements a graphical user interface for SID based on tkinter
 """
 # created on 20150421
 # first official release 20150801
+# 20261018: the spectrum is calculated by the controller, drawn by a PsdPlotter (blitting, frame rate cap)
 from __future__ import print_function
 import matplotlib
 # matplotlib.use('TkAgg')
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg as FigureCanvas, NavigationToolbar2TkAgg
 from matplotlib.figure import Figure
+from psdplot import PsdPlotter
 
 # handle both Python 2 and 3
 try:# python 3
@@ -69,6 +71,9 @@ class tkSidViewer():
 
         self.axes = self.psd_figure.add_subplot(111)
         self.axes.hold(False)
+        max_fps = self.controller.config['gui_max_fps']
+        self.psd_plotter = PsdPlotter(self.canvas, self.axes, max_fps, ylim=[25,75])
+        self.refresh_period = int(1000 / max_fps) if max_fps > 0 else 100  # ms
 
 
         # StatusBar
@@ -80,7 +85,6 @@ class tkSidViewer():
         self.label.pack(fill=tk.X)
 
     def run(self):
-        self.need_refresh = False
         self.refresh_psd() # start the re-draw loop
         self.tk_root.mainloop()
 
@@ -93,27 +97,17 @@ class tkSidViewer():
         #print(message)
         self.statusbar_txt.set(message)
 
-    def get_psd(self, data, NFFT, FS):
-        """By calling 'psd' within axes, it both calculates and plots the spectrum"""
-        try:
-            Pxx, freqs = self.axes.psd(data, NFFT = NFFT, Fs = FS)
-            self.need_refresh = True
-        except RuntimeError as err_re:
-            print("Warning:", err_re)
-            Pxx, freqs = None, None
-        return Pxx, freqs
+    def update_psd(self, Pxx, freqs):
+        """Receive the spectrum calculated by the controller (timer thread): drawn by the next refresh_psd"""
+        self.psd_plotter.update(Pxx, freqs)
 
     def refresh_psd(self, z=None):
-        """redraw the graphic PSD plot if needed i.e.new data have been given to get_psd"""
-        if self.need_refresh:
-            try:
-                axes = self.psd_figure.gca()
-                axes.set_ylim([25,75])
-                self.canvas.draw()
-                self.need_refresh = False
-            except IndexError as err_idx:
-                print("Warning:", err_idx)
-        self.tk_root.after(2000, self.refresh_psd)
+        """redraw the graphic PSD plot if needed i.e.new data have been given to update_psd"""
+        try:
+            self.psd_plotter.refresh()
+        except IndexError as err_idx:
+            print("Warning:", err_idx)
+        self.tk_root.after(self.refresh_period, self.refresh_psd)
 
     def save_file(self, param=None):
         """Save the files as per user's menu choice"""
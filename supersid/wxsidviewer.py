@@ -8,6 +8,7 @@ Each Viewer must implement:
 - run(): main loop to get user input
 - close(): cleaning up
 - status_display(): display a message in a status bar or equivalent
+- update_psd(): receive the spectrum calculated by the controller
 ## wxviewer notebook
 wx.__version__ 2.8.12
 pub.version 1.1.2009
@@ -31,6 +32,7 @@ import os
 
 
 import supersid_plot as SSP
+from psdplot import PsdPlotter
 from config import FILTERED, RAW, CALL_SIGN, FREQUENCY #A added CALL_SIGN and FREQUENCY
 
 class wxSidViewer(wx.Frame):
@@ -171,6 +173,10 @@ class wxSidViewer(wx.Frame):
         psd_sizer.Add(self.canvas, 1, wx.EXPAND)       
         self.axes = psd_figure.add_subplot(111)
         self.axes.hold(False)        
+        max_fps = self.controller.config['gui_max_fps']
+        self.psd_plotter = PsdPlotter(self.canvas, self.axes, max_fps)
+        # marker of the selected station's frequency, part of the spectrum's background
+        self.station_line = self.axes.axvline(float(self.controller.logger.sid_file.frequencies[0]), color='r', linewidth=1)
         
         ## FigureCanvas for RealTime SID page
         rtsid_figure = Figure(facecolor='beige')
@@ -193,6 +199,14 @@ class wxSidViewer(wx.Frame):
         # create a pubsub receiver for refresh after data capture / ref. link on threads
         Publisher.subscribe(self.updateDisplay, 'Update')
 
+        # the plots are redrawn by this timer, at most 'gui_max_fps' times per second
+        self.refresh_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_refresh, self.refresh_timer)
+        self.refresh_timer.Start(int(1000 / max_fps) if max_fps > 0 else 100)
+
+        self.need_rebuild = True    # the list of day plots changed: create their lines again
+        self.need_redraw = False    # new reading: update the day plots' lines
+        self.day_lines = []
         self.pltargs = []
         self.dparams = self.controller.detect
         self.qparams = self.controller.qdc
@@ -203,9 +217,10 @@ class wxSidViewer(wx.Frame):
     
     def OnCombo(self,event):
         """ A happens when a station is selected """
-
+        frequency = float(self.params.frequencies[self.combobox.GetSelection()])
+        self.station_line.set_xdata([frequency, frequency])
+        self.canvas.draw_idle()
         self.onChecked(event)
-        self.canvasDraw()
 
     def run(self):
         """Main loop for the application"""
@@ -213,20 +228,27 @@ class wxSidViewer(wx.Frame):
         
     def updateDisplay(self, msg):
         """
-        Receives data from thread and updates the display (graph and statusbar)
+        Receives data from thread and updates the display (statusbar; the graph at the next refresh)
         """
         try:
-            self.canvasDraw()
+            self.need_redraw = True
             #Status Bar
             self.status_display(msg.data)            
         except:
             pass
 
+    def on_refresh(self, event):
+        """Timer event: blit the latest spectrum and redraw the day plots if a reading was made"""
+        self.psd_plotter.refresh()
+        if self.need_redraw or self.need_rebuild:
+            self.canvasDraw()
+
     def onChecked(self, event):
         self.refreshArgs()
         self.canvasDraw()
 
     def refreshArgs(self):
+        """Build the list of day plots to draw: no drawing here (may be called by the controller's thread)"""
         self.pltargs = []
         select = self.combobox.GetSelection()        
         #show realtime
@@ -242,26 +264,31 @@ class wxSidViewer(wx.Frame):
             self.pltargs += [self.params.timestamp,self.dparams.dnlimit[select], 'm']
         if self.cb4.IsChecked():
             self.pltargs += [self.params.timestamp,self.dparams.breach[select], 'rx']
+        self.need_rebuild = True
 
     def canvasDraw(self):
-         
-        select = self.combobox.GetSelection()        
-        self.axes2.cla()                     
-        self.axes2.plot(*self.pltargs)
-
-        self.axes2.hold(True)
-        self.axes2.grid(b=True)
-        self.axes2.set_xlabel("UTC Time")
-        self.axes2.set_ylabel("Relative Strength")
-        self.axes2.ticklabel_format(style='sci',axis='y', scilimits=(0, 0))
-        self.axes2.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M"))
-        self.axes2.xaxis.set_minor_formatter(mdates.DateFormatter("%H:%M"))
+        """Draw the day plots: create their lines when the list changed else only give them the new data"""
+        if self.need_rebuild:
+            self.need_rebuild = False
+            self.axes2.cla()                     
+            self.day_lines = self.axes2.plot(*self.pltargs)
+
+            self.axes2.hold(True)
+            self.axes2.grid(b=True)
+            self.axes2.set_xlabel("UTC Time")
+            self.axes2.set_ylabel("Relative Strength")
+            self.axes2.ticklabel_format(style='sci',axis='y', scilimits=(0, 0))
+            self.axes2.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M"))
+            self.axes2.xaxis.set_minor_formatter(mdates.DateFormatter("%H:%M"))
+        else:
+            # same arrays, updated in place by the controller: only invalidate the lines' cached data
+            for line, x, y in zip(self.day_lines, self.pltargs[0::3], self.pltargs[1::3]):
+                line.set_data(x, y)
+            self.axes2.relim()
+            self.axes2.autoscale_view()
+        self.need_redraw = False
 
         self.canvas2.draw()            
-          
-        #Psd Graph
-        self.axes.axvline(self.params.frequencies[select],color='r',linewidth=1)
-        self.canvas.draw()
         
 
     def get_axes(self):
@@ -283,6 +310,7 @@ class wxSidViewer(wx.Frame):
     def close(self):
         """Requested to close by the controller"""
         #self.app.Exit()   ##A ~ commented because 'App' object has no attribute 'Exit'
+        self.refresh_timer.Stop()
         self.Destroy()
 
     def on_exit(self, event):
@@ -292,6 +320,7 @@ class wxSidViewer(wx.Frame):
                                wx.YES_NO | wx.NO_DEFAULT | wx.ICON_QUESTION)
         if dlg.ShowModal() == wx.ID_YES:
             #self.Close(True)   ##A 
+            self.refresh_timer.Stop()
             self.Destroy()      ##A
 
     def on_plot(self, event):
@@ -351,14 +380,9 @@ class wxSidViewer(wx.Frame):
         else:
             return 0
         
-    def get_psd(self, data, NFFT, FS):
-        """By calling 'psd' within axes, it both calculates and plots the spectrum"""
-        try:
-            Pxx, freqs = self.axes.psd(data, NFFT = NFFT, Fs = FS)
-            
-        except wx.PyDeadObjectError:
-            exit(3)
-        return Pxx, freqs
+    def update_psd(self, Pxx, freqs):
+        """Receive the spectrum calculated by the controller (timer thread): drawn by the next on_refresh"""
+        self.psd_plotter.update(Pxx, freqs)
 
     def on_qdc(self, event):
        """Select files and call QDC to create Quiet Day curve"""